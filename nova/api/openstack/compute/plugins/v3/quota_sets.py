@@ -188,6 +188,7 @@ class QuotaSetsController(wsgi.Controller):
                                 user_id=user_id)
             except exception.AdminRequired:
                 raise webob.exc.HTTPForbidden()
+        QUOTAS.invalidate_limits(project_id)
         return self._format_quota_set(id, self._get_quotas(context, id,
                                                            user_id=user_id))
 
@@ -650,7 +650,11 @@ class VmCommands(object):
                                              _('index'))))
 
         if host is None:
-            instances = db.instance_get_all(context.get_admin_context())
+            # Read instances a chunk at a time rather than all at once.
+            instances = db.instance_get_all_by_filters_iter(
+                           context.get_admin_context(),
+                           {'deleted': False, 'soft_deleted': True},
+                           'created_at', 'asc')
         else:
             instances = db.instance_get_all_by_host(
                            context.get_admin_context(), host)
@@ -28,6 +28,7 @@ terminating it.
 import base64
 import contextlib
 import functools
+import heapq
 import socket
 import sys
 import time
@@ -110,6 +111,11 @@ compute_opts = [
                 default=False,
                 help="Generate periodic compute.instance.exists"
                      " notifications"),
+    cfg.IntOpt('instance_usage_audit_batch_size',
+               default=50,
+               help='Maximum number of instances whose usage notifications '
+                    'are sent to the conductor in one request during the '
+                    'instance usage audit'),
     cfg.IntOpt('live_migration_retry_count',
                default=30,
                help="Number of 1 second retries needed in live_migration"),
@@ -135,6 +141,10 @@ interval_opts = [
                default=60,
                help="Number of seconds between instance info_cache self "
                     "healing updates"),
+    cfg.IntOpt("heal_instance_info_cache_batch_size",
+               default=10,
+               help="Maximum number of instances whose info_cache is healed "
+                    "on each update"),
     cfg.IntOpt('reclaim_instance_interval',
                default=0,
                help='Interval in seconds for reclaiming deleted instances'),
@@ -417,6 +427,32 @@ def aggregate_object_compat(function):
     return decorated_function
 
 
+# Power states which need no action for a given vm_state, see
+# ComputeManager._sync_instance_power_state(). vm_states missing here
+# accept any power state.
+_SYNCED_POWER_STATES = {
+    vm_states.ACTIVE: (power_state.RUNNING,),
+    vm_states.STOPPED: (power_state.NOSTATE,
+                        power_state.SHUTDOWN,
+                        power_state.CRASHED),
+    vm_states.PAUSED: tuple(state for state in power_state.STATE_MAP
+                            if state not in (power_state.SHUTDOWN,
+                                             power_state.CRASHED)),
+    vm_states.SOFT_DELETED: (power_state.NOSTATE,
+                             power_state.SHUTDOWN),
+    vm_states.DELETED: (power_state.NOSTATE,
+                        power_state.SHUTDOWN),
+}
+
+
+def _power_state_in_sync(instance, vm_power_state):
+    """Return True if the instance record needs no power state sync."""
+    if instance['power_state'] != vm_power_state:
+        return False
+    synced = _SYNCED_POWER_STATES.get(instance['vm_state'])
+    return synced is None or vm_power_state in synced
+
+
 def _get_image_meta(context, image_ref):
     image_service, image_id = glance.get_remote_image_service(context,
                                                               image_ref)
@@ -593,6 +629,11 @@ class ComputeManager(manager.Manager):
         self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
         self._resource_tracker_dict = {}
         self.instance_events = InstanceEvents()
+        # { instance_uuid : time of its last info_cache healing }
+        self._instance_heal_times = {}
+        self._instances_to_heal_first = set()
+        # Instances of this host not healed yet in the current round
+        self._instance_uuids_to_heal = []
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -624,13 +665,26 @@ class ComputeManager(manager.Manager):
         instance_ref = self.conductor_api.instance_update(context,
                                                           instance_uuid,
                                                           **kwargs)
-        if (instance_ref['host'] == self.host and
-                self.driver.node_is_available(instance_ref['node'])):
-            rt = self._get_resource_tracker(instance_ref.get('node'))
-            rt.update_usage(context, instance_ref)
+        self._update_resource_tracker(context, instance_ref)
 
         return instance_ref
 
+    def _update_resource_tracker(self, context, instance):
+        """Let the resource tracker know about a change in an instance."""
+        if (instance['host'] == self.host and
+                self.driver.node_is_available(instance['node'])):
+            rt = self._get_resource_tracker(instance.get('node'))
+            rt.update_usage(context, instance)
+
+    def _request_resource_audit(self, nodename):
+        """Have the resource tracker of a node audit it on its next update.
+
+        Live migrations, evacuations and shelve offloads move or free the
+        resources of an instance without going through the tracker.
+        """
+        if nodename and self.driver.node_is_available(nodename):
+            self._get_resource_tracker(nodename).request_audit()
+
     def _set_instance_error_state(self, context, instance_uuid):
         try:
             self._instance_update(context, instance_uuid,
@@ -2240,6 +2294,7 @@ class ComputeManager(manager.Manager):
             instance.task_state = None
             instance.terminated_at = timeutils.utcnow()
             instance.save()
+            self._update_resource_tracker(context, instance)
             system_meta = utils.instance_sys_meta(instance)
             db_inst = self.conductor_api.instance_destroy(
                 context, obj_base.obj_to_primitive(instance))
@@ -2496,6 +2551,7 @@ class ComputeManager(manager.Manager):
                     instance.host = self.host
                     instance.node = node_name
                     instance.save()
+                self._request_resource_audit(node_name)
 
             if image_ref:
                 image_meta = _get_image_meta(context, image_ref)
@@ -3149,6 +3205,8 @@ class ComputeManager(manager.Manager):
 
             rt = self._get_resource_tracker(migration.source_node)
             rt.drop_resize_claim(instance, prefix='old_')
+            # The instance itself is still tracked on the source node.
+            rt.request_audit()
 
             # NOTE(mriedem): The old_vm_state could be STOPPED but the user
             # might have manually powered up the instance to confirm the
@@ -3225,6 +3283,7 @@ class ComputeManager(manager.Manager):
 
             rt = self._get_resource_tracker(instance.node)
             rt.drop_resize_claim(instance)
+            rt.request_audit()
 
             self.compute_rpcapi.finish_revert_resize(context, instance,
                     migration, migration.source_compute,
@@ -3847,6 +3906,7 @@ class ComputeManager(manager.Manager):
         self.driver.destroy(context, instance, network_info,
                 block_device_info)
 
+        node = instance.node
         instance.power_state = current_power_state
         instance.host = None
         instance.node = None
@@ -3854,6 +3914,7 @@ class ComputeManager(manager.Manager):
         instance.task_state = None
         instance.save(expected_task_state=[task_states.SHELVING,
                                            task_states.SHELVING_OFFLOADING])
+        self._request_resource_audit(node)
         self._notify_about_instance_usage(context, instance,
                 'shelve_offload.end')
 
@@ -4661,6 +4722,7 @@ class ComputeManager(manager.Manager):
         self.network_api.setup_networks_on_host(ctxt, instance,
                                                 self.host, teardown=True)
         self.instance_events.clear_events_for_instance(instance)
+        self._request_resource_audit(instance['node'])
 
         self._notify_about_instance_usage(ctxt, instance,
                                           "live_migration._post.end",
@@ -4732,6 +4794,7 @@ class ComputeManager(manager.Manager):
             instance.task_state = None
             instance.node = node_name
             instance.save(expected_task_state=task_states.MIGRATING)
+        self._request_resource_audit(node_name)
 
         # NOTE(vish): this is necessary to update dhcp
         self.network_api.setup_networks_on_host(context, instance, self.host)
@@ -4820,91 +4883,102 @@ class ComputeManager(manager.Manager):
     @periodic_task.periodic_task(
         spacing=CONF.heal_instance_info_cache_interval)
     def _heal_instance_info_cache(self, context):
-        """Called periodically.  On every call, try to update the
-        info_cache's network information for another instance by
-        calling to the network manager.
-
-        This is implemented by keeping a cache of uuids of instances
-        that live on this host.  On each call, we pop one off of a
-        list, pull the DB record, and try the call to the network API.
-        If anything errors don't fail, as it's possible the instance
-        has been deleted, etc.
+        """Called periodically.  On every call, update the info_cache's
+        network information of up to heal_instance_info_cache_batch_size
+        instances with a single call to the network API.
+
+        The instances of this host are listed once per round, and each
+        of them is updated once in a round.  Instances which saw a network
+        event since their last update come first, then the ones updated
+        the longest time ago.  If anything errors don't fail, as it's
+        possible an instance has been deleted, etc.
         """
         heal_interval = CONF.heal_instance_info_cache_interval
         if not heal_interval:
             return
 
-        instance_uuids = getattr(self, '_instance_uuids_to_heal', [])
-        instance = None
-
         LOG.debug(_('Starting heal instance info cache'))
 
-        if not instance_uuids:
+        if not self._instance_uuids_to_heal:
             # The list of instances to heal is empty so rebuild it
             LOG.debug(_('Rebuilding the list of instances to heal'))
             db_instances = instance_obj.InstanceList.get_by_host(
                 context, self.host, expected_attrs=[], use_slave=True)
+            host_uuids = set()
             for inst in db_instances:
-                # We don't want to refersh the cache for instances
-                # which are building or deleting so don't put them
-                # in the list. If they are building they will get
-                # added to the list next time we build it.
-                if (inst.vm_state == vm_states.BUILDING):
+                host_uuids.add(inst.uuid)
+                # We don't want to refresh the cache for instances
+                # which are building or deleting. If they are building
+                # they will get added to the list next time we build it.
+                if inst.vm_state == vm_states.BUILDING:
                     LOG.debug(_('Skipping network cache update for instance '
                                 'because it is Building.'), instance=inst)
                     continue
-                if (inst.task_state == task_states.DELETING):
+                if inst.task_state == task_states.DELETING:
                     LOG.debug(_('Skipping network cache update for instance '
                                 'because it is being deleted.'), instance=inst)
                     continue
-
-                if not instance:
-                    # Save the first one we find so we don't
-                    # have to get it again
-                    instance = inst
-                else:
-                    instance_uuids.append(inst['uuid'])
-
-            self._instance_uuids_to_heal = instance_uuids
-        else:
-            # Find the next valid instance on the list
-            while instance_uuids:
-                try:
-                    inst = instance_obj.Instance.get_by_uuid(
-                            context, instance_uuids.pop(0),
-                            expected_attrs=['system_metadata'],
-                            use_slave=True)
-                except exception.InstanceNotFound:
-                    # Instance is gone.  Try to grab another.
-                    continue
-
-                # Check the instance hasn't been migrated
-                if inst.host != self.host:
-                    LOG.debug(_('Skipping network cache update for instance '
-                                'because it has been migrated to another '
-                                'host.'), instance=inst)
-                # Check the instance isn't being deleting
-                elif inst.task_state == task_states.DELETING:
-                    LOG.debug(_('Skipping network cache update for instance '
-                                'because it is being deleted.'), instance=inst)
-                else:
-                    instance = inst
-                    break
-
-        if instance:
-            # We have an instance now to refresh
-            try:
-                # Call to network API to get instance info.. this will
-                # force an update to the instance's info_cache
-                self._get_instance_nw_info(context, instance, use_slave=True)
-                LOG.debug(_('Updated the network info_cache for instance'),
-                          instance=instance)
-            except Exception:
-                LOG.error(_('An error occurred while refreshing the network '
-                            'cache.'), instance=instance, exc_info=True)
-        else:
+                self._instance_uuids_to_heal.append(inst.uuid)
+
+            # Forget the instances which left this host
+            for instance_uuid in self._instance_heal_times.keys():
+                if instance_uuid not in host_uuids:
+                    del self._instance_heal_times[instance_uuid]
+            self._instances_to_heal_first &= host_uuids
+
+        candidates = self._instance_uuids_to_heal + [
+            instance_uuid for instance_uuid in self._instances_to_heal_first
+            if instance_uuid not in self._instance_uuids_to_heal]
+        instance_uuids = heapq.nsmallest(
+            CONF.heal_instance_info_cache_batch_size, candidates,
+            key=self._heal_priority)
+        if not instance_uuids:
             LOG.debug(_("Didn't find any instances for network info cache "
                         "update."))
+            return
+        self._instance_uuids_to_heal = [
+            instance_uuid for instance_uuid in self._instance_uuids_to_heal
+            if instance_uuid not in instance_uuids]
+
+        instances = instance_obj.InstanceList.get_by_filters(
+            context, {'uuid': instance_uuids, 'host': self.host,
+                      'deleted': False},
+            expected_attrs=['system_metadata', 'info_cache'],
+            use_slave=True)
+        # The instances missing from the list were deleted or migrated
+        # since the round started.
+        found_uuids = set()
+        to_heal = []
+        for inst in instances:
+            found_uuids.add(inst.uuid)
+            if inst.task_state == task_states.DELETING:
+                LOG.debug(_('Skipping network cache update for instance '
+                            'because it is being deleted.'), instance=inst)
+                continue
+            to_heal.append(inst)
+        try:
+            # Call to network API to get the instances info.. this will
+            # force an update to their info_cache
+            updated = self.network_api.get_instances_nw_info(
+                context, to_heal, use_slave=True)
+            LOG.debug(_('Updated the network info_cache for %d instances'),
+                      len(updated))
+        except Exception:
+            LOG.error(_('An error occurred while refreshing the network '
+                        'cache.'), exc_info=True)
+
+        now = time.time()
+        for instance_uuid in instance_uuids:
+            self._instances_to_heal_first.discard(instance_uuid)
+            if instance_uuid in found_uuids:
+                self._instance_heal_times[instance_uuid] = now
+            else:
+                self._instance_heal_times.pop(instance_uuid, None)
+
+    def _heal_priority(self, instance_uuid):
+        """Sort key putting the instances most in need of healing first."""
+        return (instance_uuid not in self._instances_to_heal_first,
+                self._instance_heal_times.get(instance_uuid, 0))
 
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
@@ -5061,28 +5135,43 @@ class ComputeManager(manager.Manager):
                                       self.conductor_api,
                                       begin, end,
                                       self.host, num_instances)
-        for instance in instances:
-            try:
-                self.conductor_api.notify_usage_exists(
-                    context, instance,
-                    ignore_missing_network_data=False)
-                successes += 1
-            except Exception:
-                LOG.exception(_('Failed to generate usage '
-                                'audit for instance '
-                                'on host %s') % self.host,
-                              instance=instance)
-                errors += 1
-        compute_utils.finish_instance_usage_audit(context,
-                                      self.conductor_api,
-                                      begin, end,
-                                      self.host, errors,
-                                      "Instance usage audit ran "
-                                      "for host %s, %s instances "
-                                      "in %s seconds." % (
-                                      self.host,
-                                      num_instances,
-                                      time.time() - start_time))
+        batch_size = max(CONF.instance_usage_audit_batch_size, 1)
+        try:
+            for offset in range(0, num_instances, batch_size):
+                chunk = instances[offset:offset + batch_size]
+                calls = [('notify_usage_exists', (instance,),
+                          {'ignore_missing_network_data': False})
+                         for instance in chunk]
+                try:
+                    results = self.conductor_api.batch(context, calls,
+                                                       stop_on_error=False)
+                except Exception:
+                    LOG.exception(_('Failed to generate usage audit for '
+                                    '%(count)d instances on host '
+                                    '%(host)s'),
+                                  {'count': len(chunk), 'host': self.host})
+                    errors += len(chunk)
+                    continue
+                for instance, (result, error) in zip(chunk, results):
+                    if error is None:
+                        successes += 1
+                    else:
+                        LOG.error(_('Failed to generate usage audit for '
+                                    'instance on host %(host)s: %(error)s'),
+                                  {'host': self.host, 'error': error},
+                                  instance=instance)
+                        errors += 1
+        finally:
+            compute_utils.finish_instance_usage_audit(context,
+                                          self.conductor_api,
+                                          begin, end,
+                                          self.host, errors,
+                                          "Instance usage audit ran "
+                                          "for host %s, %s instances "
+                                          "in %s seconds." % (
+                                          self.host,
+                                          num_instances,
+                                          time.time() - start_time))
 
     @periodic_task.periodic_task(spacing=CONF.bandwidth_poll_interval)
     def _poll_bandwidth_usage(self, context):
@@ -5122,58 +5211,13 @@ class ComputeManager(manager.Manager):
                 self._bw_usage_supported = False
                 return
 
-            refreshed = timeutils.utcnow()
-            for bw_ctr in bw_counters:
-                # Allow switching of greenthreads between queries.
-                greenthread.sleep(0)
-                bw_in = 0
-                bw_out = 0
-                last_ctr_in = None
-                last_ctr_out = None
-                # TODO(geekinutah): Once bw_usage_cache object is created
-                #                   need to revisit this and slaveify.
-                usage = self.conductor_api.bw_usage_get(context,
-                                                        bw_ctr['uuid'],
-                                                        start_time,
-                                                        bw_ctr['mac_address'])
-                if usage:
-                    bw_in = usage['bw_in']
-                    bw_out = usage['bw_out']
-                    last_ctr_in = usage['last_ctr_in']
-                    last_ctr_out = usage['last_ctr_out']
-                else:
-                    # TODO(geekinutah): Same here, pls slaveify
-                    usage = self.conductor_api.bw_usage_get(
-                        context, bw_ctr['uuid'], prev_time,
-                        bw_ctr['mac_address'])
-                    if usage:
-                        last_ctr_in = usage['last_ctr_in']
-                        last_ctr_out = usage['last_ctr_out']
-
-                if last_ctr_in is not None:
-                    if bw_ctr['bw_in'] < last_ctr_in:
-                        # counter rollover
-                        bw_in += bw_ctr['bw_in']
-                    else:
-                        bw_in += (bw_ctr['bw_in'] - last_ctr_in)
-
-                if last_ctr_out is not None:
-                    if bw_ctr['bw_out'] < last_ctr_out:
-                        # counter rollover
-                        bw_out += bw_ctr['bw_out']
-                    else:
-                        bw_out += (bw_ctr['bw_out'] - last_ctr_out)
-
-                self.conductor_api.bw_usage_update(context,
-                                                   bw_ctr['uuid'],
-                                                   bw_ctr['mac_address'],
-                                                   start_time,
-                                                   bw_in,
-                                                   bw_out,
-                                                   bw_ctr['bw_in'],
-                                                   bw_ctr['bw_out'],
-                                                   last_refreshed=refreshed,
-                                                   update_cells=update_cells)
+            if not bw_counters:
+                return
+            # The traffic since the last poll is added to the usage of each
+            # network by the database layer, all at once.
+            self.conductor_api.bw_usage_update_many(
+                context, start_time, prev_time, bw_counters,
+                last_refreshed=timeutils.utcnow(), update_cells=update_cells)
 
     def _get_host_volume_bdms(self, context):
         """Return all block device mappings on a compute host."""
@@ -5191,15 +5235,19 @@ class ComputeManager(manager.Manager):
 
     def _update_volume_usage_cache(self, context, vol_usages):
         """Updates the volume usage cache table with a list of stats."""
-        for usage in vol_usages:
-            # Allow switching of greenthreads between queries.
-            greenthread.sleep(0)
-            self.conductor_api.vol_usage_update(context, usage['volume'],
-                                                usage['rd_req'],
-                                                usage['rd_bytes'],
-                                                usage['wr_req'],
-                                                usage['wr_bytes'],
-                                                usage['instance'])
+        if not vol_usages:
+            return
+        self.conductor_api.vol_usage_update_many(context, [
+            {'volume_id': usage['volume'],
+             'rd_req': usage['rd_req'],
+             'rd_bytes': usage['rd_bytes'],
+             'wr_req': usage['wr_req'],
+             'wr_bytes': usage['wr_bytes'],
+             'instance_id': usage['instance']['uuid'],
+             'project_id': usage['instance']['project_id'],
+             'user_id': usage['instance']['user_id'],
+             'availability_zone': usage['instance']['availability_zone']}
+            for usage in vol_usages])
 
     @periodic_task.periodic_task(spacing=CONF.volume_usage_poll_interval)
     def _poll_volume_usage(self, context, start_time=None):
@@ -5227,11 +5275,12 @@ class ComputeManager(manager.Manager):
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
-        To sync power state data we make a DB call to get the number of
-        virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        Changes reported by the hypervisor are applied as they happen by
+        handle_lifecycle_event(), this task only catches what was missed.
+        The power state of every instance on the host is read from the
+        driver in a single call and compared with the database records
+        fetched alongside; only the instances which are out of sync are
+        looked at one at a time.
         """
         db_instances = instance_obj.InstanceList.get_by_host(context,
                                                              self.host,
@@ -5246,29 +5295,34 @@ class ComputeManager(manager.Manager):
                      {'num_db_instances': num_db_instances,
                       'num_vm_instances': num_vm_instances})
 
+        idle_instances = []
         for db_instance in db_instances:
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
                 continue
-            # No pending tasks. Now try to figure out the real vm_power_state.
+            idle_instances.append(db_instance)
+
+        # Note(maoy): the call below might take a long time, for example,
+        # because of a broken libvirt driver.
+        vm_power_states = self.driver.get_power_states(idle_instances)
+
+        for db_instance in idle_instances:
+            vm_power_state = vm_power_states.get(db_instance['uuid'])
+            if vm_power_state is None:
+                # The driver failed to read it, it was logged there.
+                continue
+            if _power_state_in_sync(db_instance, vm_power_state):
+                continue
             try:
-                try:
-                    vm_instance = self.driver.get_info(db_instance)
-                    vm_power_state = vm_instance['state']
-                except exception.InstanceNotFound:
-                    vm_power_state = power_state.NOSTATE
-                # Note(maoy): the above get_info call might take a long time,
-                # for example, because of a broken libvirt driver.
-                try:
-                    self._sync_instance_power_state(context,
-                                                    db_instance,
-                                                    vm_power_state,
-                                                    use_slave=True)
-                except exception.InstanceNotFound:
-                    # NOTE(hanlind): If the instance gets deleted during sync,
-                    # silently ignore and move on to next instance.
-                    continue
+                self._sync_instance_power_state(context,
+                                                db_instance,
+                                                vm_power_state,
+                                                use_slave=True)
+            except exception.InstanceNotFound:
+                # NOTE(hanlind): If the instance gets deleted during sync,
+                # silently ignore and move on to next instance.
+                continue
             except Exception:
                 LOG.exception(_("Periodic sync_power_state task had an error "
                                 "while processing an instance."),
@@ -5661,7 +5715,11 @@ class ComputeManager(manager.Manager):
                         if inst.uuid == event.instance_uuid][0]
             if event.name == 'network-changed':
                 self.network_api.get_instance_nw_info(context, instance)
+                self._instance_heal_times[instance.uuid] = time.time()
+                self._instances_to_heal_first.discard(instance.uuid)
             else:
+                if event.name.startswith('network-'):
+                    self._instances_to_heal_first.add(instance.uuid)
                 self._process_instance_event(instance, event)
 
     @periodic_task.periodic_task(spacing=CONF.image_cache_manager_interval,
@@ -37,6 +37,7 @@ from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova.pci import pci_manager
 from nova import rpc
 from nova import utils
@@ -48,7 +49,15 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.IntOpt('resource_audit_interval', default=600,
+               help='Number of seconds between full audits of the '
+                    'instances, migrations and orphans of a compute node. '
+                    'In between, usage is kept up to date from resource '
+                    'claims and instance updates. Live migrations, '
+                    'evacuations, resizes and shelve offloads bring the '
+                    'next audit forward. Set to 0 to audit on every '
+                    'resource update'),
 ]
 
 CONF = cfg.CONF
@@ -74,6 +83,9 @@ class ResourceTracker(object):
         self.stats = importutils.import_object(CONF.compute_stats_class)
         self.tracked_instances = {}
         self.tracked_migrations = {}
+        self.last_audit = None
+        # compute node values as last written to the database:
+        self._written_values = {}
         self.conductor_api = conductor.API()
         monitor_handler = monitors.ResourceMonitorHandler()
         self.monitors = monitor_handler.choose_monitors(self)
@@ -280,6 +292,20 @@ class ResourceTracker(object):
             notifier.info(context, 'compute.metrics.update', metrics_info)
         return metrics
 
+    def request_audit(self):
+        """Run the full audit on the next update_available_resource().
+
+        For operations which move an instance to or from this node, or free
+        its resources, without applying the change to the tracked usage.
+        """
+        self.last_audit = None
+
+    def _audit_due(self):
+        if self.disabled or self.last_audit is None:
+            return True
+        return timeutils.is_older_than(self.last_audit,
+                                       CONF.resource_audit_interval)
+
     @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
     def update_available_resource(self, context):
         """Override in-memory calculations of compute node resource usage based
@@ -288,7 +314,19 @@ class ResourceTracker(object):
         Add in resource claims in progress to account for operations that have
         declared a need for resources, but not necessarily retrieved them from
         the hypervisor layer yet.
+
+        The full audit only runs every CONF.resource_audit_interval seconds,
+        the usage is otherwise kept up to date by the claims and instance
+        updates as they happen, and operations which bypass those ask for
+        an early audit with request_audit(). In between only the host
+        metrics are refreshed and the compute node is not written unless
+        they changed.
         """
+        if not self._audit_due():
+            metrics = self._get_host_metrics(context, self.nodename)
+            self._update(context, {'metrics': jsonutils.dumps(metrics)})
+            return
+
         LOG.audit(_("Auditing locally available compute resources"))
         resources = self.driver.get_available_resource(self.nodename)
 
@@ -344,6 +382,7 @@ class ResourceTracker(object):
         metrics = self._get_host_metrics(context, self.nodename)
         resources['metrics'] = jsonutils.dumps(metrics)
         self._sync_compute_node(context, resources)
+        self.last_audit = timeutils.utcnow()
 
     def _sync_compute_node(self, context, resources):
         """Create or update the compute node DB record."""
@@ -359,6 +398,7 @@ class ResourceTracker(object):
                 for cn in compute_node_refs:
                     if cn.get('hypervisor_hostname') == self.nodename:
                         self.compute_node = cn
+                        self._written_values = {}
                         if self.pci_tracker:
                             self.pci_tracker.set_compute_node_id(cn['id'])
                         break
@@ -373,14 +413,16 @@ class ResourceTracker(object):
                     % {'host': self.host, 'node': self.nodename})
 
         else:
-            # just update the record:
-            self._update(context, resources)
+            # just update the record, always writing it so its updated_at
+            # moves on even if nothing changed:
+            self._update(context, resources, force=True)
             LOG.info(_('Compute_service record updated for %(host)s:%(node)s')
                     % {'host': self.host, 'node': self.nodename})
 
     def _create(self, context, values):
         """Create the compute node in the DB."""
         # initialize load stats from existing instances:
+        self._written_values = dict(values)
         self.compute_node = self.conductor_api.compute_node_create(context,
                                                                    values)
 
@@ -441,12 +483,21 @@ class ResourceTracker(object):
         if 'pci_devices' in resources:
             LOG.audit(_("Free PCI devices: %s") % resources['pci_devices'])
 
-    def _update(self, context, values):
-        """Persist the compute node updates to the DB."""
+    def _update(self, context, values, force=False):
+        """Persist the compute node updates to the DB.
+
+        Only the values which changed since the last update are written.
+        Nothing is written if none did, unless force is set.
+        """
         if "service" in self.compute_node:
             del self.compute_node['service']
-        self.compute_node = self.conductor_api.compute_node_update(
-            context, self.compute_node, values)
+        changes = dict((key, value) for key, value in values.iteritems()
+                       if key not in self._written_values or
+                       self._written_values[key] != value)
+        if changes or force:
+            self._written_values.update(changes)
+            self.compute_node = self.conductor_api.compute_node_update(
+                context, self.compute_node, changes)
         if self.pci_tracker:
             self.pci_tracker.save(context)
 
@@ -14,8 +14,11 @@
 
 """Handles all requests to the conductor service."""
 
+import copy
+
 from oslo.config import cfg
 from oslo import messaging
+import six
 
 from nova import baserpc
 from nova.conductor import manager
@@ -131,6 +134,14 @@ class LocalAPI(object):
                                              last_refreshed,
                                              update_cells=update_cells)
 
+    def bw_usage_update_many(self, context, start_period, prev_period,
+                             bw_counters, last_refreshed=None,
+                             update_cells=True):
+        return self._manager.bw_usage_update_many(context, start_period,
+                                                  prev_period, bw_counters,
+                                                  last_refreshed,
+                                                  update_cells=update_cells)
+
     def provider_fw_rule_get_all(self, context):
         return self._manager.provider_fw_rule_get_all(context)
 
@@ -170,6 +181,9 @@ class LocalAPI(object):
                                               instance, last_refreshed,
                                               update_totals)
 
+    def vol_usage_update_many(self, context, vol_usages):
+        return self._manager.vol_usage_update_many(context, vol_usages)
+
     def service_get_all(self, context):
         return self._manager.service_get_all_by(context)
 
@@ -267,6 +281,30 @@ class LocalAPI(object):
     def object_backport(self, context, objinst, target_version):
         return self._manager.object_backport(context, objinst, target_version)
 
+    def batch(self, context, calls, stop_on_error=True):
+        """Make several calls of this API in one conductor request.
+
+        calls is a list of (method, args, kwargs) naming methods of this
+        API, the context being left out of args. The methods must make a
+        single conductor call and return its result as is.
+
+        Returns a [result, error] pair per call, error being None or the
+        text of the exception the call raised. With stop_on_error, the
+        first exception is raised instead, the calls before it having
+        been made.
+        """
+        results = []
+        for method, args, kwargs in calls:
+            try:
+                results.append([getattr(self, method)(context, *args,
+                                                      **kwargs), None])
+            except Exception as ex:
+                if stop_on_error:
+                    raise
+                LOG.exception(_('Batched call of %s failed'), method)
+                results.append([None, six.text_type(ex)])
+        return results
+
 
 class LocalComputeTaskAPI(object):
     def __init__(self):
@@ -351,6 +389,19 @@ class API(LocalAPI):
         return self._manager.instance_update(context, instance_uuid,
                                              updates, 'conductor')
 
+    def batch(self, context, calls, stop_on_error=True):
+        recorder = self._manager.recorder()
+        if recorder is None:
+            # NOTE: The conductor can't take batches yet, make the calls
+            # one by one.
+            return super(API, self).batch(context, calls, stop_on_error)
+        api = copy.copy(self)
+        api._manager = recorder
+        for method, args, kwargs in calls:
+            getattr(api, method)(context, *args, **kwargs)
+        return self._manager.batch(context, recorder.calls,
+                                   stop_on_error=stop_on_error)
+
 
 class ComputeTaskAPI(object):
     """ComputeTask API that queues up compute tasks for nova-conductor."""
@@ -14,6 +14,9 @@
 
 """Handles database requests from other nova services."""
 
+import copy
+
+from oslo.config import cfg
 from oslo import messaging
 import six
 
@@ -41,11 +44,45 @@ from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
+from nova.openstack.common import periodic_task
 from nova.openstack.common import timeutils
 from nova import quota
 from nova.scheduler import rpcapi as scheduler_rpcapi
 from nova.scheduler import utils as scheduler_utils
 
+read_cache_opts = [
+    cfg.IntOpt('read_cache_flavor_ttl',
+               default=600,
+               help='Seconds flavors read by instance_type_get are cached '
+                    'for, 0 disables caching'),
+    cfg.IntOpt('read_cache_agent_build_ttl',
+               default=600,
+               help='Seconds agent builds read by agent_build_get_by_triple '
+                    'are cached for, 0 disables caching'),
+    cfg.IntOpt('read_cache_aggregate_metadata_ttl',
+               default=60,
+               help='Seconds the aggregate metadata of a host is cached for, '
+                    '0 disables caching. Aggregate changes made through this '
+                    'conductor clear the cache'),
+    cfg.IntOpt('read_cache_provider_fw_rule_ttl',
+               default=0,
+               help='Seconds provider firewall rules are cached for, 0 '
+                    'disables caching. Computes reload the rules as soon '
+                    'as they change, so a cached copy delays new rules'),
+    cfg.IntOpt('read_cache_security_group_rule_ttl',
+               default=0,
+               help='Seconds the rules of a security group are cached for, '
+                    '0 disables caching. Computes reload the rules as soon '
+                    'as they change, so a cached copy delays new rules'),
+    cfg.IntOpt('read_cache_report_interval',
+               default=600,
+               help='Interval in seconds for logging the hit rate of the '
+                    'read cache'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(read_cache_opts, 'conductor')
+
 LOG = logging.getLogger(__name__)
 
 # Instead of having a huge list of arguments to instance_update(), we just
@@ -64,6 +101,65 @@ allowed_updates = ['task_state', 'vm_state', 'expected_task_state',
 datetime_fields = ['launched_at', 'terminated_at', 'updated_at']
 
 
+class ReadCache(object):
+    """Cache of database reads computes make over and over.
+
+    Entries are kept per resource for the number of seconds set by the
+    read_cache_<resource>_ttl option of the conductor group, a resource
+    with a ttl of 0 is not cached. Values are keyed by the lookup and by
+    what of the context changes the result of the query.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._stats = {}
+
+    def _ttl(self, resource):
+        return getattr(CONF.conductor, 'read_cache_%s_ttl' % resource)
+
+    def get(self, resource, context, key, load):
+        """Return the cached value for key, calling load() on a miss."""
+        ttl = self._ttl(resource)
+        if ttl <= 0:
+            return load()
+        key = (key, context.read_deleted, context.is_admin,
+               None if context.is_admin else context.project_id)
+        entries = self._entries.setdefault(resource, {})
+        stats = self._stats.setdefault(resource, {'hits': 0, 'misses': 0})
+        now = timeutils.utcnow_ts()
+        entry = entries.get(key)
+        if entry is not None and entry[0] > now:
+            stats['hits'] += 1
+            return copy.deepcopy(entry[1])
+        stats['misses'] += 1
+        value = load()
+        entries[key] = (now + ttl, copy.deepcopy(value))
+        return value
+
+    def invalidate(self, resource):
+        """Drop every cached value of a resource."""
+        self._entries.pop(resource, None)
+
+    def prune(self):
+        """Drop the expired entries."""
+        now = timeutils.utcnow_ts()
+        for entries in self._entries.values():
+            for key, (expires, _value) in entries.items():
+                if expires <= now:
+                    del entries[key]
+
+    def get_stats(self):
+        """Return hits, misses, hit rate and entries per resource."""
+        stats = {}
+        for resource, counts in self._stats.items():
+            lookups = counts['hits'] + counts['misses']
+            stats[resource] = dict(
+                counts,
+                hit_rate=float(counts['hits']) / lookups if lookups else 0.0,
+                entries=len(self._entries.get(resource, {})))
+        return stats
+
+
 class ConductorManager(manager.Manager):
     """Mission: Conduct things.
 
@@ -88,6 +184,7 @@ class ConductorManager(manager.Manager):
         self._compute_api = None
         self.compute_task_mgr = ComputeTaskManager()
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
+        self.read_cache = ReadCache()
         self.additional_endpoints.append(self.compute_task_mgr)
         self.additional_endpoints.append(_ConductorManagerV2Proxy(self))
 
@@ -111,6 +208,19 @@ class ConductorManager(manager.Manager):
         # now a part of the base rpc API.
         return jsonutils.to_primitive({'service': 'conductor', 'arg': arg})
 
+    @periodic_task.periodic_task(
+        spacing=CONF.conductor.read_cache_report_interval)
+    def _report_read_cache_stats(self, context):
+        self.read_cache.prune()
+        for resource, stats in sorted(self.read_cache.get_stats().items()):
+            LOG.info(_('Read cache of %(resource)s: %(hits)d hits, '
+                       '%(misses)d misses, hit rate %(rate).1f%%, '
+                       '%(entries)d entries'),
+                     {'resource': resource, 'hits': stats['hits'],
+                      'misses': stats['misses'],
+                      'rate': stats['hit_rate'] * 100,
+                      'entries': stats['entries']})
+
     @messaging.expected_exceptions(KeyError, ValueError,
                                    exception.InvalidUUID,
                                    exception.InstanceNotFound,
@@ -203,6 +313,7 @@ class ConductorManager(manager.Manager):
     def aggregate_host_add(self, context, aggregate, host):
         host_ref = self.db.aggregate_host_add(context.elevated(),
                 aggregate['id'], host)
+        self.read_cache.invalidate('aggregate_metadata')
 
         return jsonutils.to_primitive(host_ref)
 
@@ -210,6 +321,7 @@ class ConductorManager(manager.Manager):
     def aggregate_host_delete(self, context, aggregate, host):
         self.db.aggregate_host_delete(context.elevated(),
                 aggregate['id'], host)
+        self.read_cache.invalidate('aggregate_metadata')
 
     # NOTE(russellb): This method is now deprecated and can be removed in
     # version 2.0 of the RPC API
@@ -232,6 +344,7 @@ class ConductorManager(manager.Manager):
         new_metadata = self.db.aggregate_metadata_add(context.elevated(),
                                                       aggregate['id'],
                                                       metadata, set_delete)
+        self.read_cache.invalidate('aggregate_metadata')
         return jsonutils.to_primitive(new_metadata)
 
     # NOTE(danms): This method is now deprecated and can be removed in
@@ -240,11 +353,14 @@ class ConductorManager(manager.Manager):
     def aggregate_metadata_delete(self, context, aggregate, key):
         self.db.aggregate_metadata_delete(context.elevated(),
                                           aggregate['id'], key)
+        self.read_cache.invalidate('aggregate_metadata')
 
     def aggregate_metadata_get_by_host(self, context, host,
                                        key='availability_zone'):
-        result = self.db.aggregate_metadata_get_by_host(context, host, key)
-        return jsonutils.to_primitive(result)
+        return self.read_cache.get(
+            'aggregate_metadata', context, (host, key),
+            lambda: jsonutils.to_primitive(
+                self.db.aggregate_metadata_get_by_host(context, host, key)))
 
     def bw_usage_update(self, context, uuid, mac, start_period,
                         bw_in=None, bw_out=None,
@@ -259,6 +375,19 @@ class ConductorManager(manager.Manager):
         usage = self.db.bw_usage_get(context, uuid, start_period, mac)
         return jsonutils.to_primitive(usage)
 
+    def bw_usage_update_many(self, context, start_period, prev_period,
+                             bw_counters, last_refreshed=None,
+                             update_cells=True):
+        # NOTE: Times sent over RPC arrive as strings, but the database
+        # layer matches the periods against the datetimes of existing rows.
+        start_period, prev_period, last_refreshed = [
+            timeutils.parse_strtime(value)
+            if isinstance(value, six.string_types) else value
+            for value in (start_period, prev_period, last_refreshed)]
+        self.db.bw_usage_update_many(context, start_period, prev_period,
+                                     bw_counters, last_refreshed,
+                                     update_cells=update_cells)
+
     # NOTE(russellb) This method can be removed in 2.0 of this API.  It is
     # deprecated in favor of the method in the base API.
     def get_backdoor_port(self, context):
@@ -272,18 +401,24 @@ class ConductorManager(manager.Manager):
 
     # NOTE(danms): This method can be removed in version 2.0 of this API.
     def security_group_rule_get_by_security_group(self, context, secgroup):
-        rules = self.db.security_group_rule_get_by_security_group(
-            context, secgroup['id'])
-        return jsonutils.to_primitive(rules, max_depth=4)
+        return self.read_cache.get(
+            'security_group_rule', context, secgroup['id'],
+            lambda: jsonutils.to_primitive(
+                self.db.security_group_rule_get_by_security_group(
+                    context, secgroup['id']), max_depth=4))
 
     def provider_fw_rule_get_all(self, context):
-        rules = self.db.provider_fw_rule_get_all(context)
-        return jsonutils.to_primitive(rules)
+        return self.read_cache.get(
+            'provider_fw_rule', context, None,
+            lambda: jsonutils.to_primitive(
+                self.db.provider_fw_rule_get_all(context)))
 
     def agent_build_get_by_triple(self, context, hypervisor, os, architecture):
-        info = self.db.agent_build_get_by_triple(context, hypervisor, os,
-                                                 architecture)
-        return jsonutils.to_primitive(info)
+        return self.read_cache.get(
+            'agent_build', context, (hypervisor, os, architecture),
+            lambda: jsonutils.to_primitive(
+                self.db.agent_build_get_by_triple(context, hypervisor, os,
+                                                  architecture)))
 
     def block_device_mapping_update_or_create(self, context, values,
                                               create=None):
@@ -394,8 +529,10 @@ class ConductorManager(manager.Manager):
     # NOTE(danms): This method is now deprecated and can be removed in
     # version v2.0 of the RPC API.
     def instance_type_get(self, context, instance_type_id):
-        result = self.db.flavor_get(context, instance_type_id)
-        return jsonutils.to_primitive(result)
+        return self.read_cache.get(
+            'flavor', context, instance_type_id,
+            lambda: jsonutils.to_primitive(
+                self.db.flavor_get(context, instance_type_id)))
 
     def instance_fault_create(self, context, values):
         result = self.db.instance_fault_create(context, values)
@@ -424,6 +561,11 @@ class ConductorManager(manager.Manager):
         self.notifier.info(context, 'volume.usage',
                            compute_utils.usage_volume_info(vol_usage))
 
+    def vol_usage_update_many(self, context, vol_usages):
+        for vol_usage in self.db.vol_usage_update_many(context, vol_usages):
+            self.notifier.info(context, 'volume.usage',
+                               compute_utils.usage_volume_info(vol_usage))
+
     @messaging.expected_exceptions(exception.ComputeHostNotFound,
                                    exception.HostBinaryNotFound)
     def service_get_all_by(self, context, topic=None, host=None, binary=None):
@@ -611,11 +753,19 @@ class ConductorManager(manager.Manager):
         return (result.obj_to_primitive(target_version=objver)
                 if isinstance(result, nova_object.NovaObject) else result)
 
-    def object_action(self, context, objinst, objmethod, args, kwargs):
-        """Perform an action on an object."""
+    def object_action(self, context, objinst, objmethod, args, kwargs,
+                      digests=None):
+        """Perform an action on an object.
+
+        If digests is given, objinst only holds the fields the action
+        needs and digests maps the other fields the caller has to the
+        nova_object.primitive_digest() of their value. Those fields are
+        only sent back if the action changed them.
+        """
         oldobj = objinst.obj_clone()
         result = self._object_dispatch(objinst, objmethod, context,
                                        args, kwargs)
+        digests = digests or {}
         updates = dict()
         # NOTE(danms): Diff the object with the one passed to us and
         # generate a list of changes to forward back
@@ -623,10 +773,15 @@ class ConductorManager(manager.Manager):
             if not objinst.obj_attr_is_set(name):
                 # Avoid demand-loading anything
                 continue
-            if (not oldobj.obj_attr_is_set(name) or
-                    oldobj[name] != objinst[name]):
-                updates[name] = field.to_primitive(objinst, name,
-                                                   objinst[name])
+            if oldobj.obj_attr_is_set(name):
+                if oldobj[name] != objinst[name]:
+                    updates[name] = field.to_primitive(objinst, name,
+                                                       objinst[name])
+                continue
+            value = field.to_primitive(objinst, name, objinst[name])
+            if (name not in digests or
+                    digests[name] != nova_object.primitive_digest(value)):
+                updates[name] = value
         # This is safe since a field named this would conflict with the
         # method anyway
         updates['obj_what_changed'] = objinst.obj_what_changed()
@@ -876,10 +1031,11 @@ class ComputeTaskManager(base.Base):
 
 class _ConductorManagerV2Proxy(object):
 
-    target = messaging.Target(version='2.0')
+    target = messaging.Target(version='2.4')
 
     def __init__(self, manager):
         self.manager = manager
+        self.serializer = nova_object.NovaObjectSerializer()
 
     def instance_update(self, context, instance_uuid, updates,
                         service):
@@ -912,6 +1068,11 @@ class _ConductorManagerV2Proxy(object):
                 bw_in, bw_out, last_ctr_in, last_ctr_out, last_refreshed,
                 update_cells)
 
+    def bw_usage_update_many(self, context, start_period, prev_period,
+                             bw_counters, last_refreshed, update_cells):
+        return self.manager.bw_usage_update_many(context, start_period,
+                prev_period, bw_counters, last_refreshed, update_cells)
+
     def provider_fw_rule_get_all(self, context):
         return self.manager.provider_fw_rule_get_all(context)
 
@@ -952,6 +1113,9 @@ class _ConductorManagerV2Proxy(object):
         return self.manager.vol_usage_update(context, vol_id, rd_req, rd_bytes,
                 wr_req, wr_bytes, instance, last_refreshed, update_totals)
 
+    def vol_usage_update_many(self, context, vol_usages):
+        return self.manager.vol_usage_update_many(context, vol_usages)
+
     def service_get_all_by(self, context, topic, host, binary):
         return self.manager.service_get_all_by(context, topic, host, binary)
 
@@ -1044,9 +1208,38 @@ class _ConductorManagerV2Proxy(object):
         return self.manager.object_class_action(context, objname, objmethod,
                 objver, args, kwargs)
 
-    def object_action(self, context, objinst, objmethod, args, kwargs):
+    def object_action(self, context, objinst, objmethod, args, kwargs,
+                      digests=None):
         return self.manager.object_action(context, objinst, objmethod, args,
-                kwargs)
+                kwargs, digests=digests)
 
     def object_backport(self, context, objinst, target_version):
         return self.manager.object_backport(context, objinst, target_version)
+
+    def batch(self, context, calls, stop_on_error):
+        """Make several calls of this API in order.
+
+        calls is a list of [method, kwargs] naming methods of this API,
+        with their arguments in serialized form. Returns a [result, error]
+        pair per call, error being None or the text of the exception the
+        call raised. With stop_on_error, the first exception is raised
+        instead.
+        """
+        results = []
+        for method, kwargs in calls:
+            if method.startswith('_') or method == 'batch':
+                raise messaging.NoSuchMethod(method)
+            kwargs = dict((key, self.serializer.deserialize_entity(context,
+                                                                   value))
+                          for key, value in kwargs.iteritems())
+            try:
+                results.append([getattr(self, method)(context, **kwargs),
+                                None])
+            except Exception as ex:
+                if stop_on_error:
+                    raise
+                if isinstance(ex, messaging.ExpectedException):
+                    ex = ex.exc_info[1]
+                LOG.exception(_('Batched call of %s failed'), method)
+                results.append([None, six.text_type(ex)])
+        return results
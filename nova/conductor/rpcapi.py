@@ -15,6 +15,8 @@
 
 """Client side of the conductor RPC API."""
 
+import copy
+
 from oslo.config import cfg
 from oslo import messaging
 
@@ -27,6 +29,8 @@ CONF = cfg.CONF
 rpcapi_cap_opt = cfg.StrOpt('conductor',
         help='Set a version cap for messages sent to conductor services')
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
+CONF.import_opt('compact_object_payloads', 'nova.objects.base')
+CONF.import_opt('delta_object_actions', 'nova.objects.base')
 
 
 class ConductorAPI(object):
@@ -134,6 +138,11 @@ class ConductorAPI(object):
 
     2.0  - Drop backwards compatibility
     ...  - Remove quota_rollback() and quota_commit()
+    2.1  - Added bw_usage_update_many() and vol_usage_update_many()
+    2.2  - Objects may be sent in the compact form of
+           objects_base.compact_primitive()
+    2.3  - Added digests to object_action()
+    2.4  - Added batch()
     """
 
     VERSION_ALIASES = {
@@ -151,6 +160,42 @@ class ConductorAPI(object):
         self.client = rpc.get_client(target,
                                      version_cap=version_cap,
                                      serializer=serializer)
+        self._compact_client = rpc.get_client(
+            target, version_cap=version_cap,
+            serializer=objects_base.NovaObjectSerializer(compact=True))
+
+    def _prepare(self, version=None):
+        """Prepare a call which may send its objects in compact form.
+
+        The compact form is used if compact_object_payloads is set and the
+        message can be stamped with 2.2, or version if that is later.
+        """
+        if (CONF.compact_object_payloads and
+                self._compact_client is not None and
+                self.client.can_send_version('2.2')):
+            return self._compact_client.prepare(version=version or '2.2')
+        if version is None:
+            return self.client.prepare()
+        return self.client.prepare(version=version)
+
+    def recorder(self):
+        """Return a copy of this API which records its calls for batch().
+
+        The calls made through the copy are not sent but appended to its
+        calls list. Returns None if the conductor can't take batches.
+        """
+        if not self.client.can_send_version('2.4'):
+            return None
+        recorder = copy.copy(self)
+        recorder.client = _CallRecorder(self.client)
+        recorder._compact_client = None
+        recorder.calls = recorder.client.calls
+        return recorder
+
+    def batch(self, context, calls, stop_on_error=True):
+        cctxt = self._prepare(version='2.4')
+        return cctxt.call(context, 'batch', calls=calls,
+                          stop_on_error=stop_on_error)
 
     def instance_update(self, context, instance_uuid, updates,
                         service=None):
@@ -208,6 +253,21 @@ class ConductorAPI(object):
         cctxt = self.client.prepare()
         return cctxt.call(context, 'bw_usage_update', **msg_kwargs)
 
+    def bw_usage_update_many(self, context, start_period, prev_period,
+                             bw_counters, last_refreshed=None,
+                             update_cells=True):
+        start_period_p = jsonutils.to_primitive(start_period)
+        prev_period_p = jsonutils.to_primitive(prev_period)
+        bw_counters_p = jsonutils.to_primitive(bw_counters)
+        last_refreshed_p = jsonutils.to_primitive(last_refreshed)
+        cctxt = self.client.prepare(version='2.1')
+        return cctxt.call(context, 'bw_usage_update_many',
+                          start_period=start_period_p,
+                          prev_period=prev_period_p,
+                          bw_counters=bw_counters_p,
+                          last_refreshed=last_refreshed_p,
+                          update_cells=update_cells)
+
     def provider_fw_rule_get_all(self, context):
         cctxt = self.client.prepare()
         return cctxt.call(context, 'provider_fw_rule_get_all')
@@ -275,6 +335,12 @@ class ConductorAPI(object):
                           instance=instance_p, last_refreshed=last_refreshed,
                           update_totals=update_totals)
 
+    def vol_usage_update_many(self, context, vol_usages):
+        vol_usages_p = jsonutils.to_primitive(vol_usages)
+        cctxt = self.client.prepare(version='2.1')
+        return cctxt.call(context, 'vol_usage_update_many',
+                          vol_usages=vol_usages_p)
+
     def service_get_all_by(self, context, topic=None, host=None, binary=None):
         cctxt = self.client.prepare()
         return cctxt.call(context, 'service_get_all_by',
@@ -404,22 +470,54 @@ class ConductorAPI(object):
 
     def object_class_action(self, context, objname, objmethod, objver,
                             args, kwargs):
-        cctxt = self.client.prepare()
+        cctxt = self._prepare()
         return cctxt.call(context, 'object_class_action',
                           objname=objname, objmethod=objmethod,
                           objver=objver, args=args, kwargs=kwargs)
 
     def object_action(self, context, objinst, objmethod, args, kwargs):
-        cctxt = self.client.prepare()
+        if (CONF.delta_object_actions and
+                objmethod in objinst.obj_delta_methods and
+                self.client.can_send_version('2.3')):
+            objinst_p, digests = objinst.obj_to_delta_primitive()
+            cctxt = self._prepare(version='2.3')
+            return cctxt.call(context, 'object_action', objinst=objinst_p,
+                              objmethod=objmethod, args=args, kwargs=kwargs,
+                              digests=digests)
+        cctxt = self._prepare()
         return cctxt.call(context, 'object_action', objinst=objinst,
                           objmethod=objmethod, args=args, kwargs=kwargs)
 
     def object_backport(self, context, objinst, target_version):
-        cctxt = self.client.prepare()
+        cctxt = self._prepare()
         return cctxt.call(context, 'object_backport', objinst=objinst,
                           target_version=target_version)
 
 
+class _CallRecorder(object):
+    """Stands in for the RPC client of a ConductorAPI recorder."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+        # NOTE: Arguments are serialized on their own, the batch they end
+        # up in is what may be sent in compact form.
+        self.serializer = objects_base.NovaObjectSerializer()
+
+    def can_send_version(self, version):
+        return self.client.can_send_version(version)
+
+    def prepare(self, **kwargs):
+        return self
+
+    def call(self, context, method, **kwargs):
+        self.calls.append([method, dict(
+            (key, self.serializer.serialize_entity(context, value))
+            for key, value in kwargs.iteritems())])
+
+    cast = call
+
+
 class ComputeTaskAPI(object):
     """Client side of the conductor 'compute' namespaced RPC API
 
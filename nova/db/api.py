@@ -194,6 +194,24 @@ def compute_node_get_all(context, no_date_fields=False):
     return IMPL.compute_node_get_all(context, no_date_fields)
 
 
+def compute_node_get_all_changed_since(context, changed_since):
+    """Get computeNodes created, updated or deleted since a given time.
+
+    :param context: The security context
+    :param changed_since: Only return compute nodes whose 'created_at',
+                          'updated_at' or 'deleted_at' is at or after this
+                          datetime
+
+    :returns: List of dictionaries each containing compute node properties.
+              The service is not joined, callers keeping a cache of compute
+              nodes look it up by 'service_id' among the services they
+              read anyway. Soft-deleted compute nodes are included so that
+              callers can drop them from any cache; check the 'deleted'
+              field.
+    """
+    return IMPL.compute_node_get_all_changed_since(context, changed_since)
+
+
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     """Get compute nodes by hypervisor hostname.
 
@@ -560,6 +578,20 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return IMPL.fixed_ips_by_virtual_interface(context, vif_id)
 
 
+def fixed_ip_get_by_ip_filter(context, fixed_address=None, address=None,
+                              regexp=None):
+    """Get the allocated fixed ips matching an instance ip filter.
+
+    :param fixed_address: fixed ip address to look up
+    :param address: fixed or floating ip address to look up
+    :param regexp: regexp a fixed or floating ip address should match,
+                   backends which can't evaluate it return every allocated
+                   fixed ip, so callers must match it again
+    """
+    return IMPL.fixed_ip_get_by_ip_filter(context, fixed_address,
+                                          address, regexp)
+
+
 def fixed_ip_update(context, address, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_update(context, address, values)
@@ -660,6 +692,21 @@ def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                             use_slave=use_slave)
 
 
+def instance_get_all_by_filters_iter(context, filters, sort_key='created_at',
+                                     sort_dir='desc', limit=None, marker=None,
+                                     columns_to_join=None, chunk_size=500,
+                                     use_slave=False):
+    """Iterate over all instances that match all filters.
+
+    Instances are fetched from the database chunk_size at a time, using
+    one database session that stays open while the iterator is in use.
+    """
+    return IMPL.instance_get_all_by_filters_iter(context, filters, sort_key,
+            sort_dir, limit=limit, marker=marker,
+            columns_to_join=columns_to_join, chunk_size=chunk_size,
+            use_slave=use_slave)
+
+
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None):
     """Get instances and joins active during a certain time window.
@@ -1105,6 +1152,23 @@ def quota_reserve(context, resources, quotas, user_quotas, deltas, expire,
                               project_id=project_id, user_id=user_id)
 
 
+def quota_reserve_batch(context, resources, requests, until_refresh, max_age,
+                        project_id=None):
+    """Check quotas and create reservations for several requests at once.
+
+    All the requests are for the same project and handled in a single
+    transaction. Each one is a dict with the context, project_quotas,
+    user_quotas, deltas, expire and user_id arguments of quota_reserve().
+
+    Returns a (reservations, error) tuple per request, error being the
+    OverQuota exception of a request which didn't fit, if any. The
+    changes made for such a request are rolled back.
+    """
+    return IMPL.quota_reserve_batch(context, resources, requests,
+                                    until_refresh, max_age,
+                                    project_id=project_id)
+
+
 def reservation_commit(context, reservations, project_id=None, user_id=None):
     """Commit quota reservations."""
     return IMPL.reservation_commit(context, reservations,
@@ -1648,6 +1712,36 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
     return rv
 
 
+def bw_usage_update_many(context, start_period, prev_period, bw_counters,
+                         last_refreshed=None, update_cells=True):
+    """Add the traffic seen on several instance networks to their cached
+    bandwidth usage.  Creates new records if needed.
+
+    :param bw_counters: list of dicts with the uuid, mac_address, bw_in and
+                        bw_out counters of each instance network, as read
+                        from the hypervisor
+    :param prev_period: start of the previous audit period, whose records
+                        hold the last counters when a period begins
+
+    Returns the list of bandwidth usages written.
+    """
+    rv = IMPL.bw_usage_update_many(context, start_period, prev_period,
+                                   bw_counters,
+                                   last_refreshed=last_refreshed)
+    if update_cells:
+        try:
+            cells_api = cells_rpcapi.CellsAPI()
+            for usage in rv:
+                cells_api.bw_usage_update_at_top(context,
+                        usage['uuid'], usage['mac'], usage['start_period'],
+                        usage['bw_in'], usage['bw_out'],
+                        usage['last_ctr_in'], usage['last_ctr_out'],
+                        usage['last_refreshed'])
+        except Exception:
+            LOG.exception(_("Failed to notify cells of bw_usage update"))
+    return rv
+
+
 ###################
 
 
@@ -1669,6 +1763,18 @@ def vol_usage_update(context, id, rd_req, rd_bytes, wr_req, wr_bytes,
                                  update_totals=update_totals)
 
 
+def vol_usage_update_many(context, vol_usages):
+    """Update the cached current usage of several volumes.
+
+    :param vol_usages: list of dicts with the volume_id, rd_req, rd_bytes,
+                       wr_req, wr_bytes, instance_id, project_id, user_id
+                       and availability_zone of each volume
+
+    Creates new records if needed and returns the updated records.
+    """
+    return IMPL.vol_usage_update_many(context, vol_usages)
+
+
 ###################
 
 
@@ -1749,6 +1855,17 @@ def aggregate_get_all(context):
     return IMPL.aggregate_get_all(context)
 
 
+def aggregate_get_all_changed_since(context, changed_since):
+    """Get aggregates changed since a given time.
+
+    An aggregate is changed if the aggregate itself, one of its hosts or
+    one of its metadata items was created, updated or deleted at or after
+    changed_since. Deleted aggregates are included; check the 'deleted'
+    field.
+    """
+    return IMPL.aggregate_get_all_changed_since(context, changed_since)
+
+
 def aggregate_metadata_add(context, aggregate_id, metadata, set_delete=False):
     """Add/update metadata. If set_delete=True, it adds only."""
     IMPL.aggregate_metadata_add(context, aggregate_id, metadata, set_delete)
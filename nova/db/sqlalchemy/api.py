@@ -21,6 +21,7 @@ import collections
 import copy
 import datetime
 import functools
+import re
 import sys
 import time
 import uuid
@@ -127,6 +128,11 @@ _SHADOW_TABLE_PREFIX = 'shadow_'
 _DEFAULT_QUOTA_NAME = 'default'
 PER_PROJECT_QUOTAS = ['fixed_ips', 'floating_ips', 'networks']
 
+# Address regexps made of these characters mean the same to python and to
+# the SQL backends, and can be matched in the database.
+_PORTABLE_IP_REGEXP_RE = re.compile(r'^(?:[0-9a-fA-F.:*+?^$|)\[\],{}-]|'
+                                    r'\((?!\?)|\\\.)*$')
+
 
 def get_backend():
     """The backend is this module itself."""
@@ -567,6 +573,17 @@ def compute_node_get_by_service_id(context, service_id):
 
 @require_admin_context
 def compute_node_get_all(context, no_date_fields):
+    return _compute_node_get_all(context, no_date_fields)
+
+
+@require_admin_context
+def compute_node_get_all_changed_since(context, changed_since):
+    return _compute_node_get_all(context, False, changed_since=changed_since,
+                                 join_services=False)
+
+
+def _compute_node_get_all(context, no_date_fields, changed_since=None,
+                          join_services=True):
 
     # NOTE(msdubov): Using lower-level 'select' queries and joining the tables
     #                manually here allows to gain 3x speed-up and to have 5x
@@ -585,10 +602,21 @@ def compute_node_get_all(context, no_date_fields):
         def filter_columns(table):
             return [c for c in table.c if c.name not in redundant_columns]
 
+        if changed_since is None:
+            compute_node_filter = compute_node.c.deleted == 0
+        else:
+            # NOTE: deleted rows are returned on purpose, so that callers
+            #       keeping a cache of compute nodes can evict them.
+            compute_node_filter = or_(
+                    compute_node.c.created_at >= changed_since,
+                    compute_node.c.updated_at >= changed_since,
+                    compute_node.c.deleted_at >= changed_since)
         compute_node_query = select(filter_columns(compute_node)).\
-                                where(compute_node.c.deleted == 0).\
+                                where(compute_node_filter).\
                                 order_by(compute_node.c.service_id)
         compute_node_rows = conn.execute(compute_node_query).fetchall()
+        if not join_services:
+            return [dict(proxy.items()) for proxy in compute_node_rows]
 
         service_query = select(filter_columns(service)).\
                             where((service.c.deleted == 0) &
@@ -1396,6 +1424,54 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return result
 
 
+@require_context
+def fixed_ip_get_by_ip_filter(context, fixed_address=None, address=None,
+                              regexp=None):
+    fixed_ips = models.FixedIp
+    floating_ips = models.FloatingIp
+    conditions = []
+    if fixed_address is not None:
+        conditions.append(fixed_ips.address == fixed_address)
+    if address is not None:
+        floating_query = model_query(context, floating_ips.fixed_ip_id,
+                                     base_model=floating_ips,
+                                     read_deleted="no").\
+                             filter_by(address=address)
+        conditions.append(fixed_ips.address == address)
+        conditions.append(fixed_ips.id.in_(floating_query.subquery()))
+    if regexp is not None:
+        regexp_op = _get_regexp_op()
+        if regexp_op == 'LIKE' or not _PORTABLE_IP_REGEXP_RE.match(regexp):
+            # NOTE: the backend can't be trusted to match this pattern the
+            # way python does, leave every allocated address to the caller.
+            conditions = None
+        else:
+            fixed_column = fixed_ips.address
+            floating_column = floating_ips.address
+            if regexp_op == '~':
+                # NOTE: inet values are compared without their netmask.
+                fixed_column = func.host(fixed_column)
+                floating_column = func.host(floating_column)
+            # NOTE: python matches the start of the address only.
+            anchored = '^(%s)' % regexp
+            floating_query = model_query(context, floating_ips.fixed_ip_id,
+                                         base_model=floating_ips,
+                                         read_deleted="no").\
+                filter(floating_column.op(regexp_op)(anchored))
+            conditions.append(fixed_column.op(regexp_op)(anchored))
+            conditions.append(fixed_ips.id.in_(floating_query.subquery()))
+
+    if conditions == []:
+        return []
+
+    query = model_query(context, fixed_ips, read_deleted="no").\
+                filter(fixed_ips.virtual_interface_id != None).\
+                filter(fixed_ips.instance_uuid != None)
+    if conditions:
+        query = query.filter(or_(*conditions))
+    return query.order_by(fixed_ips.virtual_interface_id, fixed_ips.id).all()
+
+
 @require_context
 def fixed_ip_update(context, address, values):
     session = get_session()
@@ -1851,13 +1927,103 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                          vm_state is SOFT_DELETED.
     """
 
-    sort_fn = {'desc': desc, 'asc': asc}
+    if CONF.database.slave_connection == '':
+        use_slave = False
+
+    session = get_session(use_slave=use_slave)
+
+    query_prefix, manual_joins = _instances_by_filters_query(context,
+            session, filters, sort_key, sort_dir, columns_to_join)
+
+    # paginate query
+    if marker is not None:
+        try:
+            marker = _instance_get_by_uuid(context, marker, session=session)
+        except exception.InstanceNotFound:
+            raise exception.MarkerNotFound(marker)
+    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
+                           models.Instance, limit,
+                           [sort_key, 'created_at', 'id'],
+                           marker=marker,
+                           sort_dir=sort_dir)
+
+    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+
+
+@require_context
+def instance_get_all_by_filters_iter(context, filters, sort_key, sort_dir,
+                                     limit=None, marker=None,
+                                     columns_to_join=None, chunk_size=500,
+                                     use_slave=False):
+    """Iterate over the instances that match all filters.
+
+    Takes the same filters as instance_get_all_by_filters(), but instances
+    are read chunk_size at a time, each chunk starting after the last
+    instance of the previous one (keyset pagination on sort_key and id).
+    Metadata and system_metadata are loaded once per chunk, so only one
+    chunk is held in memory at a time.
+
+    All chunks are read through a single session, which stays open until
+    the iterator is exhausted or discarded; callers should consume it
+    promptly rather than hold it across unrelated work.
+    """
 
     if CONF.database.slave_connection == '':
         use_slave = False
 
     session = get_session(use_slave=use_slave)
 
+    query_prefix, manual_joins = _instances_by_filters_query(context,
+            session, filters, sort_key, sort_dir, columns_to_join)
+
+    # Look up the marker now so a bad one is reported by this call rather
+    # than on the first iteration.
+    if marker is not None:
+        try:
+            marker = _instance_get_by_uuid(context, marker, session=session)
+        except exception.InstanceNotFound:
+            raise exception.MarkerNotFound(marker)
+
+    return _instances_iter_chunks(context, query_prefix, manual_joins,
+                                  sort_key, sort_dir, limit, marker,
+                                  chunk_size, use_slave)
+
+
+def _instances_iter_chunks(context, query_prefix, manual_joins, sort_key,
+                           sort_dir, limit, marker, chunk_size, use_slave):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        if remaining is None:
+            num = chunk_size
+        else:
+            num = min(chunk_size, remaining)
+        chunk = sqlalchemyutils.paginate_query(query_prefix,
+                                               models.Instance, num,
+                                               [sort_key, 'id'],
+                                               marker=marker,
+                                               sort_dir=sort_dir).all()
+        if not chunk:
+            return
+        marker = chunk[-1]
+        for instance in _instances_fill_metadata(context, chunk,
+                                                 manual_joins,
+                                                 use_slave=use_slave):
+            yield instance
+        if len(chunk) < num:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+
+
+def _instances_by_filters_query(context, session, filters, sort_key,
+                                sort_dir, columns_to_join):
+    """Build the query of instance_get_all_by_filters(), without pagination.
+
+    Returns the query and the list of tables to join manually with
+    _instances_fill_metadata().
+    """
+    sort_fn = {'desc': desc, 'asc': asc}
+
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
         manual_joins = ['metadata', 'system_metadata']
@@ -1936,19 +2102,7 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               models.InstanceMetadata.instance_uuid,
                               filters)
 
-    # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
-
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return query_prefix, manual_joins
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -2009,6 +2163,20 @@ def tag_filter(context, query, model, model_metadata,
     return query
 
 
+def _get_regexp_op():
+    """Return the SQL operator matching a column against a regexp.
+
+    'LIKE' is returned for backends with no regexp support.
+    """
+    regexp_op_map = {
+        'postgresql': '~',
+        'mysql': 'REGEXP',
+        'sqlite': 'REGEXP'
+    }
+    db_string = CONF.database.connection.split(':')[0].split('+')[0]
+    return regexp_op_map.get(db_string, 'LIKE')
+
+
 def regex_filter(query, model, filters):
     """Applies regular expression filtering to a query.
 
@@ -2019,13 +2187,7 @@ def regex_filter(query, model, filters):
     :param filters: dictionary of filters with regex values
     """
 
-    regexp_op_map = {
-        'postgresql': '~',
-        'mysql': 'REGEXP',
-        'sqlite': 'REGEXP'
-    }
-    db_string = CONF.database.connection.split(':')[0].split('+')[0]
-    db_regexp_op = regexp_op_map.get(db_string, 'LIKE')
+    db_regexp_op = _get_regexp_op()
     for filter_name in filters.iterkeys():
         try:
             column_attr = getattr(model, filter_name)
@@ -3059,19 +3221,16 @@ def _get_project_quota_usages(context, session, project_id):
     return result
 
 
-@require_context
-@_retry_on_deadlock
-def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
-                  expire, until_refresh, max_age, project_id=None,
-                  user_id=None):
-    elevated = context.elevated()
-    session = get_session()
-    with session.begin():
+def _quota_reserve(context, session, resources, project_quotas, user_quotas,
+                   deltas, expire, until_refresh, max_age, project_id,
+                   user_id):
+    """Reserve quota in the transaction of the given session.
 
-        if project_id is None:
-            project_id = context.project_id
-        if user_id is None:
-            user_id = context.user_id
+    Raises OverQuota from within that transaction, so that the caller
+    rolls back the usage refreshes made for the request.
+    """
+    elevated = context.elevated()
+    with session.begin(subtransactions=True):
 
         # Get the current usages
         user_usages = _get_user_quota_usages(context, session,
@@ -3114,8 +3273,9 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
                 user_usages[resource].until_refresh -= 1
                 if user_usages[resource].until_refresh <= 0:
                     refresh = True
-            elif max_age and (user_usages[resource].updated_at -
-                              timeutils.utcnow()).seconds >= max_age:
+            elif max_age and timeutils.delta_seconds(
+                    user_usages[resource].updated_at,
+                    timeutils.utcnow()) >= max_age:
                 refresh = True
 
             # OK, refresh the usage
@@ -3270,6 +3430,60 @@ def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
     return reservations
 
 
+@require_context
+@_retry_on_deadlock
+def quota_reserve(context, resources, project_quotas, user_quotas, deltas,
+                  expire, until_refresh, max_age, project_id=None,
+                  user_id=None):
+    if project_id is None:
+        project_id = context.project_id
+    if user_id is None:
+        user_id = context.user_id
+
+    session = get_session()
+    with session.begin():
+        return _quota_reserve(context, session, resources, project_quotas,
+                              user_quotas, deltas, expire, until_refresh,
+                              max_age, project_id, user_id)
+
+
+@require_context
+@_retry_on_deadlock
+def quota_reserve_batch(context, resources, requests, until_refresh,
+                        max_age, project_id=None):
+    if project_id is None:
+        project_id = context.project_id
+
+    # NOTE: the first request locks the quota_usages rows of the project
+    #       until the commit, the following ones don't wait on them. A
+    #       request that doesn't fit rolls the transaction back, and the
+    #       batch is made again without it, so it leaves no changes behind.
+    results = [None] * len(requests)
+    remaining = range(len(requests))
+    while remaining:
+        session = get_session()
+        try:
+            with session.begin():
+                for index in remaining:
+                    request = requests[index]
+                    reservations = _quota_reserve(request['context'],
+                                                  session, resources,
+                                                  request['project_quotas'],
+                                                  request['user_quotas'],
+                                                  request['deltas'],
+                                                  request['expire'],
+                                                  until_refresh, max_age,
+                                                  project_id,
+                                                  request['user_id'])
+                    results[index] = (reservations, None)
+        except exception.OverQuota as error:
+            results[index] = (None, error)
+            remaining.remove(index)
+        else:
+            break
+    return results
+
+
 def _quota_reservations_query(session, context, reservations):
     """Return the relevant reservations."""
 
@@ -4821,6 +5035,73 @@ def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
             pass
 
 
+def _bw_usage_add_counter(usage, counter, last_counter):
+    """Return usage plus the traffic counted since last_counter."""
+    if last_counter is None:
+        return usage
+    if counter < last_counter:
+        # counter rollover
+        return usage + counter
+    return usage + counter - last_counter
+
+
+@require_context
+@_retry_on_deadlock
+def bw_usage_update_many(context, start_period, prev_period, bw_counters,
+                         last_refreshed=None):
+    if last_refreshed is None:
+        last_refreshed = timeutils.utcnow()
+
+    session = get_session()
+    with session.begin():
+        uuids = set(bw_ctr['uuid'] for bw_ctr in bw_counters)
+        rows = model_query(context, models.BandwidthUsage,
+                           session=session, read_deleted="yes").\
+                       filter(models.BandwidthUsage.uuid.in_(uuids)).\
+                       filter(models.BandwidthUsage.start_period.in_(
+                           [start_period, prev_period])).\
+                       all()
+        usages = dict(((row.uuid, row.mac, row.start_period), row)
+                      for row in rows)
+
+        updates = []
+        for bw_ctr in bw_counters:
+            key = (bw_ctr['uuid'], bw_ctr['mac_address'])
+            bwusage = usages.get(key + (start_period,))
+            # The counters of the previous period are the starting point
+            # of a new one.
+            last = bwusage or usages.get(key + (prev_period,))
+            bw_in = bwusage.bw_in if bwusage else 0
+            bw_out = bwusage.bw_out if bwusage else 0
+            if last:
+                bw_in = _bw_usage_add_counter(bw_in, bw_ctr['bw_in'],
+                                              last.last_ctr_in)
+                bw_out = _bw_usage_add_counter(bw_out, bw_ctr['bw_out'],
+                                               last.last_ctr_out)
+
+            if bwusage is None:
+                bwusage = models.BandwidthUsage()
+                bwusage.start_period = start_period
+                bwusage.uuid = bw_ctr['uuid']
+                bwusage.mac = bw_ctr['mac_address']
+                session.add(bwusage)
+                usages[key + (start_period,)] = bwusage
+            bwusage.last_refreshed = last_refreshed
+            bwusage.bw_in = bw_in
+            bwusage.bw_out = bw_out
+            bwusage.last_ctr_in = bw_ctr['bw_in']
+            bwusage.last_ctr_out = bw_ctr['bw_out']
+            updates.append({'uuid': bw_ctr['uuid'],
+                            'mac': bw_ctr['mac_address'],
+                            'start_period': start_period,
+                            'bw_in': bw_in,
+                            'bw_out': bw_out,
+                            'last_ctr_in': bw_ctr['bw_in'],
+                            'last_ctr_out': bw_ctr['bw_out'],
+                            'last_refreshed': last_refreshed})
+    return updates
+
+
 ####################
 
 
@@ -4836,6 +5117,103 @@ def vol_get_usage_by_time(context, begin):
                               all()
 
 
+def _vol_usage_update(session, current_usage, id, rd_req, rd_bytes, wr_req,
+                      wr_bytes, instance_id, project_id, user_id,
+                      availability_zone, update_totals, refreshed):
+    """Update current_usage, or create it if None, within session."""
+    values = {}
+    # NOTE(dricco): We will be mostly updating current usage records vs
+    # updating total or creating records. Optimize accordingly.
+    if not update_totals:
+        values = {'curr_last_refreshed': refreshed,
+                  'curr_reads': rd_req,
+                  'curr_read_bytes': rd_bytes,
+                  'curr_writes': wr_req,
+                  'curr_write_bytes': wr_bytes,
+                  'instance_uuid': instance_id,
+                  'project_id': project_id,
+                  'user_id': user_id,
+                  'availability_zone': availability_zone}
+    else:
+        values = {'tot_last_refreshed': refreshed,
+                  'tot_reads': models.VolumeUsage.tot_reads + rd_req,
+                  'tot_read_bytes': models.VolumeUsage.tot_read_bytes +
+                                    rd_bytes,
+                  'tot_writes': models.VolumeUsage.tot_writes + wr_req,
+                  'tot_write_bytes': models.VolumeUsage.tot_write_bytes +
+                                     wr_bytes,
+                  'curr_reads': 0,
+                  'curr_read_bytes': 0,
+                  'curr_writes': 0,
+                  'curr_write_bytes': 0,
+                  'instance_uuid': instance_id,
+                  'project_id': project_id,
+                  'user_id': user_id,
+                  'availability_zone': availability_zone}
+
+    if current_usage:
+        if (rd_req < current_usage['curr_reads'] or
+            rd_bytes < current_usage['curr_read_bytes'] or
+            wr_req < current_usage['curr_writes'] or
+                wr_bytes < current_usage['curr_write_bytes']):
+            LOG.info(_("Volume(%s) has lower stats then what is in "
+                       "the database. Instance must have been rebooted "
+                       "or crashed. Updating totals.") % id)
+            if not update_totals:
+                values['tot_reads'] = (models.VolumeUsage.tot_reads +
+                                       current_usage['curr_reads'])
+                values['tot_read_bytes'] = (
+                    models.VolumeUsage.tot_read_bytes +
+                    current_usage['curr_read_bytes'])
+                values['tot_writes'] = (models.VolumeUsage.tot_writes +
+                                        current_usage['curr_writes'])
+                values['tot_write_bytes'] = (
+                    models.VolumeUsage.tot_write_bytes +
+                    current_usage['curr_write_bytes'])
+            else:
+                values['tot_reads'] = (models.VolumeUsage.tot_reads +
+                                       current_usage['curr_reads'] +
+                                       rd_req)
+                values['tot_read_bytes'] = (
+                    models.VolumeUsage.tot_read_bytes +
+                    current_usage['curr_read_bytes'] + rd_bytes)
+                values['tot_writes'] = (models.VolumeUsage.tot_writes +
+                                        current_usage['curr_writes'] +
+                                        wr_req)
+                values['tot_write_bytes'] = (
+                    models.VolumeUsage.tot_write_bytes +
+                    current_usage['curr_write_bytes'] + wr_bytes)
+
+        current_usage.update(values)
+        current_usage.save(session=session)
+        session.refresh(current_usage)
+        return current_usage
+
+    vol_usage = models.VolumeUsage()
+    vol_usage.volume_id = id
+    vol_usage.instance_uuid = instance_id
+    vol_usage.project_id = project_id
+    vol_usage.user_id = user_id
+    vol_usage.availability_zone = availability_zone
+
+    if not update_totals:
+        vol_usage.curr_last_refreshed = refreshed
+        vol_usage.curr_reads = rd_req
+        vol_usage.curr_read_bytes = rd_bytes
+        vol_usage.curr_writes = wr_req
+        vol_usage.curr_write_bytes = wr_bytes
+    else:
+        vol_usage.tot_last_refreshed = refreshed
+        vol_usage.tot_reads = rd_req
+        vol_usage.tot_read_bytes = rd_bytes
+        vol_usage.tot_writes = wr_req
+        vol_usage.tot_write_bytes = wr_bytes
+
+    vol_usage.save(session=session)
+
+    return vol_usage
+
+
 @require_context
 def vol_usage_update(context, id, rd_req, rd_bytes, wr_req, wr_bytes,
                      instance_id, project_id, user_id, availability_zone,
@@ -4845,101 +5223,41 @@ def vol_usage_update(context, id, rd_req, rd_bytes, wr_req, wr_bytes,
     refreshed = timeutils.utcnow()
 
     with session.begin():
-        values = {}
-        # NOTE(dricco): We will be mostly updating current usage records vs
-        # updating total or creating records. Optimize accordingly.
-        if not update_totals:
-            values = {'curr_last_refreshed': refreshed,
-                      'curr_reads': rd_req,
-                      'curr_read_bytes': rd_bytes,
-                      'curr_writes': wr_req,
-                      'curr_write_bytes': wr_bytes,
-                      'instance_uuid': instance_id,
-                      'project_id': project_id,
-                      'user_id': user_id,
-                      'availability_zone': availability_zone}
-        else:
-            values = {'tot_last_refreshed': refreshed,
-                      'tot_reads': models.VolumeUsage.tot_reads + rd_req,
-                      'tot_read_bytes': models.VolumeUsage.tot_read_bytes +
-                                        rd_bytes,
-                      'tot_writes': models.VolumeUsage.tot_writes + wr_req,
-                      'tot_write_bytes': models.VolumeUsage.tot_write_bytes +
-                                         wr_bytes,
-                      'curr_reads': 0,
-                      'curr_read_bytes': 0,
-                      'curr_writes': 0,
-                      'curr_write_bytes': 0,
-                      'instance_uuid': instance_id,
-                      'project_id': project_id,
-                      'user_id': user_id,
-                      'availability_zone': availability_zone}
-
         current_usage = model_query(context, models.VolumeUsage,
                             session=session, read_deleted="yes").\
                             filter_by(volume_id=id).\
                             first()
-        if current_usage:
-            if (rd_req < current_usage['curr_reads'] or
-                rd_bytes < current_usage['curr_read_bytes'] or
-                wr_req < current_usage['curr_writes'] or
-                    wr_bytes < current_usage['curr_write_bytes']):
-                LOG.info(_("Volume(%s) has lower stats then what is in "
-                           "the database. Instance must have been rebooted "
-                           "or crashed. Updating totals.") % id)
-                if not update_totals:
-                    values['tot_reads'] = (models.VolumeUsage.tot_reads +
-                                           current_usage['curr_reads'])
-                    values['tot_read_bytes'] = (
-                        models.VolumeUsage.tot_read_bytes +
-                        current_usage['curr_read_bytes'])
-                    values['tot_writes'] = (models.VolumeUsage.tot_writes +
-                                            current_usage['curr_writes'])
-                    values['tot_write_bytes'] = (
-                        models.VolumeUsage.tot_write_bytes +
-                        current_usage['curr_write_bytes'])
-                else:
-                    values['tot_reads'] = (models.VolumeUsage.tot_reads +
-                                           current_usage['curr_reads'] +
-                                           rd_req)
-                    values['tot_read_bytes'] = (
-                        models.VolumeUsage.tot_read_bytes +
-                        current_usage['curr_read_bytes'] + rd_bytes)
-                    values['tot_writes'] = (models.VolumeUsage.tot_writes +
-                                            current_usage['curr_writes'] +
-                                            wr_req)
-                    values['tot_write_bytes'] = (
-                        models.VolumeUsage.tot_write_bytes +
-                        current_usage['curr_write_bytes'] + wr_bytes)
-
-            current_usage.update(values)
-            current_usage.save(session=session)
-            session.refresh(current_usage)
-            return current_usage
-
-        vol_usage = models.VolumeUsage()
-        vol_usage.volume_id = id
-        vol_usage.instance_uuid = instance_id
-        vol_usage.project_id = project_id
-        vol_usage.user_id = user_id
-        vol_usage.availability_zone = availability_zone
-
-        if not update_totals:
-            vol_usage.curr_last_refreshed = refreshed
-            vol_usage.curr_reads = rd_req
-            vol_usage.curr_read_bytes = rd_bytes
-            vol_usage.curr_writes = wr_req
-            vol_usage.curr_write_bytes = wr_bytes
-        else:
-            vol_usage.tot_last_refreshed = refreshed
-            vol_usage.tot_reads = rd_req
-            vol_usage.tot_read_bytes = rd_bytes
-            vol_usage.tot_writes = wr_req
-            vol_usage.tot_write_bytes = wr_bytes
+        return _vol_usage_update(session, current_usage, id, rd_req,
+                                 rd_bytes, wr_req, wr_bytes, instance_id,
+                                 project_id, user_id, availability_zone,
+                                 update_totals, refreshed)
 
-        vol_usage.save(session=session)
 
-        return vol_usage
+@require_context
+def vol_usage_update_many(context, vol_usages):
+    session = get_session()
+
+    refreshed = timeutils.utcnow()
+
+    with session.begin():
+        volume_ids = set(usage['volume_id'] for usage in vol_usages)
+        rows = model_query(context, models.VolumeUsage,
+                           session=session, read_deleted="yes").\
+                       filter(models.VolumeUsage.volume_id.in_(volume_ids)).\
+                       all()
+        current_usages = dict((row.volume_id, row) for row in rows)
+
+        updated = []
+        for usage in vol_usages:
+            vol_usage = _vol_usage_update(
+                session, current_usages.get(usage['volume_id']),
+                usage['volume_id'], usage['rd_req'], usage['rd_bytes'],
+                usage['wr_req'], usage['wr_bytes'], usage['instance_id'],
+                usage['project_id'], usage['user_id'],
+                usage['availability_zone'], False, refreshed)
+            current_usages[usage['volume_id']] = vol_usage
+            updated.append(vol_usage)
+        return updated
 
 
 ####################
@@ -5170,6 +5488,29 @@ def aggregate_get_all(context):
     return _aggregate_get_query(context, models.Aggregate).all()
 
 
+def aggregate_get_all_changed_since(context, changed_since):
+    aggregate_ids = set()
+    for model, id_column in ((models.Aggregate, models.Aggregate.id),
+            (models.AggregateHost, models.AggregateHost.aggregate_id),
+            (models.AggregateMetadata,
+             models.AggregateMetadata.aggregate_id)):
+        rows = model_query(context, id_column, base_model=model,
+                           read_deleted='yes').\
+                    filter(or_(model.created_at >= changed_since,
+                               model.updated_at >= changed_since,
+                               model.deleted_at >= changed_since)).\
+                    distinct().\
+                    all()
+        aggregate_ids.update(row[0] for row in rows)
+
+    if not aggregate_ids:
+        return []
+    return _aggregate_get_query(context, models.Aggregate,
+                                read_deleted='yes').\
+                filter(models.Aggregate.id.in_(aggregate_ids)).\
+                all()
+
+
 def _aggregate_metadata_get_query(context, aggregate_id, session=None,
                                   read_deleted="yes"):
     return model_query(context,
@@ -17,6 +17,8 @@
 Filter support
 """
 
+import time
+
 from nova import loadables
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
@@ -65,7 +67,17 @@ class BaseFilterHandler(loadables.BaseLoader):
     """
 
     def get_filtered_objects(self, filter_classes, objs,
-            filter_properties, index=0):
+            filter_properties, index=0, filter_cache=None, trace=None):
+        """Return the objects passing every filter.
+
+        filter_cache is an optional object providing a filter_all(filter,
+        objs, filter_properties) method, used instead of the filter's own
+        filter_all() to reuse results across calls for the same request.
+        Its hits attribute, if any, counts the results it reused.
+
+        trace is an optional object whose add_step() method is called
+        with the wall time and object counts of every filter run.
+        """
         list_objs = list(objs)
         LOG.debug(_("Starting with %d host(s)"), len(list_objs))
         for filter_cls in filter_classes:
@@ -73,13 +85,25 @@ class BaseFilterHandler(loadables.BaseLoader):
             filter = filter_cls()
 
             if filter.run_filter_for_index(index):
-                objs = filter.filter_all(list_objs,
-                                               filter_properties)
+                if trace is not None:
+                    start = time.time()
+                    num_in = len(list_objs)
+                    hits = getattr(filter_cache, 'hits', 0)
+                if filter_cache is not None:
+                    objs = filter_cache.filter_all(filter, list_objs,
+                                                   filter_properties)
+                else:
+                    objs = filter.filter_all(list_objs,
+                                                   filter_properties)
                 if objs is None:
                     LOG.debug(_("Filter %(cls_name)s says to stop filtering"),
                           {'cls_name': cls_name})
                     return
                 list_objs = list(objs)
+                if trace is not None:
+                    trace.add_step('filter', cls_name, time.time() - start,
+                                   num_in, len(list_objs),
+                                   getattr(filter_cache, 'hits', 0) - hits)
                 if not list_objs:
                     LOG.info(_("Filter %s returned 0 hosts"), cls_name)
                     break
@@ -0,0 +1,170 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import hashlib
+import logging
+import os
+import random
+import urllib2
+
+from oslo.config import cfg
+
+from nova import exception
+import nova.image.download.base as xfer_base
+from nova.openstack.common import fileutils
+from nova.openstack.common.gettextutils import _
+from nova import servicegroup
+import nova.virt.libvirt.imagecache as lv_imagecache
+
+
+CONF = cfg.CONF
+LOG = logging.getLogger(__name__)
+
+peer_opts = [
+    cfg.IntOpt('port',
+               default=9294,
+               help=_('Port on which compute nodes serve the files of '
+                      'their image cache over HTTP')),
+    cfg.StrOpt('path',
+               default='/',
+               help=_('URL path under which compute nodes serve the files '
+                      'of their image cache')),
+    cfg.IntOpt('max_peers',
+               default=3,
+               help=_('Number of compute nodes asked for an image before '
+                      'falling back to glance')),
+    cfg.IntOpt('timeout',
+               default=10,
+               help=_('Seconds to wait for a compute node to answer')),
+    cfg.IntOpt('chunk_size',
+               default=64 * 1024,
+               help=_('Size in bytes of the chunks read from a compute '
+                      'node')),
+]
+CONF.register_opts(peer_opts, group='image_peer')
+CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
+CONF.import_opt('host', 'nova.netconf')
+CONF.import_opt('force_raw_images', 'nova.virt.images')
+
+
+#  This module fetches images from the image cache of other compute nodes
+#  instead of glance. It is used when 'peer' is in the
+#  allowed_direct_url_schemes list.
+#
+#  Each compute node must serve the files of its image cache directory
+#  (instances_path/_base) read only over HTTP, for example with a web
+#  server pointed at it, on [image_peer] port under [image_peer] path.
+#
+#  The compute nodes asked are picked at random among the ones the
+#  servicegroup API reports as up. Their copy is only kept if its MD5
+#  matches the checksum glance has for the image. With force_raw_images
+#  set, compute nodes cache images of any other disk format converted to
+#  raw, so no copy could match and peers are not asked for those at all.
+
+
+class PeerTransfer(xfer_base.TransferBase):
+
+    def __init__(self):
+        self.servicegroup_api = servicegroup.API()
+
+    def _get_peers(self):
+        hosts = self.servicegroup_api.get_all(CONF.compute_topic) or []
+        peers = [host for host in hosts if host != CONF.host]
+        random.shuffle(peers)
+        return peers[:CONF.image_peer.max_peers]
+
+    def _get_url(self, host, image_id):
+        fname = lv_imagecache.get_cache_fname({'image_id': image_id},
+                                              'image_id')
+        path = CONF.image_peer.path
+        if not path.endswith('/'):
+            path += '/'
+        return 'http://%s:%d%s%s' % (host, CONF.image_peer.port, path, fname)
+
+    def _fetch(self, url, dst_path, checksum):
+        """Stream url to dst_path and return the SHA1 of the data.
+
+        Returns None, removing dst_path, if the MD5 of the data isn't
+        checksum.
+        """
+        md5 = hashlib.md5()
+        sha1 = hashlib.sha1()
+        with fileutils.remove_path_on_error(dst_path):
+            with contextlib.closing(urllib2.urlopen(
+                    url, timeout=CONF.image_peer.timeout)) as response:
+                with open(dst_path, 'wb') as f:
+                    for chunk in iter(lambda: response.read(
+                            CONF.image_peer.chunk_size), b''):
+                        md5.update(chunk)
+                        sha1.update(chunk)
+                        f.write(chunk)
+
+        if md5.hexdigest() != checksum:
+            LOG.warn(_('Checksum of %(url)s does not match %(checksum)s'),
+                     {'url': url, 'checksum': checksum})
+            os.unlink(dst_path)
+            return None
+        return sha1.hexdigest()
+
+    def download(self, context, url_parts, dst_file, metadata, **kwargs):
+        """Fetch an image from the image cache of another compute node.
+
+        url_parts is of the form peer://<image id> and metadata must hold
+        the glance checksum and disk format of the image. Returns the SHA1
+        hex digest of the data written.
+        """
+        image_id = url_parts.netloc
+        checksum = metadata.get('checksum')
+        if not checksum:
+            msg = _('The image %s has no checksum to verify copies '
+                    'against.') % image_id
+            raise exception.ImageDownloadModuleMetaDataError(
+                module=str(self), reason=msg)
+        if CONF.force_raw_images and metadata.get('disk_format') != 'raw':
+            msg = _('The image %s is cached converted to raw by compute '
+                    'nodes.') % image_id
+            raise exception.ImageDownloadModuleError(module=str(self),
+                                                     reason=msg)
+
+        for host in self._get_peers():
+            url = self._get_url(host, image_id)
+            try:
+                sha1 = self._fetch(url, dst_file, checksum)
+            except urllib2.HTTPError as ex:
+                LOG.debug(_('Image %(image_id)s not available from '
+                            '%(host)s: %(ex)s'),
+                          {'image_id': image_id, 'host': host, 'ex': ex})
+                continue
+            except (urllib2.URLError, IOError) as ex:
+                LOG.info(_('Unable to fetch image %(image_id)s from '
+                           '%(host)s: %(ex)s'),
+                         {'image_id': image_id, 'host': host, 'ex': ex})
+                continue
+            if sha1 is not None:
+                LOG.info(_('Copied image %(image_id)s from %(host)s'),
+                         {'image_id': image_id, 'host': host})
+                return sha1
+
+        msg = _('No compute node had a valid copy of image %s.') % image_id
+        raise exception.ImageDownloadModuleError(module=str(self), reason=msg)
+
+
+def get_download_handler(**kwargs):
+    return PeerTransfer()
+
+
+def get_schemes():
+    return ['peer']
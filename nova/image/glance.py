@@ -17,13 +17,18 @@
 
 from __future__ import absolute_import
 
+import contextlib
 import copy
+import hashlib
 import itertools
 import json
 import random
 import sys
 import time
 
+import eventlet
+from eventlet import semaphore
+from eventlet import tpool
 import glanceclient
 import glanceclient.exc
 from oslo.config import cfg
@@ -32,6 +37,7 @@ import six.moves.urllib.parse as urlparse
 
 from nova import exception
 import nova.image.download as image_xfers
+from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
@@ -67,6 +73,15 @@ glance_opts = [
                 help='A list of url scheme that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
                      '[file].'),
+    cfg.IntOpt('glance_download_write_size',
+               default=4 * 1024 * 1024,
+               help='Size in bytes of the writes done when saving an image '
+                    'downloaded from glance, should be a multiple of the '
+                    'disk block size'),
+    cfg.IntOpt('glance_max_concurrent_downloads',
+               default=4,
+               help='Maximum number of images downloaded from glance to '
+                    'disk at the same time, 0 means no limit'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -307,7 +322,13 @@ class GlanceImageService(object):
         return
 
     def download(self, context, image_id, data=None, dst_path=None):
-        """Calls out to Glance for data and writes data."""
+        """Calls out to Glance for data and writes data.
+
+        Returns an iterator over the image data if neither data nor
+        dst_path are given. Otherwise returns the SHA1 hex digest of the
+        data written, or None if it was transferred directly from one of
+        the image locations.
+        """
         if CONF.allowed_direct_url_schemes and dst_path is not None:
             locations = self._get_locations(context, image_id)
             for entry in locations:
@@ -325,25 +346,53 @@ class GlanceImageService(object):
                     except Exception as ex:
                         LOG.exception(ex)
 
-        try:
-            image_chunks = self._client.call(context, 1, 'data', image_id)
-        except Exception:
-            _reraise_translated_image_exception(image_id)
+        if data is None and not dst_path:
+            try:
+                return self._client.call(context, 1, 'data', image_id)
+            except Exception:
+                _reraise_translated_image_exception(image_id)
 
-        close_file = False
-        if data is None and dst_path:
-            data = open(dst_path, 'wb')
-            close_file = True
+        if dst_path is not None and self._get_transfer_module('peer'):
+            checksum = self._download_from_peers(context, image_id, dst_path)
+            if checksum is not None:
+                return checksum
 
-        if data is None:
-            return image_chunks
-        else:
+        with _download_slot():
             try:
-                for chunk in image_chunks:
-                    data.write(chunk)
-            finally:
-                if close_file:
-                    data.close()
+                image_chunks = self._client.call(context, 1, 'data',
+                                                 image_id)
+            except Exception:
+                _reraise_translated_image_exception(image_id)
+
+            if data is not None:
+                return _write_image_chunks(image_chunks, data.write)
+
+            with open(dst_path, 'wb') as data:
+                return _write_image_chunks(image_chunks, data.write,
+                                           overlap=True)
+
+    def _download_from_peers(self, context, image_id, dst_path):
+        """Copy the image from the image cache of another compute node.
+
+        Returns the SHA1 hex digest of the data written, or None if no
+        compute node had a copy matching the glance checksum.
+        """
+        image_meta = self.show(context, image_id)
+        xfer_mod = self._get_transfer_module('peer')
+        try:
+            with _download_slot():
+                return xfer_mod.download(context,
+                                         urlparse.urlparse('peer://%s' %
+                                                           image_id),
+                                         dst_path,
+                                         {'checksum':
+                                              image_meta.get('checksum'),
+                                          'disk_format':
+                                              image_meta.get('disk_format')})
+        except exception.ImageDownloadModuleError as ex:
+            LOG.info(_("Falling back to glance for image %(image_id)s: "
+                       "%(ex)s"), {'image_id': image_id, 'ex': ex})
+        return None
 
     def create(self, context, image_meta, data=None):
         """Store the image data and return the new image object."""
@@ -395,6 +444,77 @@ class GlanceImageService(object):
         return True
 
 
+_download_semaphore = None
+
+
+@contextlib.contextmanager
+def _download_slot():
+    """Wait for one of CONF.glance_max_concurrent_downloads to be free."""
+    global _download_semaphore
+    if CONF.glance_max_concurrent_downloads <= 0:
+        yield
+        return
+    if _download_semaphore is None:
+        _download_semaphore = semaphore.Semaphore(
+                CONF.glance_max_concurrent_downloads)
+    with _download_semaphore:
+        yield
+
+
+def _write_image_chunks(image_chunks, write, overlap=False):
+    """Write image chunks and return the SHA1 hex digest of their data.
+
+    Chunks are gathered into writes of CONF.glance_download_write_size
+    bytes, so every write but the last starts at a multiple of that size.
+    If overlap is True the hashing and writing of each buffer is done in
+    a native thread while the next buffer is read.
+    """
+    checksum = hashlib.sha1()
+    write_size = max(CONF.glance_download_write_size, 1)
+
+    def hash_and_write(buf):
+        checksum.update(buf)
+        write(buf)
+
+    writer = None
+    pending = []
+    pending_size = 0
+    try:
+        for chunk in image_chunks:
+            pending.append(chunk)
+            pending_size += len(chunk)
+            if pending_size < write_size:
+                continue
+
+            buf = b''.join(pending)
+            end = pending_size - pending_size % write_size
+            pending = [buf[end:]]
+            pending_size -= end
+            if writer is not None:
+                # Raises the error of the previous write, if any.
+                writer, previous = None, writer
+                previous.wait()
+            if overlap:
+                writer = eventlet.spawn(tpool.execute, hash_and_write,
+                                        buf[:end])
+            else:
+                hash_and_write(buf[:end])
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            # Don't leave a write running on a file about to be closed.
+            if writer is not None:
+                try:
+                    writer.wait()
+                except Exception:
+                    pass
+
+    if writer is not None:
+        writer.wait()
+    if pending_size:
+        hash_and_write(b''.join(pending))
+    return checksum.hexdigest()
+
+
 def _extract_query_params(params):
     _params = {}
     accepted_params = ('filters', 'marker', 'limit',
@@ -51,15 +51,47 @@ This module provides Manager, a base class for managers.
 
 """
 
+import datetime
+import random
+import time
+
+import eventlet
 from oslo.config import cfg
 
 from nova.db import base
+from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
+from nova.openstack.common import timeutils
 from nova import rpc
 
 
+manager_opts = [
+    cfg.IntOpt('periodic_task_workers',
+               default=1,
+               help='Number of periodic tasks of a service which may run at '
+                    'the same time. With more than one, a long task no '
+                    'longer delays the others and a task still running '
+                    'when it is due again is skipped'),
+    cfg.IntOpt('periodic_task_budget',
+               default=0,
+               help='Number of seconds a periodic task is expected to run '
+                    'for. Runs taking longer are logged and counted as '
+                    'overruns. 0 disables the check'),
+    cfg.IntOpt('periodic_task_jitter',
+               default=0,
+               help='Maximum number of seconds randomly added to the '
+                    'interval of a periodic task after each run, so that '
+                    'services started together drift apart'),
+    cfg.IntOpt('periodic_task_report_interval',
+               default=600,
+               help='Interval in seconds for logging the number of runs, '
+                    'failures and overruns and the run times of each '
+                    'periodic task. 0 disables the report'),
+    ]
+
 CONF = cfg.CONF
+CONF.register_opts(manager_opts)
 CONF.import_opt('host', 'nova.netconf')
 LOG = logging.getLogger(__name__)
 
@@ -74,11 +106,126 @@ class Manager(base.Base, periodic_task.PeriodicTasks):
         self.service_name = service_name
         self.notifier = rpc.get_notifier(self.service_name, self.host)
         self.additional_endpoints = []
+        self._periodic_pool = eventlet.GreenPool(
+            max(CONF.periodic_task_workers, 1))
+        self._periodic_running = set()
+        self._periodic_task_stats = {}
+        self._periodic_stats_reported = timeutils.utcnow()
         super(Manager, self).__init__(db_driver)
 
     def periodic_tasks(self, context, raise_on_error=False):
-        """Tasks to be run at a periodic interval."""
-        return self.run_periodic_tasks(context, raise_on_error=raise_on_error)
+        """Tasks to be run at a periodic interval.
+
+        The tasks which are due are run in a pool of
+        CONF.periodic_task_workers greenthreads. With a single worker they
+        are run one after the other before returning, as before. With more,
+        the tasks still running are left to complete in the background and
+        are skipped until they have.
+
+        Returns the number of seconds until the next task is due.
+        """
+        idle_for = periodic_task.DEFAULT_INTERVAL
+        for task_name, task in self._periodic_tasks:
+            now = timeutils.utcnow()
+            spacing = self._periodic_spacing[task_name]
+            last_run = self._periodic_last_run[task_name]
+
+            # If a periodic task is _nearly_ due, then we'll run it early
+            if spacing is not None and last_run is not None:
+                due = last_run + datetime.timedelta(seconds=spacing)
+                if not timeutils.is_soon(due, 0.2):
+                    idle_for = min(idle_for, timeutils.delta_seconds(now, due))
+                    continue
+
+            if spacing is not None:
+                idle_for = min(idle_for, spacing)
+
+            if task_name in self._periodic_running:
+                LOG.debug(_("Skipping periodic task %s, its previous run "
+                            "has not completed"), task_name)
+                continue
+
+            jitter = random.uniform(0, max(CONF.periodic_task_jitter, 0))
+            self._periodic_last_run[task_name] = (
+                now + datetime.timedelta(seconds=jitter))
+
+            if raise_on_error:
+                self._run_periodic_task(context, task_name, task,
+                                        raise_on_error=True)
+            else:
+                self._periodic_running.add(task_name)
+                self._periodic_pool.spawn_n(self._run_periodic_task,
+                                            context, task_name, task)
+
+        if CONF.periodic_task_workers <= 1:
+            self._periodic_pool.waitall()
+
+        interval = CONF.periodic_task_report_interval
+        if (interval > 0 and timeutils.is_older_than(
+                self._periodic_stats_reported, interval)):
+            self._periodic_stats_reported = timeutils.utcnow()
+            self._report_periodic_task_stats()
+        return idle_for
+
+    def _run_periodic_task(self, context, task_name, task,
+                           raise_on_error=False):
+        full_task_name = '.'.join([self.__class__.__name__, task_name])
+        LOG.debug(_("Running periodic task %(full_task_name)s"),
+                  {"full_task_name": full_task_name})
+        start = time.time()
+        failed = False
+        try:
+            task(self, context)
+        except Exception as e:
+            failed = True
+            if raise_on_error:
+                raise
+            LOG.exception(_("Error during %(full_task_name)s: %(e)s"),
+                          {"full_task_name": full_task_name, "e": e})
+        finally:
+            self._periodic_running.discard(task_name)
+            self._record_periodic_task_run(full_task_name, task_name,
+                                           time.time() - start, failed)
+
+    def _record_periodic_task_run(self, full_task_name, task_name, elapsed,
+                                  failed):
+        stats = self._periodic_task_stats.setdefault(task_name,
+                {'runs': 0, 'failures': 0, 'overruns': 0,
+                 'last_time': 0.0, 'max_time': 0.0, 'total_time': 0.0})
+        stats['runs'] += 1
+        stats['last_time'] = elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        stats['total_time'] += elapsed
+        if failed:
+            stats['failures'] += 1
+
+        budget = CONF.periodic_task_budget
+        if budget > 0 and elapsed > budget:
+            stats['overruns'] += 1
+            LOG.warn(_("Periodic task %(full_task_name)s took %(elapsed).2f "
+                       "seconds, more than its budget of %(budget)d"),
+                     {'full_task_name': full_task_name, 'elapsed': elapsed,
+                      'budget': budget})
+
+    def get_periodic_task_stats(self):
+        """Return the number of runs, failures and overruns and the run
+        times of each periodic task since the service started.
+        """
+        return dict((task_name, dict(stats))
+                    for task_name, stats in self._periodic_task_stats.items())
+
+    def _report_periodic_task_stats(self):
+        for task_name, stats in sorted(
+                self.get_periodic_task_stats().items()):
+            LOG.info(_('Periodic task %(task_name)s: %(runs)d runs, '
+                       '%(failures)d failures, %(overruns)d overruns, '
+                       'last %(last).2f, max %(max).2f, average %(avg).2f '
+                       'seconds'),
+                     {'task_name': task_name, 'runs': stats['runs'],
+                      'failures': stats['failures'],
+                      'overruns': stats['overruns'],
+                      'last': stats['last_time'], 'max': stats['max_time'],
+                      'avg': stats['total_time'] / stats['runs']})
 
     def init_host(self):
         """Hook to do additional manager initialization when one requests
@@ -231,6 +231,23 @@ class NetworkAPI(base.Base):
         """Returns all network info related to an instance."""
         raise NotImplementedError()
 
+    def get_instances_nw_info(self, context, instances, **kwargs):
+        """Returns the network info of several instances and updates
+        their info_cache.
+
+        Returns a dict of network info by instance uuid. Instances whose
+        network info could not be retrieved are left out.
+        """
+        result = {}
+        for instance in instances:
+            try:
+                result[instance['uuid']] = self.get_instance_nw_info(
+                    context, instance, **kwargs)
+            except Exception:
+                LOG.exception(_('Failed to get network info'),
+                              instance=instance)
+        return result
+
     def validate_networks(self, context, requested_networks, num_instances):
         """validate the networks passed at the time of creating
         the server.
@@ -170,6 +170,24 @@ CONF.import_opt('my_ip', 'nova.netconf')
 CONF.import_opt('network_topic', 'nova.network.rpcapi')
 CONF.import_opt('fake_network', 'nova.network.linux_net')
 
+_EXACT_IPV4_FILTER_RE = re.compile(r'^\^?((?:[0-9]+\\\.){3}[0-9]+)\$$')
+
+
+def _get_ip_filter_address(ip_filter):
+    """Return the only IPv4 address an ip filter can match, if any.
+
+    That's the case for the '^10\\.0\\.0\\.1$' patterns the compute API
+    builds from a fixed_ip search option.
+    """
+    match = _EXACT_IPV4_FILTER_RE.match(ip_filter)
+    if match is None:
+        return None
+    address = match.group(1).replace('\\.', '.')
+    if not netaddr.valid_ipv4(address) or (
+            str(netaddr.IPAddress(address)) != address):
+        return None
+    return address
+
 
 class RPCAllocateFixedIP(object):
     """Mixin class originally for FlatDCHP and VLAN network managers.
@@ -409,52 +427,87 @@ class NetworkManager(manager.Manager):
         return []
 
     def get_instance_uuids_by_ip_filter(self, context, filters):
-        fixed_ip_filter = filters.get('fixed_ip')
-        ip_filter = re.compile(str(filters.get('ip')))
-        ipv6_filter = re.compile(str(filters.get('ip6')))
+        results = []
+        if filters.get('ip6') is not None:
+            results.extend(self._get_instance_uuids_by_ipv6_filter(
+                context, re.compile(str(filters['ip6']))))
+        if (filters.get('ip') is not None or
+                filters.get('fixed_ip') is not None):
+            results.extend(self._get_instance_uuids_by_ipv4_filter(
+                context, filters.get('ip'), filters.get('fixed_ip')))
+        return results
 
+    def _get_instance_uuids_by_ipv6_filter(self, context, ipv6_filter):
         # NOTE(jkoelker) Should probably figure out a better way to do
         #                this. But for now it "works", this could suck on
         #                large installs.
-
+        #                IPv6 addresses are derived from the vif mac, so
+        #                they can't be looked up in the database.
         vifs = vif_obj.VirtualInterfaceList.get_all(context)
+        networks = {}
         results = []
 
         for vif in vifs:
             if vif.instance_uuid is None:
                 continue
 
-            network = self._get_network_by_id(context, vif.network_id)
-            fixed_ipv6 = None
-            if network['cidr_v6'] is not None:
-                fixed_ipv6 = ipv6.to_global(network['cidr_v6'],
-                                            vif.address,
-                                            context.project_id)
-
-            if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
+            if vif.network_id not in networks:
+                networks[vif.network_id] = self._get_network_by_id(
+                    context, vif.network_id)
+            network = networks[vif.network_id]
+            if network['cidr_v6'] is None:
+                continue
+            fixed_ipv6 = ipv6.to_global(network['cidr_v6'],
+                                        vif.address,
+                                        context.project_id)
+            if ipv6_filter.match(fixed_ipv6):
                 results.append({'instance_uuid': vif.instance_uuid,
                                 'ip': fixed_ipv6})
+        return results
 
-            fixed_ips = fixed_ip_obj.FixedIPList.get_by_virtual_interface_id(
-                context, vif.id)
-            for fixed_ip in fixed_ips:
-                if not fixed_ip or not fixed_ip.address:
-                    continue
-                if str(fixed_ip.address) == fixed_ip_filter:
-                    results.append({'instance_uuid': vif.instance_uuid,
-                                    'ip': fixed_ip.address})
-                    continue
-                if ip_filter.match(str(fixed_ip.address)):
-                    results.append({'instance_uuid': vif.instance_uuid,
-                                    'ip': fixed_ip.address})
+    def _get_instance_uuids_by_ipv4_filter(self, context, ip_filter,
+                                           fixed_ip_filter):
+        # NOTE: fixed_ip is an exact address, and ip patterns which can
+        # only match a single address are looked up the same way, through
+        # the address indexes. Other patterns are matched by the database
+        # when it can and checked again here.
+        if (fixed_ip_filter is not None and
+                not netaddr.valid_ipv4(str(fixed_ip_filter))):
+            fixed_ip_filter = None
+        address = None
+        regexp = None
+        if ip_filter is not None:
+            address = _get_ip_filter_address(str(ip_filter))
+            if address is None:
+                regexp = str(ip_filter)
+        if fixed_ip_filter is None and address is None and regexp is None:
+            return []
+
+        if address is not None:
+            def ip_matches(ip):
+                return ip == address
+        elif regexp is not None:
+            ip_matches = re.compile(regexp).match
+        else:
+            def ip_matches(ip):
+                return False
+
+        fixed_ips = fixed_ip_obj.FixedIPList.get_by_ip_filter(
+            context, fixed_address=fixed_ip_filter, address=address,
+            regexp=regexp)
+        results = []
+        for fixed_ip in fixed_ips:
+            fixed_address = str(fixed_ip.address)
+            if fixed_address == fixed_ip_filter or ip_matches(fixed_address):
+                results.append({'instance_uuid': fixed_ip.instance_uuid,
+                                'ip': fixed_ip.address})
+                continue
+            for floating_ip in fixed_ip.floating_ips:
+                if not floating_ip or not floating_ip.address:
                     continue
-                for floating_ip in fixed_ip.floating_ips:
-                    if not floating_ip or not floating_ip.address:
-                        continue
-                    if ip_filter.match(str(floating_ip.address)):
-                        results.append({'instance_uuid': vif.instance_uuid,
-                                        'ip': floating_ip.address})
-                        continue
+                if ip_matches(str(floating_ip.address)):
+                    results.append({'instance_uuid': fixed_ip.instance_uuid,
+                                    'ip': floating_ip.address})
 
         return results
 
@@ -468,6 +468,85 @@ class API(base_api.NetworkAPI):
                                             port_ids)
         return result
 
+    def get_instances_nw_info(self, context, instances, use_slave=False):
+        """Return network information for several instances and update
+        their caches.
+
+        The ports of all the instances are listed in one call, and so are
+        the networks, subnets, DHCP ports and floating IPs they use.
+        """
+        client = neutronv2.get_client(context, admin=True)
+        data = client.list_ports(
+            device_id=[instance['uuid'] for instance in instances])
+        ports = {}
+        for port in data.get('ports', []):
+            ports.setdefault(port['device_id'], []).append(port)
+
+        instance_ports = {}
+        all_ports = []
+        for instance in instances:
+            instance_ports[instance['uuid']] = [
+                port for port in ports.get(instance['uuid'], [])
+                if port['tenant_id'] == instance['project_id']]
+            all_ports.extend(instance_ports[instance['uuid']])
+        resources = self._get_port_resources(context, client, all_ports)
+
+        result = {}
+        for instance in instances:
+            try:
+                nw_info = network_model.NetworkInfo.hydrate(
+                    self._build_network_info_model(
+                        context, instance,
+                        neutron_ports=instance_ports[instance['uuid']],
+                        resources=resources))
+                base_api.update_instance_cache_with_nw_info(
+                    self, context, instance, nw_info=nw_info)
+            except Exception:
+                LOG.exception(_('Failed to get network info'),
+                              instance=instance)
+                continue
+            result[instance['uuid']] = nw_info
+        return result
+
+    def _get_port_resources(self, context, client, ports):
+        """Read the networks, subnets, DHCP ports and floating IPs used by
+        the given ports, with one call to neutron for each of them.
+
+        Returns a dict which _build_network_info_model() can take as its
+        resources argument.
+        """
+        networks = {}
+        net_ids = sorted(set(port['network_id'] for port in ports))
+        if net_ids:
+            for net in self._get_available_networks(context, None, net_ids):
+                networks[net['id']] = net
+
+        subnets = {}
+        dhcp_ports = {}
+        subnet_ids = sorted(set(fixed_ip['subnet_id'] for port in ports
+                                for fixed_ip in port.get('fixed_ips', [])))
+        if subnet_ids:
+            data = neutronv2.get_client(context).list_subnets(id=subnet_ids)
+            for subnet in data.get('subnets', []):
+                subnets[subnet['id']] = subnet
+            subnet_net_ids = sorted(set(subnet['network_id']
+                                        for subnet in subnets.values()))
+            if subnet_net_ids:
+                data = neutronv2.get_client(context).list_ports(
+                    network_id=subnet_net_ids, device_owner='network:dhcp')
+                for port in data.get('ports', []):
+                    dhcp_ports.setdefault(port['network_id'], []).append(port)
+
+        floating_ips = {}
+        port_ids = [port['id'] for port in ports if port.get('fixed_ips')]
+        if port_ids:
+            for fip in self._get_floating_ips_by_ports(client, port_ids):
+                key = (fip['port_id'], fip['fixed_ip_address'])
+                floating_ips.setdefault(key, []).append(fip)
+
+        return {'networks': networks, 'subnets': subnets,
+                'dhcp_ports': dhcp_ports, 'floating_ips': floating_ips}
+
     def _get_instance_nw_info(self, context, instance, networks=None,
                               port_ids=None):
         # keep this caching-free version of the get_instance_nw_info method
@@ -478,7 +557,7 @@ class API(base_api.NetworkAPI):
         return network_model.NetworkInfo.hydrate(nw_info)
 
     def _gather_port_ids_and_networks(self, context, instance, networks=None,
-                                      port_ids=None):
+                                      port_ids=None, resources=None):
         """Return an instance's complete list of port_ids and networks."""
 
         if ((networks is None and port_ids is not None) or
@@ -499,7 +578,10 @@ class API(base_api.NetworkAPI):
             port_ids = [iface['id'] for iface in ifaces]
             net_ids = [iface['network']['id'] for iface in ifaces]
 
-        if networks is None:
+        if networks is None and resources is not None:
+            networks = [resources['networks'][net_id] for net_id in net_ids
+                        if net_id in resources['networks']]
+        elif networks is None:
             networks = self._get_available_networks(context,
                                                     instance['project_id'],
                                                     net_ids)
@@ -958,6 +1040,20 @@ class API(base_api.NetworkAPI):
                               {'fixed_ip': fixed_ip, 'port_id': port})
         return data['floatingips']
 
+    def _get_floating_ips_by_ports(self, client, port_ids):
+        """Get the floatingips of several ports."""
+        try:
+            data = client.list_floatingips(port_id=port_ids)
+        # If a neutron plugin does not implement the L3 API a 404 from
+        # list_floatingips will be raised.
+        except neutronv2.exceptions.NeutronClientException as e:
+            if e.status_code == 404:
+                return []
+            with excutils.save_and_reraise_exception():
+                LOG.exception(_('Unable to access floating IPs of ports '
+                                '%s'), port_ids)
+        return data['floatingips']
+
     def release_floating_ip(self, context, address,
                             affect_auto_assigned=False):
         """Remove a floating ip with the given address from a project."""
@@ -1019,12 +1115,16 @@ class API(base_api.NetworkAPI):
         """Force add a network to the project."""
         raise NotImplementedError()
 
-    def _nw_info_get_ips(self, client, port):
+    def _nw_info_get_ips(self, client, port, resources=None):
         network_IPs = []
         for fixed_ip in port['fixed_ips']:
             fixed = network_model.FixedIP(address=fixed_ip['ip_address'])
-            floats = self._get_floating_ips_by_fixed_and_port(
-                client, fixed_ip['ip_address'], port['id'])
+            if resources is None:
+                floats = self._get_floating_ips_by_fixed_and_port(
+                    client, fixed_ip['ip_address'], port['id'])
+            else:
+                floats = resources['floating_ips'].get(
+                    (port['id'], fixed_ip['ip_address']), [])
             for ip in floats:
                 fip = network_model.IP(address=ip['floating_ip_address'],
                                        type='floating')
@@ -1032,8 +1132,22 @@ class API(base_api.NetworkAPI):
             network_IPs.append(fixed)
         return network_IPs
 
-    def _nw_info_get_subnets(self, context, port, network_IPs):
-        subnets = self._get_subnets_from_port(context, port)
+    def _nw_info_get_subnets(self, context, port, network_IPs,
+                             resources=None):
+        if resources is None:
+            subnets = self._get_subnets_from_port(context, port)
+        else:
+            subnet_ids = []
+            for fixed_ip in port['fixed_ips']:
+                if (fixed_ip['subnet_id'] in resources['subnets'] and
+                        fixed_ip['subnet_id'] not in subnet_ids):
+                    subnet_ids.append(fixed_ip['subnet_id'])
+            subnets = []
+            for subnet_id in subnet_ids:
+                subnet = resources['subnets'][subnet_id]
+                dhcp_ports = resources['dhcp_ports'].get(subnet['network_id'],
+                                                         [])
+                subnets.append(self._nw_info_build_subnet(subnet, dhcp_ports))
         for subnet in subnets:
             subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
                              if fixed_ip.is_in_subnet(subnet)]
@@ -1089,7 +1203,8 @@ class API(base_api.NetworkAPI):
         return network, ovs_interfaceid
 
     def _build_network_info_model(self, context, instance, networks=None,
-                                  port_ids=None):
+                                  port_ids=None, neutron_ports=None,
+                                  resources=None):
         """Return list of ordered VIFs attached to instance.
 
         :param context - request context.
@@ -1101,20 +1216,25 @@ class API(base_api.NetworkAPI):
                           instance in order of attachment. If value is None
                           this value will be populated from the existing
                           cached value.
+        :param neutron_ports - List of the ports of the instance, if they
+                               were already retrieved from neutron.
+        :param resources - The networks, subnets and floating IPs of the
+                           ports, as returned by _get_port_resources(), if
+                           they were already retrieved from neutron.
         """
 
-        search_opts = {'tenant_id': instance['project_id'],
-                       'device_id': instance['uuid'], }
         client = neutronv2.get_client(context, admin=True)
-        data = client.list_ports(**search_opts)
-
-        current_neutron_ports = data.get('ports', [])
+        if neutron_ports is None:
+            search_opts = {'tenant_id': instance['project_id'],
+                           'device_id': instance['uuid'], }
+            data = client.list_ports(**search_opts)
+            neutron_ports = data.get('ports', [])
         networks, port_ids = self._gather_port_ids_and_networks(
-                context, instance, networks, port_ids)
+                context, instance, networks, port_ids, resources=resources)
         nw_info = network_model.NetworkInfo()
 
         current_neutron_port_map = {}
-        for current_neutron_port in current_neutron_ports:
+        for current_neutron_port in neutron_ports:
             current_neutron_port_map[current_neutron_port['id']] = (
                 current_neutron_port)
 
@@ -1127,10 +1247,12 @@ class API(base_api.NetworkAPI):
                     vif_active = True
 
                 network_IPs = self._nw_info_get_ips(client,
-                                                    current_neutron_port)
+                                                    current_neutron_port,
+                                                    resources=resources)
                 subnets = self._nw_info_get_subnets(context,
                                                     current_neutron_port,
-                                                    network_IPs)
+                                                    network_IPs,
+                                                    resources=resources)
 
                 devname = "tap" + current_neutron_port['id']
                 devname = devname[:network_model.NIC_NAME_LEN]
@@ -1168,32 +1290,36 @@ class API(base_api.NetworkAPI):
         subnets = []
 
         for subnet in ipam_subnets:
-            subnet_dict = {'cidr': subnet['cidr'],
-                           'gateway': network_model.IP(
-                                address=subnet['gateway_ip'],
-                                type='gateway'),
-            }
-
             # attempt to populate DHCP server field
             search_opts = {'network_id': subnet['network_id'],
                            'device_owner': 'network:dhcp'}
             data = neutronv2.get_client(context).list_ports(**search_opts)
             dhcp_ports = data.get('ports', [])
-            for p in dhcp_ports:
-                for ip_pair in p['fixed_ips']:
-                    if ip_pair['subnet_id'] == subnet['id']:
-                        subnet_dict['dhcp_server'] = ip_pair['ip_address']
-                        break
-
-            subnet_object = network_model.Subnet(**subnet_dict)
-            for dns in subnet.get('dns_nameservers', []):
-                subnet_object.add_dns(
-                    network_model.IP(address=dns, type='dns'))
-
-            # TODO(gongysh) get the routes for this subnet
-            subnets.append(subnet_object)
+            subnets.append(self._nw_info_build_subnet(subnet, dhcp_ports))
         return subnets
 
+    def _nw_info_build_subnet(self, subnet, dhcp_ports):
+        """Return the Subnet model of a neutron subnet."""
+        subnet_dict = {'cidr': subnet['cidr'],
+                       'gateway': network_model.IP(
+                            address=subnet['gateway_ip'],
+                            type='gateway'),
+        }
+
+        for p in dhcp_ports:
+            for ip_pair in p['fixed_ips']:
+                if ip_pair['subnet_id'] == subnet['id']:
+                    subnet_dict['dhcp_server'] = ip_pair['ip_address']
+                    break
+
+        subnet_object = network_model.Subnet(**subnet_dict)
+        for dns in subnet.get('dns_nameservers', []):
+            subnet_object.add_dns(
+                network_model.IP(address=dns, type='dns'))
+
+        # TODO(gongysh) get the routes for this subnet
+        return subnet_object
+
     def get_dns_domains(self, context):
         """Return a list of available dns domains.
 
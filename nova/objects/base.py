@@ -17,8 +17,11 @@
 import collections
 import copy
 import functools
+import weakref
+import zlib
 
 import netaddr
+from oslo.config import cfg
 from oslo import messaging
 import six
 
@@ -26,10 +29,32 @@ from nova import context
 from nova import exception
 from nova.objects import fields
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import versionutils
 
 
+objects_opts = [
+    cfg.BoolOpt('compact_object_payloads',
+                default=False,
+                help='Send objects to the conductor and scheduler services '
+                     'in a compact form, which lists the field names of '
+                     'each object type once per message instead of once '
+                     'per object. Only enable this once every conductor '
+                     'and scheduler service has been upgraded'),
+    cfg.BoolOpt('delta_object_actions',
+                default=False,
+                help='Only send the changed fields of an object to the '
+                     'conductor for the methods which support it, such as '
+                     'Instance.save(), and only get back the fields which '
+                     'the conductor changed. Only enable this once every '
+                     'conductor service has been upgraded'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(objects_opts)
+
+
 LOG = logging.getLogger('object')
 
 
@@ -57,26 +82,45 @@ def make_class_properties(cls):
                 cls.fields[name] = field
     for name, field in cls.fields.iteritems():
 
-        def getter(self, name=name):
-            attrname = get_attrname(name)
-            if not hasattr(self, attrname):
+        def getter(self, name=name, attrname=get_attrname(name)):
+            try:
+                return getattr(self, attrname)
+            except AttributeError:
                 self.obj_load_attr(name)
-            return getattr(self, attrname)
+                return getattr(self, attrname)
 
-        def setter(self, value, name=name, field=field):
+        def setter(self, value, name=name, field=field,
+                   attrname=get_attrname(name),
+                   native_types=field.native_types):
             self._changed_fields.add(name)
-            try:
-                return setattr(self, get_attrname(name),
-                               field.coerce(self, name, value))
-            except Exception:
-                attr = "%s.%s" % (self.obj_name(), name)
-                LOG.exception(_('Error setting %(attr)s') %
-                              {'attr': attr})
-                raise
+            # NOTE: Values of the type coerce() would return, like the
+            # strings and integers of database rows, are stored as they
+            # are.
+            if value.__class__ not in native_types:
+                try:
+                    value = field.coerce(self, name, value)
+                except Exception:
+                    attr = "%s.%s" % (self.obj_name(), name)
+                    LOG.exception(_('Error setting %(attr)s') %
+                                  {'attr': attr})
+                    raise
+            setattr(self, attrname, value)
 
         setattr(cls, name, property(getter, setter))
 
 
+def _get_compact_storage_slots(bases, dict_):
+    """Return the __slots__ of a class which sets obj_compact_storage."""
+    slots = set(dict_.get('__slots__', ()))
+    slots.update(['_context', '_changed_fields'])
+    for base in bases:
+        for supercls in base.mro():
+            slots.update(get_attrname(name)
+                         for name in getattr(supercls, 'fields', {}))
+    slots.update(get_attrname(name) for name in dict_.get('fields', {}))
+    return tuple(sorted(slots))
+
+
 class NovaObjectMetaclass(type):
     """Metaclass that allows tracking of object classes."""
 
@@ -84,6 +128,12 @@ class NovaObjectMetaclass(type):
     # remoted. If this is not None, use it to remote things over RPC.
     indirection_api = None
 
+    def __new__(mcs, name, bases, dict_):
+        if dict_.get('obj_compact_storage'):
+            dict_['__slots__'] = _get_compact_storage_slots(bases, dict_)
+        return super(NovaObjectMetaclass, mcs).__new__(mcs, name, bases,
+                                                       dict_)
+
     def __init__(cls, names, bases, dict_):
         if not hasattr(cls, '_obj_classes'):
             # This will be set in the 'NovaObject' class.
@@ -179,6 +229,16 @@ class NovaObject(object):
     fields = {}
     obj_extra_fields = []
 
+    # If True, the fields, context and changes of the objects of this class
+    # are kept in __slots__ rather than in a __dict__, which saves memory
+    # when many of them are loaded. Only applies to the class setting it.
+    obj_compact_storage = False
+
+    # The remotable methods which only need the changed fields of the
+    # object, plus the ones in obj_delta_keys, see obj_to_delta_primitive()
+    obj_delta_methods = []
+    obj_delta_keys = []
+
     def __init__(self, context=None, **kwargs):
         self._changed_fields = set()
         self._context = context
@@ -227,7 +287,8 @@ class NovaObject(object):
     def _obj_from_primitive(cls, context, objver, primitive):
         self = cls()
         self._context = context
-        self.VERSION = objver
+        if objver != self.VERSION:
+            self.VERSION = objver
         objdata = primitive['nova_object.data']
         changes = primitive.get('nova_object.changes', [])
         for name, field in self.fields.items():
@@ -309,6 +370,32 @@ class NovaObject(object):
             obj['nova_object.changes'] = list(self.obj_what_changed())
         return obj
 
+    def obj_to_delta_primitive(self):
+        """Dehydrate only the changed fields and the obj_delta_keys.
+
+        Returns the primitive and a dict of the primitive_digest() of each
+        of the other fields which are set, which lets the receiver tell
+        whether it has changed them.
+        """
+        changes = self.obj_what_changed()
+        primitive = dict()
+        digests = dict()
+        for name, field in self.fields.items():
+            if not self.obj_attr_is_set(name):
+                continue
+            value = field.to_primitive(self, name, getattr(self, name))
+            if name in changes or name in self.obj_delta_keys:
+                primitive[name] = value
+            else:
+                digests[name] = primitive_digest(value)
+        obj = {'nova_object.name': self.obj_name(),
+               'nova_object.namespace': 'nova',
+               'nova_object.version': self.VERSION,
+               'nova_object.data': primitive}
+        if changes:
+            obj['nova_object.changes'] = list(changes)
+        return obj, digests
+
     def obj_load_attr(self, attrname):
         """Load an additional attribute from the real object.
 
@@ -521,6 +608,134 @@ class ObjectListBase(object):
         return changes
 
 
+def primitive_digest(primitive):
+    """Return a checksum of a field primitive."""
+    return zlib.crc32(jsonutils.dumps(primitive, sort_keys=True)) & 0xffffffff
+
+
+# Layout of the compact payloads built by compact_primitive(). Bump it
+# whenever that layout changes.
+COMPACT_PAYLOAD_VERSION = 1
+
+# { (objname, objver): ([field names], {field name: index}) }
+_compact_schemas = {}
+
+
+def _get_compact_schema(objname, objver, names):
+    """Return the field names and indexes used to encode an object type,
+    adding any of names it doesn't have yet.
+
+    Fields are only ever appended, so the indexes already handed out stay
+    valid.
+    """
+    schema = _compact_schemas.get((objname, objver))
+    if schema is None:
+        fields = sorted(names)
+        schema = (fields, dict((name, i) for i, name in enumerate(fields)))
+        _compact_schemas[(objname, objver)] = schema
+        return schema
+    fields, indexes = schema
+    for name in names:
+        if name not in indexes:
+            indexes[name] = len(fields)
+            fields.append(name)
+    return schema
+
+
+def compact_primitive(primitive):
+    """Encode the object primitives found in primitive compactly.
+
+    Each object becomes {'nova_object.c': [schema, set, changed, values]}
+    where schema indexes the list of field names of its type and version,
+    set and changed are bitmasks over that list and values holds the set
+    fields in its order. The lists of field names are sent once, next to
+    the payload.
+    """
+    schemas = []
+    schema_ids = {}
+
+    def _compact_object(objprim):
+        key = (objprim['nova_object.name'], objprim['nova_object.version'])
+        data = objprim['nova_object.data']
+        changes = objprim.get('nova_object.changes', [])
+        fields, indexes = _get_compact_schema(key[0], key[1], data)
+        if any(name not in indexes for name in changes):
+            fields, indexes = _get_compact_schema(key[0], key[1], changes)
+        if key not in schema_ids:
+            schema_ids[key] = len(schemas)
+            schemas.append(key)
+
+        set_mask = 0
+        values = []
+        for name in data:
+            set_mask |= 1 << indexes[name]
+        for i, name in enumerate(fields):
+            if set_mask & (1 << i):
+                values.append(_compact(data[name]))
+        changed_mask = 0
+        for name in changes:
+            changed_mask |= 1 << indexes[name]
+        return {'nova_object.c': [schema_ids[key], set_mask,
+                                  changed_mask] + values}
+
+    def _compact(value):
+        if isinstance(value, dict):
+            if (value.get('nova_object.namespace') == 'nova' and
+                    'nova_object.name' in value):
+                return _compact_object(value)
+            return dict((k, _compact(v)) for k, v in value.iteritems())
+        elif isinstance(value, (list, tuple)):
+            return [_compact(v) for v in value]
+        return value
+
+    payload = _compact(primitive)
+    return {'nova_object.compact': COMPACT_PAYLOAD_VERSION,
+            'nova_object.schemas': [
+                [objname, objver, list(_compact_schemas[(objname,
+                                                         objver)][0])]
+                for objname, objver in schemas],
+            'nova_object.payload': payload}
+
+
+def expand_primitive(compact):
+    """Turn the result of compact_primitive() back into a primitive."""
+    if compact['nova_object.compact'] != COMPACT_PAYLOAD_VERSION:
+        raise exception.UnsupportedObjectError(
+            objtype='compact payload v%s' % compact['nova_object.compact'])
+    schemas = compact['nova_object.schemas']
+
+    def _expand_object(encoded):
+        objname, objver, fields = schemas[encoded[0]]
+        set_mask, changed_mask = encoded[1], encoded[2]
+        values = iter(encoded[3:])
+        data = {}
+        changes = []
+        for i, name in enumerate(fields):
+            bit = 1 << i
+            if set_mask & bit:
+                data[name] = _expand(next(values))
+            if changed_mask & bit:
+                changes.append(name)
+        objprim = {'nova_object.name': objname,
+                   'nova_object.namespace': 'nova',
+                   'nova_object.version': objver,
+                   'nova_object.data': data}
+        if changes:
+            objprim['nova_object.changes'] = changes
+        return objprim
+
+    def _expand(value):
+        if isinstance(value, dict):
+            if 'nova_object.c' in value:
+                return _expand_object(value['nova_object.c'])
+            return dict((k, _expand(v)) for k, v in value.iteritems())
+        elif isinstance(value, list):
+            return [_expand(v) for v in value]
+        return value
+
+    return _expand(compact['nova_object.payload'])
+
+
 class NovaObjectSerializer(messaging.NoOpSerializer):
     """A NovaObject-aware Serializer.
 
@@ -528,8 +743,27 @@ class NovaObjectSerializer(messaging.NoOpSerializer):
     ability to serialize and deserialize NovaObject entities. Any service
     that needs to accept or return NovaObjects as arguments or result values
     should pass this to its RPCClient and RPCServer objects.
+
+    With compact=True, entities are sent in the form built by
+    compact_primitive(). Such entities are always understood, and the
+    values returned to a request which came in that form are sent that
+    way too.
     """
 
+    def __init__(self, compact=False):
+        super(NovaObjectSerializer, self).__init__()
+        self.compact = compact
+        self._compact_contexts = weakref.WeakSet()
+
+    def _send_compact(self, context):
+        if self.compact:
+            return True
+        try:
+            return context in self._compact_contexts
+        except TypeError:
+            # Only request contexts are tracked
+            return False
+
     @property
     def conductor(self):
         if not hasattr(self, '_conductor'):
@@ -561,16 +795,29 @@ class NovaObjectSerializer(messaging.NoOpSerializer):
             iterable = tuple
         return iterable([action_fn(context, value) for value in values])
 
-    def serialize_entity(self, context, entity):
+    def _serialize_entity(self, context, entity):
         if isinstance(entity, (tuple, list, set)):
-            entity = self._process_iterable(context, self.serialize_entity,
+            entity = self._process_iterable(context, self._serialize_entity,
                                             entity)
         elif (hasattr(entity, 'obj_to_primitive') and
               callable(entity.obj_to_primitive)):
             entity = entity.obj_to_primitive()
         return entity
 
+    def serialize_entity(self, context, entity):
+        entity = self._serialize_entity(context, entity)
+        if (isinstance(entity, (tuple, list, dict)) and
+                self._send_compact(context)):
+            entity = compact_primitive(entity)
+        return entity
+
     def deserialize_entity(self, context, entity):
+        if isinstance(entity, dict) and 'nova_object.compact' in entity:
+            try:
+                self._compact_contexts.add(context)
+            except TypeError:
+                pass
+            entity = expand_primitive(entity)
         if isinstance(entity, dict) and 'nova_object.name' in entity:
             entity = self._process_object(context, entity)
         elif isinstance(entity, (tuple, list, set)):
@@ -96,6 +96,10 @@ class AbstractFieldType(six.with_metaclass(abc.ABCMeta, object)):
 
 
 class FieldType(AbstractFieldType):
+    # The types of the values coerce() returns as they are. Objects skip
+    # coerce() when set to a value of exactly one of these types.
+    native_types = ()
+
     @staticmethod
     def coerce(obj, attr, value):
         return value
@@ -130,6 +134,10 @@ class Field(object):
     def default(self):
         return self._default
 
+    @property
+    def native_types(self):
+        return self._type.native_types
+
     def _null(self, obj, attr):
         if self.nullable:
             return None
@@ -207,6 +215,8 @@ class Field(object):
 
 
 class String(FieldType):
+    native_types = (unicode,)
+
     @staticmethod
     def coerce(obj, attr, value):
         # FIXME(danms): We should really try to avoid the need to do this
@@ -219,6 +229,8 @@ class String(FieldType):
 
 
 class UUID(FieldType):
+    native_types = (str,)
+
     @staticmethod
     def coerce(obj, attr, value):
         # FIXME(danms): We should actually verify the UUIDness here
@@ -226,17 +238,23 @@ class UUID(FieldType):
 
 
 class Integer(FieldType):
+    native_types = (int,)
+
     @staticmethod
     def coerce(obj, attr, value):
         return int(value)
 
 
 class Float(FieldType):
+    native_types = (float,)
+
     def coerce(self, obj, attr, value):
         return float(value)
 
 
 class Boolean(FieldType):
+    native_types = (bool,)
+
     @staticmethod
     def coerce(obj, attr, value):
         return bool(value)
@@ -165,7 +165,8 @@ class FixedIP(obj_base.NovaPersistentObject, obj_base.NovaObject):
 class FixedIPList(obj_base.ObjectListBase, obj_base.NovaObject):
     # Version 1.0: Initial version
     # Version 1.1: Added get_by_network()
-    VERSION = '1.1'
+    # Version 1.2: Added get_by_ip_filter()
+    VERSION = '1.2'
 
     fields = {
         'objects': fields.ListOfObjectsField('FixedIP'),
@@ -173,6 +174,7 @@ class FixedIPList(obj_base.ObjectListBase, obj_base.NovaObject):
     child_versions = {
         '1.0': '1.0',
         '1.1': '1.1',
+        '1.2': '1.1',
         }
 
     @obj_base.remotable_classmethod
@@ -195,6 +197,15 @@ class FixedIPList(obj_base.ObjectListBase, obj_base.NovaObject):
         db_fixedips = db.fixed_ips_by_virtual_interface(context, vif_id)
         return obj_base.obj_make_list(context, cls(), FixedIP, db_fixedips)
 
+    @obj_base.remotable_classmethod
+    def get_by_ip_filter(cls, context, fixed_address=None, address=None,
+                         regexp=None):
+        db_fixedips = db.fixed_ip_get_by_ip_filter(context,
+                                                   fixed_address=fixed_address,
+                                                   address=address,
+                                                   regexp=regexp)
+        return obj_base.obj_make_list(context, cls(), FixedIP, db_fixedips)
+
     @obj_base.remotable_classmethod
     def get_by_network(cls, context, network, host=None):
         ipinfo = db.network_get_associated_fixed_ips(context,
@@ -166,6 +166,12 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
 
     obj_extra_fields = ['name']
 
+    obj_compact_storage = True
+    __slots__ = ('_orig_metadata', '_orig_system_metadata')
+
+    obj_delta_methods = ['save']
+    obj_delta_keys = ['id', 'uuid', 'cell_name']
+
     def __init__(self, *args, **kwargs):
         super(Instance, self).__init__(*args, **kwargs)
         self._reset_metadata_tracking()
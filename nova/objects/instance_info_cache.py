@@ -39,6 +39,8 @@ class InstanceInfoCache(base.NovaPersistentObject, base.NovaObject):
         'network_info': fields.Field(fields.NetworkModel(), nullable=True),
         }
 
+    obj_compact_storage = True
+
     @staticmethod
     def _from_db_object(context, info_cache, db_obj):
         for field in info_cache.fields:
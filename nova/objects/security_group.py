@@ -30,6 +30,8 @@ class SecurityGroup(base.NovaPersistentObject, base.NovaObject):
         'project_id': fields.StringField(),
         }
 
+    obj_compact_storage = True
+
     @staticmethod
     def _from_db_object(context, secgroup, db_secgroup):
         # NOTE(danms): These are identical right now
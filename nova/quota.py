@@ -17,7 +17,10 @@
 """Quotas for instances, and floating ips."""
 
 import datetime
+import sys
 
+from eventlet import event
+from eventlet import greenthread
 from oslo.config import cfg
 import six
 
@@ -81,11 +84,24 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='Default driver to use for quota checks'),
+    cfg.BoolOpt('quota_batch_reservations',
+                default=False,
+                help='Make the concurrent quota reservations of a project '
+                     'in a single database transaction'),
+    cfg.IntOpt('quota_limit_cache_ttl',
+               default=0,
+               help='Number of seconds the quota limits of a project are '
+                    'cached for reservations and limit checks, 0 disables '
+                    'the cache. Quota updates only invalidate the cache of '
+                    'the process making them'),
     ]
 
 CONF = cfg.CONF
 CONF.register_opts(quota_opts)
 
+# Sent to a queued reservation request to make it reserve the next batch.
+_LEAD_BATCH = object()
+
 
 class DbQuotaDriver(object):
     """Driver to perform necessary checks to enforce quotas and obtain
@@ -94,6 +110,16 @@ class DbQuotaDriver(object):
     """
     UNLIMITED_VALUE = -1
 
+    # Number of entries after which the limit cache is emptied
+    LIMIT_CACHE_SIZE = 10000
+
+    def __init__(self):
+        # { (project_id, user_id, quota_class, has_sync, keys) :
+        #   (expires_at, project_limits, user_limits) }
+        self._limit_cache = {}
+        # { project_id : [ (request, waiter) ] }
+        self._pending_reservations = {}
+
     def get_by_project_and_user(self, context, project_id, user_id, resource):
         """Get a specific quota by project and user."""
 
@@ -390,6 +416,50 @@ class DbQuotaDriver(object):
 
         return dict((k, v['limit']) for k, v in quotas.items())
 
+    def _get_limits(self, context, resources, keys, has_sync, project_id,
+                    user_id):
+        """Return the project and user limits of the given resources.
+
+        The limits are kept in a cache for quota_limit_cache_ttl seconds,
+        see invalidate_limits().
+        """
+        ttl = CONF.quota_limit_cache_ttl
+        cache_key = (project_id, user_id, context.quota_class, has_sync,
+                     frozenset(keys))
+        if ttl > 0:
+            cached = self._limit_cache.get(cache_key)
+            if cached and cached[0] > timeutils.utcnow_ts():
+                return dict(cached[1]), dict(cached[2])
+
+        project_quotas = db.quota_get_all_by_project(context, project_id)
+        quotas = self._get_quotas(context, resources, keys,
+                                  has_sync=has_sync, project_id=project_id,
+                                  project_quotas=project_quotas)
+        user_quotas = self._get_quotas(context, resources, keys,
+                                       has_sync=has_sync,
+                                       project_id=project_id,
+                                       user_id=user_id,
+                                       project_quotas=project_quotas)
+
+        if ttl > 0:
+            if len(self._limit_cache) >= self.LIMIT_CACHE_SIZE:
+                self._limit_cache.clear()
+            self._limit_cache[cache_key] = (timeutils.utcnow_ts() + ttl,
+                                            dict(quotas), dict(user_quotas))
+        return quotas, user_quotas
+
+    def invalidate_limits(self, project_id=None):
+        """Drop the cached limits of a project, or of every project.
+
+        :param project_id: The ID of the project whose limits changed.
+        """
+        if project_id is None:
+            self._limit_cache.clear()
+            return
+        for cache_key in self._limit_cache.keys():
+            if cache_key[0] == project_id:
+                del self._limit_cache[cache_key]
+
     def limit_check(self, context, resources, values, project_id=None,
                     user_id=None):
         """Check simple quota limits.
@@ -432,14 +502,9 @@ class DbQuotaDriver(object):
             user_id = context.user_id
 
         # Get the applicable quotas
-        project_quotas = db.quota_get_all_by_project(context, project_id)
-        quotas = self._get_quotas(context, resources, values.keys(),
-                                  has_sync=False, project_id=project_id,
-                                  project_quotas=project_quotas)
-        user_quotas = self._get_quotas(context, resources, values.keys(),
-                                       has_sync=False, project_id=project_id,
-                                       user_id=user_id,
-                                       project_quotas=project_quotas)
+        quotas, user_quotas = self._get_limits(context, resources,
+                                               values.keys(), False,
+                                               project_id, user_id)
 
         # Check the quotas and construct a list of the resources that
         # would be put over limit by the desired values
@@ -521,24 +586,105 @@ class DbQuotaDriver(object):
         # NOTE(Vek): We're not worried about races at this point.
         #            Yes, the admin may be in the process of reducing
         #            quotas, but that's a pretty rare thing.
-        project_quotas = db.quota_get_all_by_project(context, project_id)
-        quotas = self._get_quotas(context, resources, deltas.keys(),
-                                  has_sync=True, project_id=project_id,
-                                  project_quotas=project_quotas)
-        user_quotas = self._get_quotas(context, resources, deltas.keys(),
-                                       has_sync=True, project_id=project_id,
-                                       user_id=user_id,
-                                       project_quotas=project_quotas)
+        quotas, user_quotas = self._get_limits(context, resources,
+                                               deltas.keys(), True,
+                                               project_id, user_id)
 
         # NOTE(Vek): Most of the work here has to be done in the DB
         #            API, because we have to do it in a transaction,
         #            which means access to the session.  Since the
         #            session isn't available outside the DBAPI, we
         #            have to do the work there.
-        return db.quota_reserve(context, resources, quotas, user_quotas,
-                                deltas, expire,
-                                CONF.until_refresh, CONF.max_age,
-                                project_id=project_id, user_id=user_id)
+        if not CONF.quota_batch_reservations:
+            return db.quota_reserve(context, resources, quotas, user_quotas,
+                                    deltas, expire,
+                                    CONF.until_refresh, CONF.max_age,
+                                    project_id=project_id, user_id=user_id)
+
+        request = dict(context=context, project_quotas=quotas,
+                       user_quotas=user_quotas, deltas=deltas, expire=expire,
+                       user_id=user_id)
+        return self._reserve_batched(context, resources, request, project_id)
+
+    def _reserve_batched(self, context, resources, request, project_id):
+        """Make a reservation along with those of concurrent requests.
+
+        The first caller for a project lets the other greenthreads queue
+        their own requests, then reserves all of them in one transaction.
+        The requests queued meanwhile are handed to the first of their
+        callers, which reserves the next batch the same way. A burst of
+        requests in a project thus locks its quota_usages rows once per
+        batch rather than once per request.
+        """
+        pending = self._pending_reservations.get(project_id)
+        if pending is None:
+            pending = self._pending_reservations[project_id] = []
+        else:
+            waiter = event.Event()
+            pending.append((request, waiter))
+            outcome = waiter.wait()
+            if outcome is not _LEAD_BATCH:
+                reservations, exc_info = outcome
+                if exc_info:
+                    six.reraise(*exc_info)
+                return reservations
+
+        batch = [(request, None)]
+        result = None
+        try:
+            greenthread.sleep(0)
+            batch.extend(pending)
+            del pending[:]
+            outcomes = self._reserve_batch(context, resources,
+                                           [req for req, w in batch],
+                                           project_id)
+            for (req, waiter), outcome in zip(batch, outcomes):
+                if waiter is None:
+                    result = outcome
+                else:
+                    waiter.send(outcome)
+        finally:
+            # NOTE: only needed if this greenthread got killed, don't
+            #       leave the others waiting.
+            for req, waiter in batch:
+                if waiter is not None and not waiter.ready():
+                    error = exception.QuotaError()
+                    waiter.send((None, (type(error), error, None)))
+            if pending:
+                req, waiter = pending.pop(0)
+                waiter.send(_LEAD_BATCH)
+            else:
+                del self._pending_reservations[project_id]
+
+        reservations, exc_info = result
+        if exc_info:
+            six.reraise(*exc_info)
+        return reservations
+
+    def _reserve_batch(self, context, resources, requests, project_id):
+        """Reserve quota for the requests of a project.
+
+        Returns a (reservations, exc_info) tuple for each request.
+        """
+        try:
+            if len(requests) == 1:
+                request = requests[0]
+                reservations = db.quota_reserve(
+                    request['context'], resources, request['project_quotas'],
+                    request['user_quotas'], request['deltas'],
+                    request['expire'], CONF.until_refresh, CONF.max_age,
+                    project_id=project_id, user_id=request['user_id'])
+                return [(reservations, None)]
+
+            results = db.quota_reserve_batch(context, resources, requests,
+                                             CONF.until_refresh,
+                                             CONF.max_age,
+                                             project_id=project_id)
+        except Exception:
+            return [(None, sys.exc_info())] * len(requests)
+
+        return [(uuids, (type(error), error, None) if error else None)
+                for uuids, error in results]
 
     def commit(self, context, reservations, project_id=None, user_id=None):
         """Commit reservations.
@@ -625,6 +771,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project_and_user(context, project_id, user_id)
+        self.invalidate_limits(project_id)
 
     def destroy_all_by_project(self, context, project_id):
         """Destroy all quotas, usages, and reservations associated with a
@@ -635,6 +782,7 @@ class DbQuotaDriver(object):
         """
 
         db.quota_destroy_all_by_project(context, project_id)
+        self.invalidate_limits(project_id)
 
     def expire(self, context):
         """Expire reservations.
@@ -910,6 +1058,13 @@ class NoopQuotaDriver(object):
         """
         pass
 
+    def invalidate_limits(self, project_id=None):
+        """Drop the cached limits of a project, or of every project.
+
+        :param project_id: The ID of the project whose limits changed.
+        """
+        pass
+
     def expire(self, context):
         """Expire reservations.
 
@@ -1386,6 +1541,17 @@ class QuotaEngine(object):
 
         self._driver.destroy_all_by_project(context, project_id)
 
+    def invalidate_limits(self, project_id=None):
+        """Drop the cached limits of a project, or of every project.
+
+        Must be called after changing quotas so the following
+        reservations and limit checks of this process see the new limits.
+
+        :param project_id: The ID of the project whose limits changed.
+        """
+
+        self._driver.invalidate_limits(project_id)
+
     def expire(self, context):
         """Expire reservations.
 
@@ -44,6 +44,7 @@ class BaremetalNodeState(host_manager.HostState):
         self.free_ram_mb = 0
         self.free_disk_mb = 0
         self.vcpus_used = self.vcpus_total
+        self.consume_generation += 1
 
 
 def new_host_state(self, host, node, capabilities=None, service=None):
@@ -44,6 +44,9 @@ class CachingScheduler(filter_scheduler.FilterScheduler):
     copy of the cache. So if you run multiple schedulers, you will get
     more retries, because the data stored on any additional scheduler will
     be more out of date, than if it was fetched from the database.
+    Enabling scheduler_host_partitioning makes each scheduler place
+    instances on its own share of the hosts first, which avoids most of
+    these retries.
 
     In a similar way, if you have a high number of server deletes, the
     extra capacity from those deletes will not show up until the cache is
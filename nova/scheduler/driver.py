@@ -34,6 +34,7 @@ from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
 from nova import rpc
+from nova.scheduler import tracing
 from nova import servicegroup
 
 LOG = logging.getLogger(__name__)
@@ -103,6 +104,7 @@ class Scheduler(object):
         self.host_manager = importutils.import_object(
                 CONF.scheduler_host_manager)
         self.servicegroup_api = servicegroup.API()
+        self.tracer = tracing.SchedulerTracer()
 
     def run_periodic_tasks(self, context):
         """Manager calls this so drivers can perform periodic tasks."""
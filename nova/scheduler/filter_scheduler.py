@@ -28,9 +28,12 @@ from nova import exception
 from nova.objects import instance_group as instance_group_obj
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 from nova.pci import pci_request
 from nova import rpc
 from nova.scheduler import driver
+from nova.scheduler import filters
+from nova.scheduler import hash_ring
 from nova.scheduler import scheduler_options
 from nova.scheduler import utils as scheduler_utils
 
@@ -48,10 +51,25 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_host_partitioning',
+                default=False,
+                help='Split compute nodes between the running schedulers '
+                     'with a consistent hash ring. Each scheduler first '
+                     'tries to place instances on the compute nodes it '
+                     'owns, and only falls back to every compute node '
+                     'when none of its own fits, so that concurrent '
+                     'schedulers rarely pick the same compute node'),
+    cfg.IntOpt('scheduler_partition_refresh_interval',
+               default=60,
+               help='How often (in seconds) a scheduler refreshes the list '
+                    'of running schedulers the compute nodes are split '
+                    'between, when scheduler_host_partitioning is enabled'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
+CONF.import_opt('host', 'nova.netconf')
+CONF.import_opt('scheduler_topic', 'nova.scheduler.rpcapi')
 
 
 class FilterScheduler(driver.Scheduler):
@@ -61,6 +79,10 @@ class FilterScheduler(driver.Scheduler):
         self.options = scheduler_options.SchedulerOptions()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         self.notifier = rpc.get_notifier('scheduler')
+        self._scheduler_ring = None
+        self._scheduler_ring_updated = None
+        # { (host, node) : owning scheduler } for the current ring
+        self._node_owners = {}
 
     def schedule_run_instance(self, context, request_spec,
                               admin_password, injected_files,
@@ -316,32 +338,64 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self._get_all_host_states(elevated)
 
+        # Compute nodes owned by this scheduler, tried before all others.
+        local_hosts = None
+        all_hosts_filtered = False
+        if CONF.scheduler_host_partitioning:
+            hosts = list(hosts)
+            local_hosts = self._get_local_hosts(elevated, hosts)
+
+        # Filter results which cannot change between the instances of this
+        # request are only computed once per host.
+        filter_cache = filters.HostFilterResultCache()
+
         selected_hosts = []
         if instance_uuids:
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+        trace = self.tracer.start_trace(context, instance_uuids,
+                                        num_instances)
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
-            hosts = self.host_manager.get_filtered_hosts(hosts,
-                    filter_properties, index=num)
-            if not hosts:
+            filtered_hosts = []
+            if local_hosts:
+                local_hosts = filtered_hosts = (
+                    self.host_manager.get_filtered_hosts(local_hosts,
+                        filter_properties, index=num,
+                        filter_cache=filter_cache, trace=trace))
+                if not filtered_hosts:
+                    LOG.debug(_("No host of this scheduler's partition "
+                                "fits, trying all hosts"))
+            if not filtered_hosts:
+                if num and not all_hosts_filtered:
+                    # The filters run once per request have only seen the
+                    # local hosts so far, run them over all hosts first.
+                    hosts = self.host_manager.get_filtered_hosts(hosts,
+                            filter_properties, index=0,
+                            filter_cache=filter_cache, trace=trace)
+                hosts = filtered_hosts = self.host_manager.get_filtered_hosts(
+                        hosts, filter_properties, index=num,
+                        filter_cache=filter_cache, trace=trace)
+                all_hosts_filtered = True
+            if not filtered_hosts:
                 # Can't get any more locally.
                 break
 
-            LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
-
-            weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                    filter_properties)
-
-            LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
+            LOG.debug(_("Filtered %(hosts)s"), {'hosts': filtered_hosts})
 
             scheduler_host_subset_size = CONF.scheduler_host_subset_size
-            if scheduler_host_subset_size > len(weighed_hosts):
-                scheduler_host_subset_size = len(weighed_hosts)
             if scheduler_host_subset_size < 1:
                 scheduler_host_subset_size = 1
 
+            # Only the best hosts can be chosen, so there is no need to
+            # sort all of them.
+            weighed_hosts = self.host_manager.get_weighed_hosts(
+                    filtered_hosts, filter_properties,
+                    limit=scheduler_host_subset_size, trace=trace)
+
+            LOG.debug(_("Weighed %(hosts)s"), {'hosts': weighed_hosts})
+
             chosen_host = random.choice(
                 weighed_hosts[0:scheduler_host_subset_size])
             selected_hosts.append(chosen_host)
@@ -351,8 +405,46 @@ class FilterScheduler(driver.Scheduler):
             chosen_host.obj.consume_from_instance(instance_properties)
             if update_group_hosts is True:
                 filter_properties['group_hosts'].add(chosen_host.obj.host)
+        if trace is not None:
+            self.tracer.finish_trace(trace,
+                    [weighed_host.obj.host for weighed_host in selected_hosts])
         return selected_hosts
 
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
+
+    def _get_scheduler_ring(self, context):
+        """Return the hash ring of the running schedulers.
+
+        The ring is rebuilt every scheduler_partition_refresh_interval
+        seconds from the scheduler services that are up.
+        """
+        if (self._scheduler_ring is None or
+                timeutils.is_older_than(self._scheduler_ring_updated,
+                    CONF.scheduler_partition_refresh_interval)):
+            schedulers = set(self.hosts_up(context, CONF.scheduler_topic))
+            # This scheduler may not have reported in yet.
+            schedulers.add(CONF.host)
+            if (self._scheduler_ring is None or
+                    schedulers != self._scheduler_ring.nodes):
+                LOG.debug(_("Partitioning hosts between schedulers: "
+                            "%s"), ', '.join(sorted(schedulers)))
+                self._scheduler_ring = hash_ring.HashRing(schedulers)
+                self._node_owners = {}
+            self._scheduler_ring_updated = timeutils.utcnow()
+        return self._scheduler_ring
+
+    def _get_local_hosts(self, context, hosts):
+        """Return the host states owned by this scheduler."""
+        ring = self._get_scheduler_ring(context)
+        local_hosts = []
+        for host_state in hosts:
+            state_key = (host_state.host, host_state.nodename)
+            owner = self._node_owners.get(state_key)
+            if owner is None:
+                owner = ring.get_node('%s:%s' % state_key)
+                self._node_owners[state_key] = owner
+            if owner == CONF.host:
+                local_hosts.append(host_state)
+        return local_hosts
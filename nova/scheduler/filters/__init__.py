@@ -17,11 +17,41 @@
 Scheduler host filters
 """
 
+import time
+
+from oslo.config import cfg
+
 from nova import filters
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler import host_columns
+
+vectorized_filters_opt = cfg.BoolOpt('scheduler_use_vectorized_filters',
+        default=False,
+        help='Evaluate the filters that support it (RamFilter, CoreFilter, '
+             'DiskFilter, NumInstancesFilter, IoOpsFilter) over all hosts '
+             'at once using NumPy arrays, before running the remaining '
+             'filters on the hosts that passed. Requires NumPy.')
+
+CONF = cfg.CONF
+CONF.register_opt(vectorized_filters_opt)
+
+LOG = logging.getLogger(__name__)
 
 
 class BaseHostFilter(filters.BaseFilter):
     """Base class for host filters."""
+
+    # HostState attributes read by hosts_pass_vectorized(). Only filters
+    # listing some fields here are evaluated by the vectorized engine.
+    vectorized_fields = ()
+
+    # HostState attributes the result of host_passes() depends on. Set in a
+    # subclass whose result for a host can only change within a request if
+    # one of these attributes is changed by consume_from_instance(), so that
+    # it can be remembered by HostFilterResultCache. None means never cache.
+    cache_fields = None
+
     def _filter_one(self, obj, filter_properties):
         """Return True if the object passes the filter, otherwise False."""
         return self.host_passes(obj, filter_properties)
@@ -32,10 +62,124 @@ class BaseHostFilter(filters.BaseFilter):
         """
         raise NotImplementedError()
 
+    def hosts_pass_vectorized(self, columns, filter_properties):
+        """Return a boolean array, True for each row of the HostStateColumns
+        passing the filter. May return None if the request cannot be checked
+        this way, in which case host_passes() is used instead.
+        Override this in a subclass that sets vectorized_fields.
+        """
+        raise NotImplementedError()
+
+
+class HostFilterResultCache(object):
+    """Remember host filter results across the instances of a request.
+
+    A result is reused unless consume_from_instance() ran on the host since
+    it was computed and may have changed one of the filter's cache_fields.
+    """
+
+    def __init__(self):
+        self._results = {}
+        # Number of results reused instead of running the filter
+        self.hits = 0
+
+    def filter_all(self, filter, host_states, filter_properties):
+        # NOTE: filters overriding filter_all() may look at all hosts at
+        #       once, so their per host results are not cached.
+        if (filter.cache_fields is None or
+                filter.filter_all.__func__ is not
+                filters.BaseFilter.filter_all.__func__):
+            return filter.filter_all(host_states, filter_properties)
+        return self._filter_all(filter, host_states, filter_properties)
+
+    def _filter_all(self, filter, host_states, filter_properties):
+        cache_fields = frozenset(filter.cache_fields)
+        results = self._results.setdefault(filter.__class__, {})
+        for host_state in host_states:
+            cached = results.get(host_state)
+            if (cached is None or
+                    (cached[1] != host_state.consume_generation and
+                     cache_fields & host_state.consumed_fields)):
+                passes = filter._filter_one(host_state, filter_properties)
+                results[host_state] = (passes,
+                                       host_state.consume_generation)
+            else:
+                passes = cached[0]
+                self.hits += 1
+            if passes:
+                yield host_state
+
 
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
+        if (CONF.scheduler_use_vectorized_filters and
+                not host_columns.is_available()):
+            LOG.warn(_("scheduler_use_vectorized_filters is set but NumPy "
+                       "is not available, filters will be run per host"))
+
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties, index=0, filter_cache=None, trace=None):
+        if not (CONF.scheduler_use_vectorized_filters and
+                host_columns.is_available()):
+            return super(HostFilterHandler, self).get_filtered_objects(
+                    filter_classes, objs, filter_properties, index,
+                    filter_cache=filter_cache, trace=trace)
+
+        vectorized = []
+        remaining_classes = []
+        for filter_cls in filter_classes:
+            if not filter_cls.vectorized_fields:
+                remaining_classes.append(filter_cls)
+                continue
+            filter = filter_cls()
+            if filter.run_filter_for_index(index):
+                vectorized.append(filter)
+
+        if vectorized:
+            objs, fallback_classes = self._filter_vectorized(vectorized,
+                    list(objs), filter_properties, trace=trace)
+            remaining_classes = fallback_classes + remaining_classes
+
+        # NOTE: the per host filters only see the hosts that passed the
+        #       vectorized ones.
+        return super(HostFilterHandler, self).get_filtered_objects(
+                remaining_classes, objs, filter_properties, index,
+                filter_cache=filter_cache, trace=trace)
+
+    def _filter_vectorized(self, vectorized_filters, hosts,
+                           filter_properties, trace=None):
+        """Run vectorized filters as a single mask over all hosts.
+
+        Returns the passing hosts and the classes of the filters which
+        could not be evaluated this way.
+        """
+        fields = set()
+        for filter in vectorized_filters:
+            fields.update(filter.vectorized_fields)
+        columns = host_columns.HostStateColumns(hosts, fields)
+
+        mask = None
+        fallback_classes = []
+        for filter in vectorized_filters:
+            cls_name = filter.__class__.__name__
+            start = time.time()
+            passes = filter.hosts_pass_vectorized(columns, filter_properties)
+            if passes is None:
+                fallback_classes.append(filter.__class__)
+                continue
+            num_in = len(columns) if mask is None else mask.sum()
+            mask = passes if mask is None else mask & passes
+            if trace is not None:
+                trace.add_step('filter', cls_name, time.time() - start,
+                               int(num_in), int(mask.sum()))
+            LOG.debug(_("Vectorized filter %(cls_name)s passes %(num)d of "
+                        "%(total)d host(s)"),
+                      {'cls_name': cls_name, 'num': passes.sum(),
+                       'total': len(columns)})
+        if mask is None:
+            return hosts, fallback_classes
+        return columns.select(mask), fallback_classes
 
 
 def all_filters():
@@ -17,10 +17,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -37,6 +37,8 @@ CONF.register_opt(cpu_allocation_ratio_opt)
 
 class BaseCoreFilter(filters.BaseHostFilter):
 
+    cache_fields = ('vcpus_total', 'vcpus_used')
+
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         raise NotImplementedError
 
@@ -67,9 +69,26 @@ class BaseCoreFilter(filters.BaseHostFilter):
 class CoreFilter(BaseCoreFilter):
     """CoreFilter filters based on CPU core utilization."""
 
+    vectorized_fields = ('vcpus_total', 'vcpus_used')
+
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def hosts_pass_vectorized(self, columns, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return None
+
+        unknown_vcpus = columns.vcpus_total == 0
+        if unknown_vcpus.any():
+            # Fail safe
+            LOG.warning(_("VCPUs not set; assuming CPU collection broken"))
+
+        vcpus_total = columns.vcpus_total * CONF.cpu_allocation_ratio
+        columns.set_limit('vcpu', vcpus_total, where=vcpus_total > 0)
+        return unknown_vcpus | (vcpus_total - columns.vcpus_used >=
+                                instance_type['vcpus'])
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -78,12 +97,8 @@ class AggregateCoreFilter(BaseCoreFilter):
     """
 
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='cpu_allocation_ratio')
+        metadata = utils.aggregate_metadata_get_by_host(
+                     filter_properties, host_state, key='cpu_allocation_ratio')
         aggregate_vals = metadata.get('cpu_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
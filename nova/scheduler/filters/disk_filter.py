@@ -31,12 +31,19 @@ CONF.register_opt(disk_allocation_ratio_opt)
 class DiskFilter(filters.BaseHostFilter):
     """Disk Filter with over subscription flag."""
 
+    cache_fields = ('free_disk_mb', 'total_usable_disk_gb')
+    vectorized_fields = ('free_disk_mb', 'total_usable_disk_gb')
+
+    @staticmethod
+    def _requested_disk_mb(instance_type):
+        return (1024 * (instance_type['root_gb'] +
+                        instance_type['ephemeral_gb']) +
+                instance_type['swap'])
+
     def host_passes(self, host_state, filter_properties):
         """Filter based on disk usage."""
         instance_type = filter_properties.get('instance_type')
-        requested_disk = (1024 * (instance_type['root_gb'] +
-                                 instance_type['ephemeral_gb']) +
-                         instance_type['swap'])
+        requested_disk = self._requested_disk_mb(instance_type)
 
         free_disk_mb = host_state.free_disk_mb
         total_usable_disk_mb = host_state.total_usable_disk_gb * 1024
@@ -56,3 +63,12 @@ class DiskFilter(filters.BaseHostFilter):
         disk_gb_limit = disk_mb_limit / 1024
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
+
+    def hosts_pass_vectorized(self, columns, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        requested_disk = self._requested_disk_mb(instance_type)
+        total_usable_disk_mb = columns.total_usable_disk_gb * 1024
+        disk_mb_limit = total_usable_disk_mb * CONF.disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - columns.free_disk_mb
+        columns.set_limit('disk_gb', disk_mb_limit / 1024)
+        return disk_mb_limit - used_disk_mb >= requested_disk
@@ -36,6 +36,8 @@ class MetricsFilter(filters.BaseHostFilter):
     these hosts.
     """
 
+    cache_fields = ('metrics',)
+
     def __init__(self):
         super(MetricsFilter, self).__init__()
         opts = utils.parse_options(CONF.metrics.weight_setting,
@@ -32,6 +32,9 @@ CONF.register_opt(max_instances_per_host_opt)
 class NumInstancesFilter(filters.BaseHostFilter):
     """Filter out hosts with too many instances."""
 
+    cache_fields = ('num_instances',)
+    vectorized_fields = ('num_instances',)
+
     def host_passes(self, host_state, filter_properties):
         num_instances = host_state.num_instances
         max_instances = CONF.max_instances_per_host
@@ -42,3 +45,6 @@ class NumInstancesFilter(filters.BaseHostFilter):
                         {'host_state': host_state,
                          'max_instances': max_instances})
         return passes
+
+    def hosts_pass_vectorized(self, columns, filter_properties):
+        return columns.num_instances < CONF.max_instances_per_host
@@ -16,10 +16,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -36,6 +36,8 @@ CONF.register_opt(ram_allocation_ratio_opt)
 
 class BaseRamFilter(filters.BaseHostFilter):
 
+    cache_fields = ('free_ram_mb', 'total_usable_ram_mb')
+
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         raise NotImplementedError
 
@@ -69,9 +71,20 @@ class RamFilter(BaseRamFilter):
     """Ram Filter with over subscription flag."""
     ram_allocation_ratio = CONF.ram_allocation_ratio
 
+    vectorized_fields = ('free_ram_mb', 'total_usable_ram_mb')
+
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         return self.ram_allocation_ratio
 
+    def hosts_pass_vectorized(self, columns, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        requested_ram = instance_type['memory_mb']
+        memory_mb_limit = (columns.total_usable_ram_mb *
+                           self.ram_allocation_ratio)
+        used_ram_mb = columns.total_usable_ram_mb - columns.free_ram_mb
+        columns.set_limit('memory_mb', memory_mb_limit)
+        return memory_mb_limit - used_ram_mb >= requested_ram
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
@@ -80,12 +93,8 @@ class AggregateRamFilter(BaseRamFilter):
     """
 
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='ram_allocation_ratio')
+        metadata = utils.aggregate_metadata_get_by_host(
+                     filter_properties, host_state, key='ram_allocation_ratio')
         aggregate_vals = metadata.get('ram_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
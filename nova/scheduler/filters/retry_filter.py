@@ -25,6 +25,9 @@ class RetryFilter(filters.BaseHostFilter):
     purposes
     """
 
+    # Previously attempted hosts do not change within a request
+    cache_fields = ()
+
     def host_passes(self, host_state, filter_properties):
         """Skip nodes that have already been attempted."""
         retry = filter_properties.get('retry', None)
@@ -277,6 +277,8 @@ class ComputeAttestation(object):
 class TrustedFilter(filters.BaseHostFilter):
     """Trusted filter to support Trusted Compute Pools."""
 
+    cache_fields = ()
+
     def __init__(self):
         self.compute_attestation = ComputeAttestation()
 
@@ -0,0 +1,56 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Consistent hash ring, used to split hosts between scheduler workers.
+"""
+
+import bisect
+import hashlib
+import struct
+
+
+class HashRing(object):
+    """Map keys to one of a set of nodes.
+
+    Each node is placed on the ring several times (replicas) so keys are
+    spread evenly. Adding or removing a node only moves the keys that
+    node gains or loses; every other key keeps its node.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = frozenset(nodes)
+        ring = []
+        for node in self.nodes:
+            for replica in xrange(replicas):
+                ring.append((self._hash('%s-%d' % (node, replica)), node))
+        ring.sort()
+        self._hashes = [h for h, node in ring]
+        self._nodes = [node for h, node in ring]
+
+    @staticmethod
+    def _hash(key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return struct.unpack('>I', hashlib.md5(key).digest()[:4])[0]
+
+    def get_node(self, key):
+        """Return the node owning key, or None if the ring is empty."""
+        if not self._nodes:
+            return None
+        pos = bisect.bisect(self._hashes, self._hash(key))
+        if pos == len(self._hashes):
+            pos = 0
+        return self._nodes[pos]
@@ -0,0 +1,106 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of numeric HostState attributes, used to evaluate simple
+resource filters and weighers over all hosts at once.
+"""
+
+from nova.openstack.common import importutils
+
+np = importutils.try_import('numpy')
+
+
+def is_available():
+    """Return True if the vectorized host columns can be used."""
+    return np is not None
+
+
+def normalize(weights, minval=None, maxval=None):
+    """Array counterpart of nova.weights.normalize()."""
+    if not len(weights):
+        return weights
+
+    maxval = weights.max() if maxval is None else float(maxval)
+    minval = weights.min() if minval is None else float(minval)
+
+    if minval == maxval:
+        return np.zeros(len(weights))
+
+    return (weights - minval) / (maxval - minval)
+
+
+def best_rows(values, limit=None):
+    """Return the row indexes of values sorted by descending value.
+
+    If limit is set only the best limit rows are returned, picked with a
+    partial selection instead of a full sort. Rows of equal value keep
+    their original order.
+    """
+    if limit is not None and limit < len(values):
+        rows = np.argpartition(-values, limit - 1)[:limit]
+        rows.sort()
+        return rows[np.argsort(-values[rows], kind='mergesort')]
+    return np.argsort(-values, kind='mergesort')
+
+
+class HostStateColumns(object):
+    """Numeric HostState attributes laid out as one array per attribute.
+
+    Row i of every column describes hosts[i]. Columns are accessed as
+    attributes, e.g. columns.free_ram_mb.
+    """
+
+    def __init__(self, hosts, fields):
+        self.hosts = hosts
+        self._columns = {}
+        self._limits = {}
+        for field in fields:
+            self._columns[field] = np.fromiter(
+                    (getattr(host, field) for host in hosts),
+                    dtype=np.float64, count=len(hosts))
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['_columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def set_limit(self, name, values, where=None):
+        """Record an oversubscription limit to save on the selected hosts.
+
+        :param name: key in HostState.limits
+        :param values: array holding the limit of every row
+        :param where: optional boolean array, only rows set to True get
+                      the limit
+        """
+        self._limits[name] = (values, where)
+
+    def select(self, mask):
+        """Return the hosts whose row is True in mask.
+
+        Limits recorded with set_limit() are saved on each returned host.
+        """
+        selected = []
+        for idx in np.flatnonzero(mask):
+            host = self.hosts[idx]
+            for name, (values, where) in self._limits.iteritems():
+                if where is None or where[idx]:
+                    host.limits[name] = values[idx].item()
+            selected.append(host)
+        return selected
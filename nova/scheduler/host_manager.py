@@ -18,6 +18,7 @@ Manage hosts in the current zone.
 """
 
 import collections
+import datetime
 import UserDict
 
 from oslo.config import cfg
@@ -58,6 +59,20 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.BoolOpt('scheduler_incremental_host_states',
+                default=False,
+                help='Keep host states in memory between scheduling '
+                     'requests and only refresh the compute nodes that '
+                     'were created, updated or deleted since the last '
+                     'refresh, instead of rebuilding every host state '
+                     'on each request'),
+    cfg.IntOpt('scheduler_host_states_full_sync_interval',
+               default=600,
+               help='When scheduler_incremental_host_states is enabled, '
+                    'how often (in seconds) to rebuild all host states '
+                    'from every compute node regardless of changes. Also '
+                    'how often the in-memory index of host aggregates is '
+                    'reloaded from every aggregate'),
     ]
 
 CONF = cfg.CONF
@@ -65,6 +80,11 @@ CONF.register_opts(host_manager_opts)
 
 LOG = logging.getLogger(__name__)
 
+# Compute node updates are timestamped before their transaction commits, so
+# a row may become visible with an updated_at slightly older than the newest
+# one we have already seen. Look back this far to avoid missing it.
+_CHANGED_SINCE_MARGIN = datetime.timedelta(seconds=5)
+
 
 class ReadOnlyDict(UserDict.IterableUserDict):
     """A read-only dict."""
@@ -109,6 +129,13 @@ class HostState(object):
     previously used and lock down access.
     """
 
+    # Attributes which consume_from_instance() may change
+    consumed_fields = frozenset(['free_ram_mb', 'free_disk_mb', 'vcpus_used',
+                                 'updated', 'num_instances',
+                                 'num_instances_by_project', 'vm_states',
+                                 'task_states', 'num_instances_by_os_type',
+                                 'pci_stats', 'num_io_ops'])
+
     def __init__(self, host, node, capabilities=None, service=None):
         self.host = host
         self.nodename = node
@@ -147,6 +174,17 @@ class HostState(object):
         self.metrics = {}
 
         self.updated = None
+        # updated_at of the compute node row the resources were last read
+        # from, consume_from_instance() moves self.updated on but not this.
+        self._compute_updated_at = None
+
+        # Aggregates the host belongs to, as kept by the HostManager's
+        # aggregate index. None if the host is not indexed, in which case
+        # aggregate metadata has to be read from the database.
+        self.aggregates = None
+
+        # Incremented by every consume_from_instance() call
+        self.consume_generation = 0
 
     def update_capabilities(self, capabilities=None, service=None):
         # Read-only capability dicts
@@ -180,8 +218,8 @@ class HostState(object):
 
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
-        if (self.updated and compute['updated_at']
-                and self.updated > compute['updated_at']):
+        if (self._compute_updated_at and compute['updated_at']
+                and self._compute_updated_at >= compute['updated_at']):
             return
         all_ram_mb = compute['memory_mb']
 
@@ -207,6 +245,7 @@ class HostState(object):
         self.vcpus_total = compute['vcpus']
         self.vcpus_used = compute['vcpus_used']
         self.updated = compute['updated_at']
+        self._compute_updated_at = compute['updated_at']
         if 'pci_stats' in compute:
             self.pci_stats = pci_stats.PciDeviceStats(compute['pci_stats'])
         else:
@@ -273,6 +312,7 @@ class HostState(object):
         self.free_disk_mb -= disk_mb
         self.vcpus_used += vcpus
         self.updated = timeutils.utcnow()
+        self.consume_generation += 1
 
         # Track number of instances on host
         self.num_instances += 1
@@ -333,6 +373,17 @@ class HostManager(object):
         self.weight_handler = weights.HostWeightHandler()
         self.weight_classes = self.weight_handler.get_matching_classes(
                 CONF.scheduler_weight_classes)
+        # Newest compute node change seen and time of the last full sync,
+        # used by the incremental host state refresh.
+        self._last_changed_at = None
+        self._last_full_sync = None
+        # In-memory index of host aggregates:
+        # { aggregate id : { 'id', 'name', 'hosts', 'metadetails' } }
+        self.aggs_by_id = {}
+        # { host : set([aggregate id, ...]) }
+        self.host_aggregates_map = collections.defaultdict(set)
+        self._aggregates_synced_at = None
+        self._aggregates_full_sync = None
 
     def _choose_host_filters(self, filter_cls_names):
         """Since the caller may specify which filters to use we need
@@ -358,8 +409,13 @@ class HostManager(object):
         return good_filters
 
     def get_filtered_hosts(self, hosts, filter_properties,
-            filter_class_names=None, index=0):
-        """Filter hosts and return only ones passing all filters."""
+            filter_class_names=None, index=0, filter_cache=None, trace=None):
+        """Filter hosts and return only ones passing all filters.
+
+        A HostFilterResultCache may be given as filter_cache to reuse filter
+        results across the instances of a request, and a RequestTrace as
+        trace to record the time spent in each filter.
+        """
 
         def _strip_ignore_hosts(host_map, hosts_to_ignore):
             ignored_hosts = []
@@ -429,18 +485,30 @@ class HostManager(object):
             hosts = name_to_cls_map.itervalues()
 
         return self.filter_handler.get_filtered_objects(filter_classes,
-                hosts, filter_properties, index)
+                hosts, filter_properties, index, filter_cache=filter_cache,
+                trace=trace)
 
-    def get_weighed_hosts(self, hosts, weight_properties):
-        """Weigh the hosts."""
+    def get_weighed_hosts(self, hosts, weight_properties, limit=None,
+                          trace=None):
+        """Weigh the hosts.
+
+        If limit is set, only the best limit hosts are returned. If trace is
+        set, the time spent in each weigher is recorded in it.
+        """
         return self.weight_handler.get_weighed_objects(self.weight_classes,
-                hosts, weight_properties)
+                hosts, weight_properties, limit=limit, trace=trace)
 
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
         """
+        self._sync_aggregates(context)
+
+        if (CONF.scheduler_incremental_host_states and
+                not self._full_sync_needed()):
+            self._sync_changed_host_states(context)
+            return self.host_state_map.itervalues()
 
         # Get resource usage across the available compute nodes:
         compute_nodes = db.compute_node_get_all(context)
@@ -450,28 +518,148 @@ class HostManager(object):
             if not service:
                 LOG.warn(_("No service for compute ID %s") % compute['id'])
                 continue
-            host = service['host']
-            node = compute.get('hypervisor_hostname')
-            state_key = (host, node)
-            capabilities = self.service_states.get(state_key, None)
-            host_state = self.host_state_map.get(state_key)
-            if host_state:
-                host_state.update_capabilities(capabilities,
-                                               dict(service.iteritems()))
-            else:
-                host_state = self.host_state_cls(host, node,
-                        capabilities=capabilities,
-                        service=dict(service.iteritems()))
-                self.host_state_map[state_key] = host_state
-            host_state.update_from_compute_node(compute)
+            state_key = self._update_host_state(compute, service)
             seen_nodes.add(state_key)
 
         # remove compute nodes from host_state_map if they are not active
         dead_nodes = set(self.host_state_map.keys()) - seen_nodes
         for state_key in dead_nodes:
-            host, node = state_key
-            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
-                       "from scheduler") % {'host': host, 'node': node})
-            del self.host_state_map[state_key]
+            self._remove_host_state(state_key)
 
+        self._last_full_sync = timeutils.utcnow()
+        self._last_changed_at = self._newest_change(compute_nodes)
         return self.host_state_map.itervalues()
+
+    def _update_host_state(self, compute, service):
+        """Create or refresh the HostState of a compute node row."""
+        host = service['host']
+        node = compute.get('hypervisor_hostname')
+        state_key = (host, node)
+        capabilities = self.service_states.get(state_key, None)
+        host_state = self.host_state_map.get(state_key)
+        if host_state:
+            host_state.update_capabilities(capabilities,
+                                           dict(service.iteritems()))
+        else:
+            host_state = self.host_state_cls(host, node,
+                    capabilities=capabilities,
+                    service=dict(service.iteritems()))
+            self.host_state_map[state_key] = host_state
+            host_state.aggregates = self._get_host_aggregates(host)
+        host_state.update_from_compute_node(compute)
+        return state_key
+
+    def _remove_host_state(self, state_key):
+        host, node = state_key
+        LOG.info(_("Removing dead compute node %(host)s:%(node)s "
+                   "from scheduler") % {'host': host, 'node': node})
+        del self.host_state_map[state_key]
+
+    def _full_sync_needed(self):
+        if self._last_full_sync is None or self._last_changed_at is None:
+            return True
+        return timeutils.is_older_than(self._last_full_sync,
+                CONF.scheduler_host_states_full_sync_interval)
+
+    @staticmethod
+    def _newest_change(compute_nodes, newest=None):
+        for compute in compute_nodes:
+            for key in ('created_at', 'updated_at', 'deleted_at'):
+                changed_at = compute.get(key)
+                if changed_at and (newest is None or changed_at > newest):
+                    newest = changed_at
+        return newest
+
+    def _sync_changed_host_states(self, context):
+        """Refresh only the host states whose compute node changed.
+
+        Host states of unchanged compute nodes are kept as they are,
+        including any resources consumed locally by consume_from_instance(),
+        until their compute node reports newer data.
+        """
+        # Service records change on every heartbeat, which filters such as
+        # the ComputeFilter depend on, so they are all read again. The
+        # changed compute nodes are joined to them here.
+        services = dict((service['id'], service)
+                        for service in db.service_get_all(context))
+        changed_since = self._last_changed_at - _CHANGED_SINCE_MARGIN
+        compute_nodes = db.compute_node_get_all_changed_since(context,
+                                                              changed_since)
+        for compute in compute_nodes:
+            service = services.get(compute['service_id'])
+            if compute['deleted'] or not service:
+                state_key = (service and service['host'],
+                             compute.get('hypervisor_hostname'))
+                if state_key in self.host_state_map:
+                    self._remove_host_state(state_key)
+                continue
+            self._update_host_state(compute, service)
+
+        for state_key, host_state in self.host_state_map.items():
+            service = services.get(host_state.service.get('id'))
+            if not service:
+                self._remove_host_state(state_key)
+                continue
+            updated_at = service.get('updated_at')
+            if (updated_at is not None and
+                    updated_at == host_state.service.get('updated_at')):
+                continue
+            host_state.update_capabilities(
+                    self.service_states.get(state_key, None),
+                    dict(service.iteritems()))
+
+        self._last_changed_at = self._newest_change(compute_nodes,
+                                                    self._last_changed_at)
+
+    def _get_host_aggregates(self, host):
+        return [self.aggs_by_id[agg_id]
+                for agg_id in self.host_aggregates_map.get(host, ())]
+
+    def _update_aggregate(self, aggregate):
+        """Replace the indexed copy of an aggregate row."""
+        agg_id = aggregate['id']
+        old = self.aggs_by_id.pop(agg_id, None)
+        if old:
+            for host in old['hosts']:
+                self.host_aggregates_map[host].discard(agg_id)
+                if not self.host_aggregates_map[host]:
+                    del self.host_aggregates_map[host]
+        if aggregate['deleted']:
+            return
+        self.aggs_by_id[agg_id] = {'id': agg_id,
+                                   'name': aggregate['name'],
+                                   'hosts': list(aggregate['hosts']),
+                                   'metadetails':
+                                       dict(aggregate['metadetails'])}
+        for host in aggregate['hosts']:
+            self.host_aggregates_map[host].add(agg_id)
+
+    def _sync_aggregates(self, context):
+        """Refresh the in-memory index of host aggregates.
+
+        Every aggregate is loaded on the first call and then every
+        scheduler_host_states_full_sync_interval seconds. In between only
+        the aggregates changed since the previous refresh are reloaded.
+        """
+        synced_at = timeutils.utcnow()
+        if (self._aggregates_full_sync is None or
+                timeutils.is_older_than(self._aggregates_full_sync,
+                    CONF.scheduler_host_states_full_sync_interval)):
+            aggregates = db.aggregate_get_all(context)
+            self.aggs_by_id = {}
+            self.host_aggregates_map = collections.defaultdict(set)
+            self._aggregates_full_sync = synced_at
+            changed = True
+        else:
+            changed_since = self._aggregates_synced_at - _CHANGED_SINCE_MARGIN
+            aggregates = db.aggregate_get_all_changed_since(context,
+                                                            changed_since)
+            changed = bool(aggregates)
+        for aggregate in aggregates:
+            self._update_aggregate(aggregate)
+        self._aggregates_synced_at = synced_at
+
+        if changed:
+            for host_state in self.host_state_map.itervalues():
+                host_state.aggregates = self._get_host_aggregates(
+                        host_state.host)
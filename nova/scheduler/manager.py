@@ -298,10 +298,24 @@ class SchedulerManager(manager.Manager):
             filter_properties)
         return jsonutils.to_primitive(dests)
 
+    def get_scheduling_traces(self, context, limit=None,
+                              no_valid_host=False):
+        """Returns the most recent scheduling request traces of this
+        scheduler, newest first.
+        """
+        return jsonutils.to_primitive(self.driver.tracer.get_traces(
+                limit=limit, no_valid_host=no_valid_host))
+
+    def get_scheduling_stats(self, context):
+        """Returns the time spent and hosts kept by every filter and
+        weigher of this scheduler since it started.
+        """
+        return self.driver.tracer.get_stats()
+
 
 class _SchedulerManagerV3Proxy(object):
 
-    target = messaging.Target(version='3.0')
+    target = messaging.Target(version='3.2')
 
     def __init__(self, manager):
         self.manager = manager
@@ -326,3 +340,10 @@ class _SchedulerManagerV3Proxy(object):
                 instance_type=instance_type, image=image,
                 request_spec=request_spec, filter_properties=filter_properties,
                 reservations=reservations)
+
+    def get_scheduling_traces(self, ctxt, limit, no_valid_host):
+        return self.manager.get_scheduling_traces(ctxt, limit=limit,
+                no_valid_host=no_valid_host)
+
+    def get_scheduling_stats(self, ctxt):
+        return self.manager.get_scheduling_stats(ctxt)
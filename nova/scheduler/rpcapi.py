@@ -35,6 +35,7 @@ CONF.register_opts(rpcapi_opts)
 rpcapi_cap_opt = cfg.StrOpt('scheduler',
         help='Set a version cap for messages sent to scheduler services')
 CONF.register_opt(rpcapi_cap_opt, 'upgrade_levels')
+CONF.import_opt('compact_object_payloads', 'nova.objects.base')
 
 
 class SchedulerAPI(object):
@@ -80,6 +81,9 @@ class SchedulerAPI(object):
         ... - Deprecated select_hosts()
 
         3.0 - Removed backwards compat
+        3.1 - Added get_scheduling_traces() and get_scheduling_stats()
+        3.2 - Objects may be sent in the compact form of
+              objects_base.compact_primitive()
     '''
 
     VERSION_ALIASES = {
@@ -96,9 +100,23 @@ class SchedulerAPI(object):
         serializer = objects_base.NovaObjectSerializer()
         self.client = rpc.get_client(target, version_cap=version_cap,
                                      serializer=serializer)
+        self._compact_client = rpc.get_client(
+            target, version_cap=version_cap,
+            serializer=objects_base.NovaObjectSerializer(compact=True))
+
+    def _prepare(self):
+        """Prepare a call which may send its objects in compact form.
+
+        The compact form is used if compact_object_payloads is set and the
+        message can be stamped with 3.2.
+        """
+        if (CONF.compact_object_payloads and
+                self.client.can_send_version('3.2')):
+            return self._compact_client.prepare(version='3.2')
+        return self.client.prepare()
 
     def select_destinations(self, ctxt, request_spec, filter_properties):
-        cctxt = self.client.prepare()
+        cctxt = self._prepare()
         return cctxt.call(ctxt, 'select_destinations',
             request_spec=request_spec, filter_properties=filter_properties)
 
@@ -112,7 +130,7 @@ class SchedulerAPI(object):
                       'is_first_time': is_first_time,
                       'filter_properties': filter_properties,
                       'legacy_bdm_in_spec': legacy_bdm_in_spec}
-        cctxt = self.client.prepare()
+        cctxt = self._prepare()
         cctxt.cast(ctxt, 'run_instance', **msg_kwargs)
 
     def prep_resize(self, ctxt, instance, instance_type, image,
@@ -121,9 +139,25 @@ class SchedulerAPI(object):
         instance_type_p = jsonutils.to_primitive(instance_type)
         reservations_p = jsonutils.to_primitive(reservations)
         image_p = jsonutils.to_primitive(image)
-        cctxt = self.client.prepare()
+        cctxt = self._prepare()
         cctxt.cast(ctxt, 'prep_resize',
                    instance=instance_p, instance_type=instance_type_p,
                    image=image_p, request_spec=request_spec,
                    filter_properties=filter_properties,
                    reservations=reservations_p)
+
+    def get_scheduling_traces(self, ctxt, host=None, limit=None,
+                              no_valid_host=False):
+        """Get the most recent scheduling request traces.
+
+        Every scheduler keeps its own traces, host selects the scheduler
+        to ask. Any scheduler is asked if it is not set.
+        """
+        cctxt = self.client.prepare(server=host, version='3.1')
+        return cctxt.call(ctxt, 'get_scheduling_traces', limit=limit,
+                          no_valid_host=no_valid_host)
+
+    def get_scheduling_stats(self, ctxt, host=None):
+        """Get the filter and weigher totals of a scheduler."""
+        cctxt = self.client.prepare(server=host, version='3.1')
+        return cctxt.call(ctxt, 'get_scheduling_stats')
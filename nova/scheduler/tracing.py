@@ -0,0 +1,173 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Record how scheduling requests went through the filters and weighers.
+
+Each request gets a RequestTrace listing, for every filter and weigher
+run, its wall time and how many hosts it was given and kept. The last
+traces are kept in memory and per filter and weigher totals are summed,
+both can be read through the scheduler RPC API.
+"""
+
+import collections
+import time
+
+from oslo.config import cfg
+
+from nova.openstack.common import timeutils
+
+tracing_opts = [
+    cfg.BoolOpt('scheduler_tracing',
+                default=True,
+                help='Record the time spent and the number of hosts kept '
+                     'by each filter and weigher for every scheduling '
+                     'request'),
+    cfg.IntOpt('scheduler_trace_buffer_size',
+               default=100,
+               help='Number of most recent scheduling request traces kept '
+                    'in memory by each scheduler'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(tracing_opts)
+
+
+class RequestTrace(object):
+    """Steps taken to schedule a single request."""
+
+    def __init__(self, request_id, instance_uuids, num_instances):
+        self.request_id = request_id
+        self.instance_uuids = instance_uuids
+        self.num_instances = num_instances
+        self.started_at = timeutils.utcnow()
+        self._start = time.time()
+        self.elapsed = None
+        self.steps = []
+        self.hosts = []
+        self.no_valid_host = False
+
+    def add_step(self, kind, name, elapsed, hosts_in, hosts_out,
+                 cache_hits=0):
+        """Record one run of a filter or weigher.
+
+        :param kind: 'filter' or 'weigher'
+        :param name: class name of the filter or weigher
+        :param elapsed: wall time in seconds
+        :param hosts_in: number of hosts given to it
+        :param hosts_out: number of hosts it kept
+        :param cache_hits: number of results reused from a filter cache
+        """
+        self.steps.append((kind, name, elapsed, hosts_in, hosts_out,
+                           cache_hits))
+
+    def finish(self, hosts):
+        """Record the names of the hosts selected for the request."""
+        self.elapsed = time.time() - self._start
+        self.hosts = hosts
+        self.no_valid_host = len(hosts) < self.num_instances
+
+    def stopped_by(self):
+        """Return the name of the filter which left no host, if any."""
+        for kind, name, elapsed, hosts_in, hosts_out, cache_hits in reversed(
+                self.steps):
+            if kind == 'filter' and not hosts_out:
+                return name
+        return None
+
+    def to_dict(self):
+        return {'request_id': self.request_id,
+                'instance_uuids': self.instance_uuids,
+                'num_instances': self.num_instances,
+                'started_at': timeutils.strtime(self.started_at),
+                'elapsed': self.elapsed,
+                'hosts': self.hosts,
+                'no_valid_host': self.no_valid_host,
+                'stopped_by': self.stopped_by(),
+                'steps': [{'kind': kind, 'name': name, 'elapsed': elapsed,
+                           'hosts_in': hosts_in, 'hosts_out': hosts_out,
+                           'cache_hits': cache_hits}
+                          for (kind, name, elapsed, hosts_in, hosts_out,
+                               cache_hits) in self.steps]}
+
+
+class SchedulerTracer(object):
+    """Keep the most recent RequestTraces and running totals."""
+
+    def __init__(self):
+        self._traces = collections.deque(
+                maxlen=max(CONF.scheduler_trace_buffer_size, 0))
+        self._requests = 0
+        self._no_valid_host = 0
+        # { (kind, name) : [calls, elapsed, hosts_in, hosts_out,
+        #                   cache_hits] }
+        self._counters = collections.defaultdict(lambda: [0, 0.0, 0, 0, 0])
+
+    def start_trace(self, context, instance_uuids=None, num_instances=1):
+        """Return a new RequestTrace, or None if tracing is disabled."""
+        if not CONF.scheduler_tracing:
+            return None
+        return RequestTrace(getattr(context, 'request_id', None),
+                            instance_uuids, num_instances)
+
+    def finish_trace(self, trace, hosts):
+        """Record the outcome of a request and add its trace to the buffer.
+
+        :param hosts: names of the hosts selected for the request
+        """
+        trace.finish(hosts)
+        self._requests += 1
+        if trace.no_valid_host:
+            self._no_valid_host += 1
+        for kind, name, elapsed, hosts_in, hosts_out, cache_hits in (
+                trace.steps):
+            counter = self._counters[(kind, name)]
+            counter[0] += 1
+            counter[1] += elapsed
+            counter[2] += hosts_in
+            counter[3] += hosts_out
+            counter[4] += cache_hits
+        self._traces.append(trace)
+
+    def get_traces(self, limit=None, no_valid_host=False):
+        """Return the most recent traces as dicts, newest first.
+
+        :param limit: maximum number of traces to return
+        :param no_valid_host: only return the requests which did not get
+                              a host for every instance
+        """
+        traces = []
+        for trace in reversed(self._traces):
+            if limit is not None and len(traces) >= limit:
+                break
+            if no_valid_host and not trace.no_valid_host:
+                continue
+            traces.append(trace.to_dict())
+        return traces
+
+    def get_stats(self):
+        """Return the totals of every filter and weigher since startup."""
+        stats = {'requests': self._requests,
+                 'no_valid_host': self._no_valid_host,
+                 'filters': {},
+                 'weighers': {}}
+        for (kind, name), counter in self._counters.iteritems():
+            calls, elapsed, hosts_in, hosts_out, cache_hits = counter
+            stats[kind + 's'][name] = {'calls': calls,
+                                       'elapsed': elapsed,
+                                       'hosts_in': hosts_in,
+                                       'hosts_out': hosts_out,
+                                       'cache_hits': cache_hits}
+        return stats
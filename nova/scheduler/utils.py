@@ -14,6 +14,7 @@
 
 """Utility methods for scheduling."""
 
+import collections
 import sys
 
 from nova.compute import flavors
@@ -167,3 +168,25 @@ def parse_options(opts, sep='=', converter=str, name=""):
                 {'name': name,
                  'options': ", ".join(bad)})
     return good
+
+
+def aggregate_metadata_get_by_host(filter_properties, host_state, key=None):
+    """Return the metadata of the aggregates a host belongs to.
+
+    Same result as db.aggregate_metadata_get_by_host(), a dict mapping each
+    metadata key to the set of its values, but read from the HostManager's
+    aggregate index in host_state.aggregates when the host is indexed.
+    """
+    if host_state.aggregates is None:
+        context = filter_properties['context'].elevated()
+        return db.aggregate_metadata_get_by_host(context, host_state.host,
+                                                 key=key)
+
+    metadata = collections.defaultdict(set)
+    for aggregate in host_state.aggregates:
+        if key is None:
+            for k, v in aggregate['metadetails'].iteritems():
+                metadata[k].add(v)
+        elif key in aggregate['metadetails']:
+            metadata[key].add(aggregate['metadetails'][key])
+    return dict(metadata)
@@ -17,11 +17,25 @@
 Scheduler host weights
 """
 
+import time
+
 from oslo.config import cfg
 
+from nova.openstack.common.gettextutils import _
+from nova.openstack.common import log as logging
+from nova.scheduler import host_columns
 from nova import weights
 
+vectorized_weighers_opt = cfg.BoolOpt('scheduler_use_vectorized_weighers',
+        default=False,
+        help='Compute the weights of all hosts at once using NumPy arrays, '
+             'for the weighers that support it, and pick the best hosts '
+             'without sorting every host. Requires NumPy.')
+
 CONF = cfg.CONF
+CONF.register_opt(vectorized_weighers_opt)
+
+LOG = logging.getLogger(__name__)
 
 
 class WeighedHost(weights.WeighedObject):
@@ -37,7 +51,22 @@ class WeighedHost(weights.WeighedObject):
 
 class BaseHostWeigher(weights.BaseWeigher):
     """Base class for host weights."""
-    pass
+
+    # HostState attributes read by weigh_columns()
+    vectorized_fields = ()
+
+    def weigh_columns(self, columns, weight_properties):
+        """Return an array with the weight of each row of the
+        HostStateColumns.
+
+        By default every host is weighed through weigh_objects(). Override
+        in a subclass to compute all the weights at once.
+        """
+        weighed_objs = [weights.WeighedObject(host, 0.0)
+                        for host in columns.hosts]
+        return host_columns.np.array(
+                self.weigh_objects(weighed_objs, weight_properties),
+                dtype=host_columns.np.float64)
 
 
 class HostWeightHandler(weights.BaseWeightHandler):
@@ -45,6 +74,49 @@ class HostWeightHandler(weights.BaseWeightHandler):
 
     def __init__(self):
         super(HostWeightHandler, self).__init__(BaseHostWeigher)
+        if (CONF.scheduler_use_vectorized_weighers and
+                not host_columns.is_available()):
+            LOG.warn(_("scheduler_use_vectorized_weighers is set but NumPy "
+                       "is not available, hosts will be weighed one by one"))
+
+    def get_weighed_objects(self, weigher_classes, obj_list,
+            weighing_properties, limit=None, trace=None):
+        if not (CONF.scheduler_use_vectorized_weighers and
+                host_columns.is_available()):
+            return super(HostWeightHandler, self).get_weighed_objects(
+                    weigher_classes, obj_list, weighing_properties,
+                    limit=limit, trace=trace)
+
+        hosts = list(obj_list)
+        if not hosts:
+            return []
+
+        weighers = [weigher_cls() for weigher_cls in weigher_classes]
+        fields = set()
+        for weigher in weighers:
+            fields.update(weigher.vectorized_fields)
+        columns = host_columns.HostStateColumns(hosts, fields)
+
+        total = host_columns.np.zeros(len(hosts))
+        for weigher in weighers:
+            start = time.time()
+            weights = weigher.weigh_columns(columns, weighing_properties)
+            # Like weigh_objects(), preset bounds are widened to include
+            # every weight.
+            minval = weights.min()
+            if weigher.minval is not None:
+                minval = min(minval, weigher.minval)
+            maxval = weights.max()
+            if weigher.maxval is not None:
+                maxval = max(maxval, weigher.maxval)
+            total += weigher.weight_multiplier() * host_columns.normalize(
+                    weights, minval=minval, maxval=maxval)
+            if trace is not None:
+                trace.add_step('weigher', weigher.__class__.__name__,
+                               time.time() - start, len(hosts), len(hosts))
+
+        return [self.object_class(hosts[row], total[row].item())
+                for row in host_columns.best_rows(total, limit)]
 
 
 def all_weighers():
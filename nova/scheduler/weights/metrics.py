@@ -29,6 +29,7 @@ in the configuration file as the followings:
 from oslo.config import cfg
 
 from nova import exception
+from nova.scheduler import host_columns
 from nova.scheduler import utils
 from nova.scheduler import weights
 
@@ -102,3 +103,32 @@ class MetricsWeigher(weights.BaseHostWeigher):
                         return CONF.metrics.weight_of_unavailable
 
         return value
+
+    def weigh_columns(self, columns, weight_properties):
+        np = host_columns.np
+        values = np.zeros(len(columns))
+        unavailable = np.zeros(len(columns), dtype=bool)
+
+        for (name, ratio) in self.setting:
+            metric = np.fromiter(
+                    (host_state.metrics[name].value
+                     if name in host_state.metrics else np.nan
+                     for host_state in columns.hosts),
+                    dtype=np.float64, count=len(columns))
+            missing = np.isnan(metric)
+            if missing.any():
+                if CONF.metrics.required:
+                    host_state = columns.hosts[np.flatnonzero(missing)[0]]
+                    raise exception.ComputeHostMetricNotFound(
+                            host=host_state.host,
+                            node=host_state.nodename,
+                            name=name)
+                # Same as in _weigh_object(), unavailable metrics only
+                # matter if they have a non zero ratio.
+                if ratio * self.weight_multiplier() != 0:
+                    unavailable |= missing
+                metric[missing] = 0.0
+            values += metric * ratio
+
+        values[unavailable] = CONF.metrics.weight_of_unavailable
+        return values
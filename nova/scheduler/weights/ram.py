@@ -38,6 +38,8 @@ CONF.register_opts(ram_weight_opts)
 class RAMWeigher(weights.BaseHostWeigher):
     minval = 0
 
+    vectorized_fields = ('free_ram_mb',)
+
     def weight_multiplier(self):
         """Override the weight multiplier."""
         return CONF.ram_weight_multiplier
@@ -45,3 +47,6 @@ class RAMWeigher(weights.BaseHostWeigher):
     def _weigh_object(self, host_state, weight_properties):
         """Higher weights win.  We want spreading to be the default."""
         return host_state.free_ram_mb
+
+    def weigh_columns(self, columns, weight_properties):
+        return columns.free_ram_mb
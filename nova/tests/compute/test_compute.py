@@ -156,7 +156,8 @@ class BaseTestCase(test.TestCase):
     def setUp(self):
         super(BaseTestCase, self).setUp()
         self.flags(compute_driver='nova.virt.fake.FakeDriver',
-                   network_manager='nova.network.manager.FlatManager')
+                   network_manager='nova.network.manager.FlatManager',
+                   resource_audit_interval=0)
         fake.set_nodes([NODENAME])
         self.flags(use_local=True, group='conductor')
 
@@ -609,6 +610,37 @@ class ComputeVolumeTestCase(BaseTestCase):
         self.compute._poll_bandwidth_usage(ctxt)
         self.mox.UnsetStubs()
 
+    @mock.patch.object(utils, 'last_completed_audit_period')
+    @mock.patch.object(instance_obj.InstanceList, 'get_by_host')
+    def test_poll_bandwidth_usage_with_data(self, mock_get_by_host,
+                                            mock_audit_period):
+        ctxt = context.get_admin_context()
+        mock_audit_period.return_value = (0, 10)
+        mock_get_by_host.return_value = ['fake-instance1', 'fake-instance2']
+        bw_counters = [{'uuid': 'fake-uuid1', 'mac_address': 'fake-mac1',
+                        'bw_in': 10, 'bw_out': 20},
+                       {'uuid': 'fake-uuid2', 'mac_address': 'fake-mac2',
+                        'bw_in': 30, 'bw_out': 40}]
+        self.flags(bandwidth_poll_interval=1)
+        self.flags(bandwidth_update_interval=0, group='cells')
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        self.addCleanup(timeutils.clear_time_override)
+
+        with contextlib.nested(
+            mock.patch.object(self.compute.driver, 'get_all_bw_counters',
+                              return_value=bw_counters),
+            mock.patch.object(self.compute.conductor_api,
+                              'bw_usage_update_many'),
+        ) as (mock_get_counters, mock_update_many):
+            self.compute._poll_bandwidth_usage(ctxt)
+
+        mock_get_counters.assert_called_once_with(
+            ['fake-instance1', 'fake-instance2'])
+        mock_update_many.assert_called_once_with(
+            ctxt, 10, 0, bw_counters, last_refreshed=now,
+            update_cells=False)
+
     @mock.patch.object(instance_obj.InstanceList, 'get_by_host')
     @mock.patch.object(block_device_obj.BlockDeviceMappingList,
                        'get_by_instance_uuid')
@@ -3532,6 +3564,17 @@ class ComputeTestCase(BaseTestCase):
         self.compute._delete_instance(self.context, instance, [],
                                       self.none_quotas)
 
+    def test_delete_instance_updates_resource_tracker(self):
+        instance = self._create_fake_instance_obj()
+
+        with mock.patch.object(self.compute,
+                               '_update_resource_tracker') as mock_update:
+            self.compute._delete_instance(self.context, instance, [],
+                                          self.none_quotas)
+        mock_update.assert_called_once_with(self.context, instance)
+        self.assertEqual(vm_states.DELETED,
+                         mock_update.call_args[0][1].vm_state)
+
     def test_delete_instance_keeps_net_on_power_off_fail(self):
         self.mox.StubOutWithMock(self.compute.driver, 'destroy')
         self.mox.StubOutWithMock(self.compute, '_deallocate_network')
@@ -5354,6 +5397,8 @@ class ComputeTestCase(BaseTestCase):
         self.compute._get_compute_info(mox.IgnoreArg(),
                                        mox.IgnoreArg()).AndReturn(
                                                         fake_compute_info)
+        self.mox.StubOutWithMock(self.compute, '_request_resource_audit')
+        self.compute._request_resource_audit(hypervisor_hostname)
         updated = self._finish_post_live_migration_at_destination()
         self.assertEqual(updated['node'], hypervisor_hostname)
 
@@ -5731,20 +5776,20 @@ class ComputeTestCase(BaseTestCase):
 
     def test_heal_instance_info_cache(self):
         # Update on every call for the test
-        self.flags(heal_instance_info_cache_interval=-1)
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=2)
         ctxt = context.get_admin_context()
 
         instance_map = {}
         instances = []
-        for x in xrange(8):
+        for x in xrange(6):
             inst_uuid = 'fake-uuid-%s' % x
             instance_map[inst_uuid] = fake_instance.fake_db_instance(
                 uuid=inst_uuid, host=CONF.host, created_at=None)
-            # These won't be in our instance since they're not requested
             instances.append(instance_map[inst_uuid])
 
-        call_info = {'get_all_by_host': 0, 'get_by_uuid': 0,
-                'get_nw_info': 0, 'expected_instance': None}
+        call_info = {'get_all_by_host': 0, 'get_all_by_filters': 0,
+                     'healed': []}
 
         def fake_instance_get_all_by_host(context, host,
                                           columns_to_join, use_slave=False):
@@ -5752,75 +5797,72 @@ class ComputeTestCase(BaseTestCase):
             self.assertEqual([], columns_to_join)
             return instances[:]
 
-        def fake_instance_get_by_uuid(context, instance_uuid,
-                                      columns_to_join, use_slave=False):
-            if instance_uuid not in instance_map:
-                raise exception.InstanceNotFound(instance_id=instance_uuid)
-            call_info['get_by_uuid'] += 1
-            self.assertEqual(['system_metadata'], columns_to_join)
-            return instance_map[instance_uuid]
-
-        # NOTE(comstud): Override the stub in setUp()
-        def fake_get_instance_nw_info(context, instance, use_slave=False):
-            # Note that this exception gets caught in compute/manager
-            # and is ignored.  However, the below increment of
-            # 'get_nw_info' won't happen, and you'll get an assert
-            # failure checking it below.
-            self.assertEqual(call_info['expected_instance']['uuid'],
-                             instance['uuid'])
-            call_info['get_nw_info'] += 1
+        def fake_instance_get_all_by_filters(context, filters, *args,
+                                             **kwargs):
+            call_info['get_all_by_filters'] += 1
+            self.assertEqual(['info_cache', 'system_metadata'],
+                             sorted(kwargs['columns_to_join']))
+            return [instance_map[inst_uuid] for inst_uuid in filters['uuid']
+                    if inst_uuid in instance_map]
+
+        def fake_get_instances_nw_info(context, instances, use_slave=False):
+            call_info['healed'].append([inst['uuid'] for inst in instances])
+            return {}
 
         self.stubs.Set(db, 'instance_get_all_by_host',
                 fake_instance_get_all_by_host)
-        self.stubs.Set(db, 'instance_get_by_uuid',
-                fake_instance_get_by_uuid)
-        self.stubs.Set(self.compute, '_get_instance_nw_info',
-                fake_get_instance_nw_info)
+        self.stubs.Set(db, 'instance_get_all_by_filters',
+                fake_instance_get_all_by_filters)
+        self.stubs.Set(self.compute.network_api, 'get_instances_nw_info',
+                fake_get_instances_nw_info)
 
         # Make an instance appear to be still Building
         instances[0]['vm_state'] = vm_states.BUILDING
         # Make an instance appear to be Deleting
         instances[1]['task_state'] = task_states.DELETING
         # '0', '1' should be skipped..
-        call_info['expected_instance'] = instances[2]
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(0, call_info['get_by_uuid'])
-        self.assertEqual(1, call_info['get_nw_info'])
+        self.assertEqual(1, call_info['get_all_by_filters'])
+        self.assertEqual([['fake-uuid-2', 'fake-uuid-3']],
+                         call_info['healed'])
 
-        call_info['expected_instance'] = instances[3]
+        # The list of the host's instances is reused until all of them
+        # were healed, the ones deleted meanwhile are skipped
+        instances[4]['task_state'] = task_states.DELETING
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(1, call_info['get_by_uuid'])
-        self.assertEqual(2, call_info['get_nw_info'])
-
-        # Make an instance switch hosts
-        instances[4]['host'] = 'not-me'
-        # Make an instance disappear
-        instance_map.pop(instances[5]['uuid'])
-        # Make an instance switch to be Deleting
-        instances[6]['task_state'] = task_states.DELETING
-        # '4', '5', and '6' should be skipped..
-        call_info['expected_instance'] = instances[7]
+        self.assertEqual(['fake-uuid-5'], call_info['healed'][-1])
+        instances[4]['task_state'] = None
+
+        # The least recently healed instances come back first, unless
+        # an instance saw a network event
+        self.compute._instance_heal_times.update({'fake-uuid-2': 1,
+                                                  'fake-uuid-3': 2,
+                                                  'fake-uuid-4': 3,
+                                                  'fake-uuid-5': 4})
+        self.compute._instances_to_heal_first.add('fake-uuid-5')
         self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(4, call_info['get_by_uuid'])
-        self.assertEqual(3, call_info['get_nw_info'])
-        # Should be no more left.
-        self.assertEqual(0, len(self.compute._instance_uuids_to_heal))
-
-        # This should cause a DB query now, so get a list of instances
-        # where none can be processed to make sure we handle that case
-        # cleanly.   Use just '0' (Building) and '1' (Deleting)
-        instances = instances[0:2]
+        self.assertEqual(2, call_info['get_all_by_host'])
+        self.assertEqual(['fake-uuid-5', 'fake-uuid-2'],
+                         call_info['healed'][-1])
+        self.assertEqual(set(), self.compute._instances_to_heal_first)
 
+        # Make an instance disappear, it is forgotten
+        instances.pop(3)
+        instance_map.pop('fake-uuid-3')
         self.compute._heal_instance_info_cache(ctxt)
-        # Should have called the list once more
-        self.assertEqual(2, call_info['get_all_by_host'])
-        # Stays the same because we remove invalid entries from the list
-        self.assertEqual(4, call_info['get_by_uuid'])
+        self.assertEqual(['fake-uuid-4'], call_info['healed'][-1])
+        self.assertNotIn('fake-uuid-3', self.compute._instance_heal_times)
+
+        # Get a list of instances where none can be processed to make
+        # sure we handle that case cleanly.
+        instances = instances[0:2]
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual(3, call_info['get_all_by_host'])
         # Stays the same because we didn't find anything to process
-        self.assertEqual(3, call_info['get_nw_info'])
+        self.assertEqual(4, call_info['get_all_by_filters'])
+        self.assertEqual(4, len(call_info['healed']))
 
     def test_poll_rescued_instances(self):
         timed_out_time = timeutils.utcnow() - datetime.timedelta(minutes=5)
@@ -6433,6 +6475,35 @@ class ComputeTestCase(BaseTestCase):
         self.mox.ReplayAll()
         self.compute._sync_power_states(ctxt)
 
+    def test_sync_power_states_only_out_of_sync(self):
+        ctxt = self.context.elevated()
+        in_sync = self._create_fake_instance(
+                {'host': self.compute.host,
+                 'vm_state': vm_states.ACTIVE,
+                 'power_state': power_state.RUNNING})
+        out_of_sync = self._create_fake_instance(
+                {'host': self.compute.host,
+                 'vm_state': vm_states.ACTIVE,
+                 'power_state': power_state.RUNNING})
+        # Left out of the driver result, as if it could not be read.
+        self._create_fake_instance({'host': self.compute.host,
+                                    'vm_state': vm_states.ACTIVE,
+                                    'power_state': power_state.RUNNING})
+        self._create_fake_instance({'host': self.compute.host,
+                                    'task_state': task_states.REBOOTING})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+
+        self.compute.driver.get_power_states(
+            mox.Func(lambda instances: len(instances) == 3)).AndReturn(
+                {in_sync['uuid']: power_state.RUNNING,
+                 out_of_sync['uuid']: power_state.SHUTDOWN})
+        self.compute._sync_instance_power_state(
+            ctxt, mox.ContainsKeyValue('uuid', out_of_sync['uuid']),
+            power_state.SHUTDOWN, use_slave=True)
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
     def _test_lifecycle_event(self, lifecycle_event, power_state):
         instance = self._create_fake_instance()
         uuid = instance['uuid']
@@ -6490,6 +6561,7 @@ class ComputeTestCase(BaseTestCase):
             pass
 
         self.stubs.Set(fake_rt, 'drop_resize_claim', fake_drop_resize_claim)
+        self.stubs.Set(fake_rt, 'request_audit', lambda: None)
         self.stubs.Set(self.compute, '_get_resource_tracker',
                        fake_get_resource_tracker)
         self.stubs.Set(self.compute.network_api, 'setup_networks_on_host',
@@ -7453,13 +7525,13 @@ class ComputeAPITestCase(BaseTestCase):
         db.instance_destroy(c, instance3['uuid'])
 
     @mock.patch('nova.db.network_get')
-    @mock.patch('nova.db.fixed_ips_by_virtual_interface')
+    @mock.patch('nova.db.fixed_ip_get_by_ip_filter')
     def test_get_all_by_multiple_options_at_once(self, fixed_get, network_get):
         # Test searching by multiple options at once.
         c = context.get_admin_context()
         network_manager = fake_network.FakeNetworkManager(self.stubs)
         fixed_get.side_effect = (
-            network_manager.db.fixed_ips_by_virtual_interface)
+            network_manager.db.fixed_ip_get_by_ip_filter)
         network_get.return_value = (
             dict(test_network.fake_network,
                  **network_manager.db.network_get(None, 1)))
@@ -717,13 +717,107 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.stubs.Set(compute_utils, 'finish_instance_usage_audit',
                        lambda *a, **k: None)
 
-        self.mox.StubOutWithMock(self.compute.conductor_api,
-                                 'notify_usage_exists')
-        self.compute.conductor_api.notify_usage_exists(
-            self.context, instances[0], ignore_missing_network_data=False)
+        self.mox.StubOutWithMock(self.compute.conductor_api, 'batch')
+        self.compute.conductor_api.batch(
+            self.context,
+            [('notify_usage_exists', (instances[0],),
+              {'ignore_missing_network_data': False})],
+            stop_on_error=False).AndReturn([[None, None]])
+        self.mox.ReplayAll()
+        self.compute._instance_usage_audit(self.context)
+
+    def test_request_resource_audit(self):
+        rt = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(self.compute.driver, 'node_is_available',
+                              side_effect=lambda node: node == 'node1'),
+            mock.patch.object(self.compute, '_get_resource_tracker',
+                              return_value=rt)
+        ) as (mock_available, mock_get_rt):
+            self.compute._request_resource_audit('node1')
+            self.compute._request_resource_audit('other-node')
+            self.compute._request_resource_audit(None)
+        mock_get_rt.assert_called_once_with('node1')
+        rt.request_audit.assert_called_once_with()
+
+    def test_instance_usage_audit_errors(self):
+        instances = [{'uuid': 'foo'}, {'uuid': 'bar'}, {'uuid': 'baz'}]
+        self.flags(instance_usage_audit=True)
+        self.stubs.Set(compute_utils, 'has_audit_been_run',
+                       lambda *a, **k: False)
+        self.stubs.Set(self.compute.conductor_api,
+                       'instance_get_active_by_window_joined',
+                       lambda *a, **k: instances)
+        self.stubs.Set(compute_utils, 'start_instance_usage_audit',
+                       lambda *a, **k: None)
+
+        self.mox.StubOutWithMock(self.compute.conductor_api, 'batch')
+        self.mox.StubOutWithMock(compute_utils, 'finish_instance_usage_audit')
+        calls = [('notify_usage_exists', (instance,),
+                  {'ignore_missing_network_data': False})
+                 for instance in instances]
+        self.compute.conductor_api.batch(
+            self.context, calls, stop_on_error=False).AndReturn(
+                [[None, None], [None, 'error'], [None, None]])
+        compute_utils.finish_instance_usage_audit(
+            self.context, self.compute.conductor_api, mox.IgnoreArg(),
+            mox.IgnoreArg(), self.compute.host, 1, mox.IgnoreArg())
+        self.mox.ReplayAll()
+        self.compute._instance_usage_audit(self.context)
+
+    def test_instance_usage_audit_chunks(self):
+        instances = [{'uuid': 'foo'}, {'uuid': 'bar'}, {'uuid': 'baz'}]
+        self.flags(instance_usage_audit=True,
+                   instance_usage_audit_batch_size=2)
+        self.stubs.Set(compute_utils, 'has_audit_been_run',
+                       lambda *a, **k: False)
+        self.stubs.Set(self.compute.conductor_api,
+                       'instance_get_active_by_window_joined',
+                       lambda *a, **k: instances)
+        self.stubs.Set(compute_utils, 'start_instance_usage_audit',
+                       lambda *a, **k: None)
+
+        self.mox.StubOutWithMock(self.compute.conductor_api, 'batch')
+        self.mox.StubOutWithMock(compute_utils, 'finish_instance_usage_audit')
+        calls = [('notify_usage_exists', (instance,),
+                  {'ignore_missing_network_data': False})
+                 for instance in instances]
+        self.compute.conductor_api.batch(
+            self.context, calls[:2], stop_on_error=False).AndRaise(
+                test.TestingException())
+        self.compute.conductor_api.batch(
+            self.context, calls[2:], stop_on_error=False).AndReturn(
+                [[None, None]])
+        compute_utils.finish_instance_usage_audit(
+            self.context, self.compute.conductor_api, mox.IgnoreArg(),
+            mox.IgnoreArg(), self.compute.host, 2, mox.IgnoreArg())
         self.mox.ReplayAll()
         self.compute._instance_usage_audit(self.context)
 
+    def test_instance_usage_audit_finished_on_error(self):
+        instances = [{'uuid': 'foo'}]
+        self.flags(instance_usage_audit=True)
+        self.stubs.Set(compute_utils, 'has_audit_been_run',
+                       lambda *a, **k: False)
+        self.stubs.Set(self.compute.conductor_api,
+                       'instance_get_active_by_window_joined',
+                       lambda *a, **k: instances)
+        self.stubs.Set(compute_utils, 'start_instance_usage_audit',
+                       lambda *a, **k: None)
+
+        self.mox.StubOutWithMock(self.compute.conductor_api, 'batch')
+        self.mox.StubOutWithMock(compute_utils, 'finish_instance_usage_audit')
+        # The end of the audit is recorded even if processing fails.
+        self.compute.conductor_api.batch(
+            self.context, mox.IgnoreArg(), stop_on_error=False).AndReturn(
+                [None])
+        compute_utils.finish_instance_usage_audit(
+            self.context, self.compute.conductor_api, mox.IgnoreArg(),
+            mox.IgnoreArg(), self.compute.host, 0, mox.IgnoreArg())
+        self.mox.ReplayAll()
+        self.assertRaises(TypeError, self.compute._instance_usage_audit,
+                          self.context)
+
     def _get_sync_instance(self, power_state, vm_state, task_state=None):
         instance = instance_obj.Instance()
         instance.uuid = 'fake-uuid'
@@ -1120,6 +1214,29 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                                                             events[1])
         do_test()
 
+    def test_external_instance_event_heal_priority(self):
+        instances = [
+            instance_obj.Instance(uuid='uuid1'),
+            instance_obj.Instance(uuid='uuid2')]
+        events = [
+            external_event_obj.InstanceExternalEvent(name='network-changed',
+                                                     instance_uuid='uuid1'),
+            external_event_obj.InstanceExternalEvent(
+                name='network-vif-plugged', instance_uuid='uuid2')]
+        self.compute._instances_to_heal_first.add('uuid1')
+
+        with contextlib.nested(
+            mock.patch.object(self.compute.network_api,
+                              'get_instance_nw_info'),
+            mock.patch.object(self.compute, '_process_instance_event')
+        ):
+            self.compute.external_instance_event(self.context,
+                                                 instances, events)
+
+        self.assertEqual(set(['uuid2']),
+                         self.compute._instances_to_heal_first)
+        self.assertIn('uuid1', self.compute._instance_heal_times)
+
     def test_retry_reboot_pending_soft(self):
         instance = instance_obj.Instance(self.context)
         instance.uuid = 'foo'
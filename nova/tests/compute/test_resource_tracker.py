@@ -119,7 +119,8 @@ class BaseTestCase(test.TestCase):
         super(BaseTestCase, self).setUp()
 
         self.flags(reserved_host_disk_mb=0,
-                   reserved_host_memory_mb=0)
+                   reserved_host_memory_mb=0,
+                   resource_audit_interval=0)
 
         self.context = context.get_admin_context()
 
@@ -1049,6 +1050,65 @@ class OrphanTestCase(BaseTrackerTestCase):
         self.assertEqual(2, len(orphans))
 
 
+class AuditIntervalTestCase(BaseTrackerTestCase):
+    def setUp(self):
+        super(AuditIntervalTestCase, self).setUp()
+        self.flags(resource_audit_interval=600)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.tracker.last_audit = timeutils.utcnow()
+        self.updated = False
+
+    def test_no_audit_within_interval(self):
+        with mock.patch.object(self.tracker.driver,
+                               'get_available_resource') as mock_get:
+            self.tracker.update_available_resource(self.context)
+        self.assertFalse(mock_get.called)
+        self.assertFalse(self.updated)
+
+    def test_metrics_written_within_interval(self):
+        metrics = [{'name': 'cpu.frequency', 'value': 800,
+                    'timestamp': '2014-01-01T00:00:00', 'source': 'fake'}]
+        with mock.patch.object(self.tracker, '_get_host_metrics',
+                               return_value=metrics):
+            self.tracker.update_available_resource(self.context)
+        self.assertTrue(self.updated)
+        self._assert(jsonutils.dumps(metrics), 'metrics')
+
+    def test_audit_after_interval(self):
+        timeutils.advance_time_seconds(601)
+        self.tracker.update_available_resource(self.context)
+        self.assertTrue(self.updated)
+
+    def test_requested_audit_within_interval(self):
+        self.tracker.request_audit()
+        driver = self.tracker.driver
+        with mock.patch.object(driver, 'get_available_resource',
+                               wraps=driver.get_available_resource
+                               ) as mock_get:
+            self.tracker.update_available_resource(self.context)
+        self.assertTrue(mock_get.called)
+        self.assertIsNotNone(self.tracker.last_audit)
+
+    def test_usage_tracked_within_interval(self):
+        instance = self._fake_instance(memory_mb=3, root_gb=1, ephemeral_gb=1)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        self.tracker.update_available_resource(self.context)
+        self._assert(3 + FAKE_VIRT_MEMORY_OVERHEAD, 'memory_mb_used')
+
+        instance['vm_state'] = vm_states.DELETED
+        self.tracker.update_usage(self.context, instance)
+        self._assert(0, 'memory_mb_used')
+        self._assert(0, 'local_gb_used')
+
+    def test_unchanged_values_not_written(self):
+        self.tracker._update(self.context, dict(self.tracker.compute_node))
+        self.updated = False
+        memory_mb_used = self.tracker.compute_node['memory_mb_used']
+        self.tracker._update(self.context, {'memory_mb_used': memory_mb_used})
+        self.assertFalse(self.updated)
+
+
 class ComputeMonitorTestCase(BaseTestCase):
     def setUp(self):
         super(ComputeMonitorTestCase, self).setUp()
@@ -16,9 +16,12 @@
 """Tests for the conductor service."""
 
 import contextlib
+import datetime
+
 import mock
 import mox
 from oslo import messaging
+import six
 
 from nova.api.ec2 import ec2utils
 from nova.compute import flavors
@@ -212,6 +215,22 @@ class _BaseTestCase(object):
         result = self.conductor.bw_usage_update(*update_args)
         self.assertEqual(result, 'foo')
 
+    def test_bw_usage_update_many(self):
+        self.mox.StubOutWithMock(db, 'bw_usage_update_many')
+        bw_counters = [{'uuid': 'uuid', 'mac_address': 'mac',
+                        'bw_in': 10, 'bw_out': 20}]
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        prev_period = now - datetime.timedelta(seconds=3600)
+        db.bw_usage_update_many(self.context, start_period, prev_period,
+                                bw_counters, now, update_cells=False)
+
+        self.mox.ReplayAll()
+        self.conductor.bw_usage_update_many(self.context,
+                                            timeutils.strtime(start_period),
+                                            prev_period, bw_counters,
+                                            timeutils.strtime(now), False)
+
     def test_provider_fw_rule_get_all(self):
         fake_rules = ['a', 'b', 'c']
         self.mox.StubOutWithMock(db, 'provider_fw_rule_get_all')
@@ -307,6 +326,27 @@ class _BaseTestCase(object):
         self.assertEqual('INFO', msg.priority)
         self.assertEqual('fake-info', msg.payload)
 
+    def test_vol_usage_update_many(self):
+        self.mox.StubOutWithMock(db, 'vol_usage_update_many')
+        self.mox.StubOutWithMock(compute_utils, 'usage_volume_info')
+
+        vol_usages = [{'volume_id': 'fake-vol1', 'rd_req': 22},
+                      {'volume_id': 'fake-vol2', 'rd_req': 33}]
+        db.vol_usage_update_many(self.context, vol_usages).AndReturn(
+            ['fake-usage1', 'fake-usage2'])
+        compute_utils.usage_volume_info('fake-usage1').AndReturn('fake-info1')
+        compute_utils.usage_volume_info('fake-usage2').AndReturn('fake-info2')
+
+        self.mox.ReplayAll()
+
+        self.conductor.vol_usage_update_many(self.context, vol_usages)
+
+        self.assertEqual(2, len(fake_notifier.NOTIFICATIONS))
+        self.assertEqual(['fake-info1', 'fake-info2'],
+                         [msg.payload for msg in fake_notifier.NOTIFICATIONS])
+        self.assertEqual('volume.usage',
+                         fake_notifier.NOTIFICATIONS[0].event_type)
+
     def test_compute_node_create(self):
         self.mox.StubOutWithMock(db, 'compute_node_create')
         db.compute_node_create(self.context, 'fake-values').AndReturn(
@@ -779,6 +819,32 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
         self.assertIn('dict', updates)
         self.assertEqual({'foo': 'bar'}, updates['dict'])
 
+    def test_object_action_with_digests(self):
+        class TestObject(obj_base.NovaObject):
+            fields = {'id': fields.IntegerField(),
+                      'foo': fields.StringField(),
+                      'bar': fields.StringField(),
+                      'baz': fields.StringField()}
+
+            def touch(self, context):
+                self.foo = 'foo'
+                self.bar = 'new-bar'
+                self.baz = 'baz'
+                self.obj_reset_changes()
+
+        obj = TestObject(id=1)
+        obj.obj_reset_changes()
+        digests = {'foo': obj_base.primitive_digest('old-foo'),
+                   'baz': obj_base.primitive_digest('baz')}
+        updates, result = self.conductor.object_action(
+            self.context, obj, 'touch', tuple(), {}, digests=digests)
+        # NOTE: bar is not known to the caller, foo differs from its copy
+        # and baz is what it already has
+        self.assertEqual('foo', updates['foo'])
+        self.assertEqual('new-bar', updates['bar'])
+        self.assertNotIn('baz', updates)
+        self.assertNotIn('id', updates)
+
     def test_aggregate_metadata_add(self):
         aggregate = {'name': 'fake aggregate', 'id': 'fake-id'}
         metadata = {'foo': 'bar'}
@@ -917,6 +983,79 @@ class ConductorTestCase(_BaseTestCase, test.TestCase):
             self.conductor.service_destroy,
             [error], 1)
 
+    def test_read_cache_hit(self):
+        self.mox.StubOutWithMock(db, 'agent_build_get_by_triple')
+        db.agent_build_get_by_triple(self.context, 'fake-hv', 'fake-os',
+                                     'fake-arch').AndReturn({'id': 1})
+        self.mox.ReplayAll()
+        for i in range(3):
+            result = self.conductor.agent_build_get_by_triple(
+                self.context, 'fake-hv', 'fake-os', 'fake-arch')
+            self.assertEqual({'id': 1}, result)
+            result['id'] = 2
+        stats = self.conductor.read_cache.get_stats()['agent_build']
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertAlmostEqual(2.0 / 3, stats['hit_rate'])
+        self.assertEqual(1, stats['entries'])
+
+    def test_read_cache_expires(self):
+        self.useFixture(test.TimeOverride())
+        self.mox.StubOutWithMock(db, 'flavor_get')
+        db.flavor_get(self.context, 1).AndReturn({'id': 1})
+        db.flavor_get(self.context, 1).AndReturn({'id': 1, 'name': 'new'})
+        self.mox.ReplayAll()
+        self.assertEqual({'id': 1},
+                         self.conductor.instance_type_get(self.context, 1))
+        timeutils.advance_time_seconds(599)
+        self.assertEqual({'id': 1},
+                         self.conductor.instance_type_get(self.context, 1))
+        timeutils.advance_time_seconds(1)
+        self.assertEqual({'id': 1, 'name': 'new'},
+                         self.conductor.instance_type_get(self.context, 1))
+
+    def test_read_cache_disabled(self):
+        self.flags(read_cache_flavor_ttl=0, group='conductor')
+        self.mox.StubOutWithMock(db, 'flavor_get')
+        db.flavor_get(self.context, 1).AndReturn({'id': 1})
+        db.flavor_get(self.context, 1).AndReturn({'id': 1})
+        self.mox.ReplayAll()
+        self.conductor.instance_type_get(self.context, 1)
+        self.conductor.instance_type_get(self.context, 1)
+        self.assertEqual({}, self.conductor.read_cache.get_stats())
+
+    def test_read_cache_per_project(self):
+        ctxt1 = context.RequestContext('fake-user', 'project1')
+        ctxt2 = context.RequestContext('fake-user', 'project2')
+        self.mox.StubOutWithMock(db, 'flavor_get')
+        db.flavor_get(ctxt1, 1).AndReturn({'id': 1})
+        db.flavor_get(ctxt2, 1).AndRaise(exc.FlavorNotFound(flavor_id=1))
+        self.mox.ReplayAll()
+        self.conductor.instance_type_get(ctxt1, 1)
+        self.conductor.instance_type_get(ctxt1, 1)
+        self.assertRaises(exc.FlavorNotFound,
+                          self.conductor.instance_type_get, ctxt2, 1)
+
+    def test_read_cache_invalidated_by_aggregate_write(self):
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_add')
+        db.aggregate_metadata_get_by_host(self.context, 'host',
+                                          'availability_zone').AndReturn(
+                                              {'availability_zone': 'az1'})
+        db.aggregate_metadata_add(mox.IgnoreArg(), 1,
+                                  {'availability_zone': 'az2'}, False)
+        db.aggregate_metadata_get_by_host(self.context, 'host',
+                                          'availability_zone').AndReturn(
+                                              {'availability_zone': 'az2'})
+        self.mox.ReplayAll()
+        self.conductor.aggregate_metadata_get_by_host(self.context, 'host')
+        self.conductor.aggregate_metadata_get_by_host(self.context, 'host')
+        self.conductor.aggregate_metadata_add(
+            self.context, {'id': 1}, {'availability_zone': 'az2'})
+        self.assertEqual({'availability_zone': 'az2'},
+                         self.conductor.aggregate_metadata_get_by_host(
+                             self.context, 'host'))
+
 
 class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
     """Conductor RPC API Tests."""
@@ -927,6 +1066,72 @@ class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
         self.conductor_manager = self.conductor_service.manager
         self.conductor = conductor_rpcapi.ConductorAPI()
 
+    def test_object_action_delta(self):
+        class TestDeltaObject(obj_base.NovaObject):
+            fields = {'id': fields.IntegerField(),
+                      'foo': fields.StringField(),
+                      'bar': fields.StringField(),
+                      'baz': fields.StringField()}
+            obj_delta_methods = ['touch']
+            obj_delta_keys = ['id']
+
+            def touch(self, context):
+                sent = [name for name in sorted(self.fields)
+                        if self.obj_attr_is_set(name)]
+                self.bar = 'new-bar'
+                self.baz = 'baz'
+                self.obj_reset_changes()
+                return sent
+
+        self.flags(delta_object_actions=True)
+        obj = TestDeltaObject(id=1, foo='foo', bar='bar', baz='baz')
+        obj.obj_reset_changes()
+        obj.foo = 'new-foo'
+        updates, result = self.conductor.object_action(
+            self.context, obj, 'touch', tuple(), {})
+        # Only the key and the changed field were sent
+        self.assertEqual(['foo', 'id'], result)
+        self.assertEqual('new-bar', updates['bar'])
+        self.assertNotIn('baz', updates)
+        self.assertNotIn('foo', updates)
+
+    def test_object_action_compact(self):
+        class TestObject(obj_base.NovaObject):
+            fields = {'foo': fields.StringField()}
+
+            def touch(self, context):
+                self.foo = 'bar'
+                return 'test'
+
+        self.flags(compact_object_payloads=True)
+        self.conductor = conductor_rpcapi.ConductorAPI()
+        compact_client = self.conductor._compact_client
+        obj = TestObject(foo='foo')
+        with mock.patch.object(compact_client, 'prepare',
+                               wraps=compact_client.prepare) as prepare:
+            updates, result = self.conductor.object_action(
+                self.context, obj, 'touch', tuple(), {})
+        prepare.assert_called_once_with(version='2.2')
+        self.assertEqual('test', result)
+        self.assertEqual('bar', updates['foo'])
+
+    def test_prepare_compact(self):
+        self.flags(compact_object_payloads=True)
+        self.conductor = conductor_rpcapi.ConductorAPI()
+        self.assertEqual('2.2', self.conductor._prepare().target.version)
+        self.assertEqual('2.3',
+                         self.conductor._prepare('2.3').target.version)
+
+    def test_prepare_compact_not_supported(self):
+        self.flags(compact_object_payloads=True)
+        self.flags(conductor='2.1', group='upgrade_levels')
+        self.conductor = conductor_rpcapi.ConductorAPI()
+        with mock.patch.object(self.conductor._compact_client,
+                               'prepare') as compact_prepare:
+            cctxt = self.conductor._prepare()
+        self.assertEqual('2.0', cctxt.target.version)
+        self.assertFalse(compact_prepare.called)
+
     def test_block_device_mapping_update_or_create(self):
         fake_bdm = {'id': 'fake-id'}
         self.mox.StubOutWithMock(db, 'block_device_mapping_create')
@@ -1067,6 +1272,24 @@ class ConductorAPITestCase(_BaseTestCase, test.TestCase):
         result = self.conductor.bw_usage_get(*get_args)
         self.assertEqual(result, 'foo')
 
+    def test_bw_usage_update_many_accumulates(self):
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        prev_period = now - datetime.timedelta(seconds=3600)
+        for bw_in, bw_out in ((100, 200), (150, 260)):
+            bw_counters = [{'uuid': 'fake-uuid', 'mac_address': 'fake-mac',
+                            'bw_in': bw_in, 'bw_out': bw_out}]
+            self.conductor.bw_usage_update_many(self.context, start_period,
+                                                prev_period, bw_counters,
+                                                last_refreshed=now,
+                                                update_cells=False)
+        bw_usages = db.bw_usage_get_by_uuids(self.context, ['fake-uuid'],
+                                             start_period)
+        self.assertEqual(1, len(bw_usages))
+        self.assertEqual(50, bw_usages[0]['bw_in'])
+        self.assertEqual(60, bw_usages[0]['bw_out'])
+        self.assertEqual(150, bw_usages[0]['last_ctr_in'])
+
     def test_block_device_mapping_update_or_create(self):
         self.mox.StubOutWithMock(db, 'block_device_mapping_create')
         self.mox.StubOutWithMock(db, 'block_device_mapping_update')
@@ -1182,6 +1405,44 @@ class ConductorAPITestCase(_BaseTestCase, test.TestCase):
         self.assertEqual(timeouts.count(10), 10)
         self.assertIn(None, timeouts)
 
+    def _test_batch(self):
+        error = exc.InstanceActionNotFound(request_id='1', instance_uuid='2')
+        self.mox.StubOutWithMock(db, 'action_event_start')
+        self.mox.StubOutWithMock(db, 'action_event_finish')
+        db.action_event_start(self.context, {'foo': 'bar'}).AndReturn(
+            {'id': 1})
+        db.action_event_finish(self.context, {'foo': 'baz'}).AndRaise(error)
+        db.action_event_start(self.context, {'foo': 'qux'}).AndReturn(
+            {'id': 2})
+        self.mox.ReplayAll()
+        results = self.conductor.batch(
+            self.context,
+            [('action_event_start', ({'foo': 'bar'},), {}),
+             ('action_event_finish', ({'foo': 'baz'},), {}),
+             ('action_event_start', (), {'values': {'foo': 'qux'}})],
+            stop_on_error=False)
+        self.assertEqual([[{'id': 1}, None],
+                          [None, six.text_type(error)],
+                          [{'id': 2}, None]], results)
+
+    def test_batch(self):
+        self._test_batch()
+
+    def test_batch_without_conductor_support(self):
+        self.flags(conductor='icehouse', group='upgrade_levels')
+        self.conductor = self.conductor.__class__()
+        self._test_batch()
+
+    def test_batch_stop_on_error(self):
+        error = exc.InstanceActionNotFound(request_id='1', instance_uuid='2')
+        self.mox.StubOutWithMock(db, 'action_event_start')
+        db.action_event_start(self.context, {'foo': 'bar'}).AndRaise(error)
+        self.mox.ReplayAll()
+        self.assertRaises(exc.InstanceActionNotFound,
+                          self.conductor.batch, self.context,
+                          [('action_event_start', ({'foo': 'bar'},), {}),
+                           ('action_event_start', ({'foo': 'baz'},), {})])
+
     def test_security_groups_trigger_handler(self):
         self.mox.StubOutWithMock(self.conductor_manager.security_group_api,
                                  'trigger_handler')
@@ -1876,7 +2137,10 @@ class ConductorV2ManagerProxyTestCase(test.NoDBTestCase):
             ('compute_unrescue', 1),
             ('object_class_action', 5),
             ('object_action', 4),
+            ('object_action', 5),
             ('object_backport', 2),
+            ('bw_usage_update_many', 5),
+            ('vol_usage_update_many', 1),
         ]
 
         for method, num_args in methods:
@@ -1886,3 +2150,25 @@ class ConductorV2ManagerProxyTestCase(test.NoDBTestCase):
             with mock.patch.object(manager, method) as mock_method:
                 getattr(proxy, method)(ctxt, *args)
                 mock_method.assert_called_once()
+
+    def test_v2_manager_proxy_batch(self):
+        manager = conductor_manager.ConductorManager()
+        proxy = conductor_manager._ConductorManagerV2Proxy(manager)
+        ctxt = context.get_admin_context()
+
+        with mock.patch.object(manager, 'task_log_get',
+                               side_effect=[['log'], test.TestingException]
+                               ) as mock_task_log_get:
+            results = proxy.batch(
+                ctxt, [['task_log_get', dict(task_name='a', begin=1, end=2,
+                                             host='h', state=None)],
+                       ['task_log_get', dict(task_name='b', begin=1, end=2,
+                                             host='h', state=None)]],
+                False)
+            mock_task_log_get.assert_called_with(ctxt, 'b', 1, 2, 'h', None)
+        self.assertEqual([['log'], None], results[0])
+        self.assertIsNone(results[1][0])
+        self.assertIsNotNone(results[1][1])
+
+        self.assertRaises(messaging.NoSuchMethod, proxy.batch, ctxt,
+                          [['batch', {}]], False)
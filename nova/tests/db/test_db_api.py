@@ -37,6 +37,7 @@ from sqlalchemy.orm import query
 from sqlalchemy.sql.expression import select
 
 from nova import block_device
+from nova.cells import rpcapi as cells_rpcapi
 from nova.compute import vm_states
 from nova import context
 from nova import db
@@ -563,6 +564,43 @@ class AggregateDBApiTestCase(test.TestCase):
         results = db.aggregate_get_all(ctxt)
         self.assertEqual(len(results), add_counter - remove_counter)
 
+    def test_aggregate_get_all_changed_since(self):
+        ctxt = context.get_admin_context()
+        result = _create_aggregate_with_hosts(context=ctxt)
+        before = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        aggregates = db.aggregate_get_all_changed_since(ctxt, before)
+        self.assertEqual([result['id']], [a['id'] for a in aggregates])
+        self.assertEqual(_get_fake_aggr_hosts(), aggregates[0]['hosts'])
+        self.assertEqual(_get_fake_aggr_metadata(),
+                         aggregates[0]['metadetails'])
+
+        after = timeutils.utcnow() + datetime.timedelta(seconds=1)
+        self.assertEqual([],
+                db.aggregate_get_all_changed_since(ctxt, after))
+
+    def test_aggregate_get_all_changed_since_host_deleted(self):
+        ctxt = context.get_admin_context()
+        result = _create_aggregate_with_hosts(context=ctxt)
+        self.mox.StubOutWithMock(timeutils, 'utcnow')
+        later = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        timeutils.utcnow().MultipleTimes().AndReturn(later)
+        self.mox.ReplayAll()
+        db.aggregate_host_delete(ctxt, result['id'],
+                                 _get_fake_aggr_hosts()[0])
+        aggregates = db.aggregate_get_all_changed_since(ctxt, later)
+        self.assertEqual([result['id']], [a['id'] for a in aggregates])
+        self.assertEqual([], aggregates[0]['hosts'])
+
+    def test_aggregate_get_all_changed_since_deleted(self):
+        ctxt = context.get_admin_context()
+        result = _create_aggregate(context=ctxt, metadata=None)
+        db.aggregate_delete(ctxt, result['id'])
+        before = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        aggregates = db.aggregate_get_all_changed_since(ctxt, before)
+        self.assertEqual(1, len(aggregates))
+        self.assertTrue(aggregates[0]['deleted'])
+        self.assertEqual([], db.aggregate_get_all(ctxt))
+
     def test_aggregate_metadata_add(self):
         ctxt = context.get_admin_context()
         result = _create_aggregate(context=ctxt, metadata=None)
@@ -1542,6 +1580,60 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         filtered_instances = db.instance_get_all_by_filters(self.ctxt, {})
         self._assertEqualListsOfInstances(instances, filtered_instances)
 
+    def _instance_get_all_by_filters_iter_chunks(self, *args, **kwargs):
+        chunks = []
+        fill_metadata = sqlalchemy_api._instances_fill_metadata
+
+        def fake_fill_metadata(context, instances, *args, **kwargs):
+            chunks.append(len(instances))
+            return fill_metadata(context, instances, *args, **kwargs)
+
+        self.stubs.Set(sqlalchemy_api, '_instances_fill_metadata',
+                       fake_fill_metadata)
+        result = list(db.instance_get_all_by_filters_iter(self.ctxt,
+                                                          *args, **kwargs))
+        return result, chunks
+
+    def test_instance_get_all_by_filters_iter(self):
+        instances = [self.create_instance_with_args() for i in range(5)]
+        result, chunks = self._instance_get_all_by_filters_iter_chunks(
+                {}, 'created_at', 'asc', chunk_size=2)
+        self.assertEqual([inst['uuid'] for inst in instances],
+                         [inst['uuid'] for inst in result])
+        self.assertEqual([2, 2, 1], chunks)
+        for inst in result:
+            meta = utils.metadata_to_dict(inst['metadata'])
+            self.assertEqual(meta, self.sample_data['metadata'])
+
+    def test_instance_get_all_by_filters_iter_same_sort_key(self):
+        # Instances sharing the sort key are told apart by their id.
+        instances = [self.create_instance_with_args(display_name='same')
+                     for i in range(5)]
+        result, chunks = self._instance_get_all_by_filters_iter_chunks(
+                {}, 'display_name', 'desc', chunk_size=2)
+        self.assertEqual(sorted(inst['uuid'] for inst in instances),
+                         sorted(inst['uuid'] for inst in result))
+        self.assertEqual([2, 2, 1], chunks)
+
+    def test_instance_get_all_by_filters_iter_limit_and_marker(self):
+        instances = [self.create_instance_with_args() for i in range(5)]
+        result, chunks = self._instance_get_all_by_filters_iter_chunks(
+                {}, 'created_at', 'asc', limit=3,
+                marker=instances[0]['uuid'], chunk_size=2)
+        self.assertEqual([inst['uuid'] for inst in instances[1:4]],
+                         [inst['uuid'] for inst in result])
+        self.assertEqual([2, 1], chunks)
+
+    def test_instance_get_all_by_filters_iter_marker_not_found(self):
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters_iter,
+                          self.ctxt, {}, marker=str(stdlib_uuid.uuid4()))
+
+    def test_instance_get_all_by_filters_iter_requires_context(self):
+        ctxt = context.RequestContext(None, None)
+        self.assertRaises(exception.NotAuthorized,
+                          db.instance_get_all_by_filters_iter, ctxt, {})
+
     def test_instance_metadata_get_multi(self):
         uuids = [self.create_instance_with_args()['uuid'] for i in range(3)]
         meta = sqlalchemy_api._instance_metadata_get_multi(self.ctxt, uuids)
@@ -3345,6 +3437,63 @@ class FixedIPTestCase(BaseInstanceTypeTestCase):
         ips_list = db.fixed_ips_by_virtual_interface(self.ctxt, vif.id)
         self.assertEqual(0, len(ips_list))
 
+    def _create_ip_filter_fixed_ips(self):
+        instance_uuid = self._create_instance()
+        vif = db.virtual_interface_create(
+            self.ctxt, dict(instance_uuid=instance_uuid))
+        for address in ('192.168.1.5', '192.168.1.15', '192.168.2.5'):
+            db.fixed_ip_create(self.ctxt, dict(
+                virtual_interface_id=vif.id, instance_uuid=instance_uuid,
+                address=address))
+        # Not allocated to an instance
+        db.fixed_ip_create(self.ctxt, dict(address='192.168.1.6'))
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, '192.168.2.5')
+        db.floating_ip_create(self.ctxt, dict(address='10.10.10.10',
+                                              fixed_ip_id=fixed_ip['id']))
+        return instance_uuid
+
+    def _get_by_ip_filter(self, **kwargs):
+        return [fixed_ip['address']
+                for fixed_ip in db.fixed_ip_get_by_ip_filter(self.ctxt,
+                                                             **kwargs)]
+
+    def test_fixed_ip_get_by_ip_filter_fixed_address(self):
+        instance_uuid = self._create_ip_filter_fixed_ips()
+        fixed_ips = db.fixed_ip_get_by_ip_filter(
+            self.ctxt, fixed_address='192.168.1.5')
+        self.assertEqual(1, len(fixed_ips))
+        self.assertEqual(instance_uuid, fixed_ips[0]['instance_uuid'])
+        self.assertEqual([], self._get_by_ip_filter(
+            fixed_address='192.168.1.6'))
+        self.assertEqual([], self._get_by_ip_filter(
+            fixed_address='10.10.10.10'))
+
+    def test_fixed_ip_get_by_ip_filter_address(self):
+        self._create_ip_filter_fixed_ips()
+        self.assertEqual(['192.168.1.15'],
+                         self._get_by_ip_filter(address='192.168.1.15'))
+        self.assertEqual(['192.168.2.5'],
+                         self._get_by_ip_filter(address='10.10.10.10'))
+
+    def test_fixed_ip_get_by_ip_filter_regexp(self):
+        self._create_ip_filter_fixed_ips()
+        self.assertEqual(['192.168.1.5', '192.168.1.15'],
+                         self._get_by_ip_filter(regexp='192.168.1.'))
+        self.assertEqual(['192.168.2.5'],
+                         self._get_by_ip_filter(regexp='10\\.10'))
+        self.assertEqual(['192.168.1.5', '192.168.2.5'],
+                         self._get_by_ip_filter(regexp='.*\\.5$'))
+        self.assertEqual([], self._get_by_ip_filter(regexp='168'))
+
+    def test_fixed_ip_get_by_ip_filter_regexp_not_portable(self):
+        self._create_ip_filter_fixed_ips()
+        self.assertEqual(['192.168.1.5', '192.168.1.15', '192.168.2.5'],
+                         self._get_by_ip_filter(regexp='\\d+'))
+
+    def test_fixed_ip_get_by_ip_filter_no_filter(self):
+        self._create_ip_filter_fixed_ips()
+        self.assertEqual([], self._get_by_ip_filter())
+
     def create_fixed_ip(self, **params):
         default_params = {'address': '192.168.0.1'}
         default_params.update(params)
@@ -4289,6 +4438,45 @@ class VolumeUsageDBApiTestCase(test.TestCase):
         for key, value in expected_vol_usages.items():
             self.assertEqual(vol_usages[0][key], value, key)
 
+    def test_vol_usage_update_many(self):
+        ctxt = context.get_admin_context()
+        now = timeutils.utcnow()
+        timeutils.set_time_override(now)
+        start_time = now - datetime.timedelta(seconds=10)
+
+        db.vol_usage_update(ctxt, u'1', rd_req=10, rd_bytes=20,
+                            wr_req=30, wr_bytes=40,
+                            instance_id='fake-instance-uuid1',
+                            project_id='fake-project-uuid1',
+                            user_id='fake-user-uuid1',
+                            availability_zone='fake-az')
+
+        def _usage(volume_id, rd_req, instance_id):
+            return {'volume_id': volume_id, 'rd_req': rd_req,
+                    'rd_bytes': rd_req * 2, 'wr_req': rd_req * 3,
+                    'wr_bytes': rd_req * 4, 'instance_id': instance_id,
+                    'project_id': 'fake-project-uuid',
+                    'user_id': 'fake-user-uuid',
+                    'availability_zone': 'fake-az'}
+
+        updated = db.vol_usage_update_many(ctxt, [
+            _usage(u'1', 1000, 'fake-instance-uuid1'),
+            _usage(u'2', 100, 'fake-instance-uuid2')])
+        self.assertEqual([u'1', u'2'],
+                         [usage['volume_id'] for usage in updated])
+
+        vol_usages = db.vol_get_usage_by_time(ctxt, start_time)
+        self.assertEqual(2, len(vol_usages))
+        vol_usages = dict((usage['volume_id'], usage)
+                          for usage in vol_usages)
+        self.assertEqual(1000, vol_usages[u'1']['curr_reads'])
+        self.assertEqual(4000, vol_usages[u'1']['curr_write_bytes'])
+        self.assertEqual(0, vol_usages[u'1']['tot_reads'])
+        self.assertEqual(100, vol_usages[u'2']['curr_reads'])
+        self.assertEqual('fake-instance-uuid2',
+                         vol_usages[u'2']['instance_uuid'])
+        self.assertEqual(now, vol_usages[u'2']['curr_last_refreshed'])
+
     def test_vol_usage_update_when_blockdevicestats_reset(self):
         ctxt = context.get_admin_context()
         now = timeutils.utcnow()
@@ -5392,6 +5580,38 @@ class QuotaTestCase(test.TestCase, ModelsObjectComparatorMixin):
         for key, value in expected.iteritems():
             self.assertEqual(value, quota_usage[key])
 
+    def test_quota_reserve_over_quota_rolled_back(self):
+        def sync(elevated, project_id, user_id, session):
+            return {'resource0': 0}
+        self.stubs.Set(sqlalchemy_api, 'QUOTA_SYNC_FUNCTIONS',
+                       {'_sync_resource0': sync})
+        resources = {'resource0': quota.ReservableResource(
+            'resource0', '_sync_resource0')}
+        limits = {'resource0': 5}
+        expire = timeutils.utcnow() + datetime.timedelta(hours=1)
+
+        def request(count):
+            return dict(context=self.ctxt, project_quotas=limits,
+                        user_quotas=limits, deltas={'resource0': count},
+                        expire=expire, user_id='u1')
+
+        results = db.quota_reserve_batch(self.ctxt, resources,
+                                         [request(2), request(9), request(1)],
+                                         5, 0, project_id='p1')
+        self.assertEqual([1, None, 1],
+                         [uuids and len(uuids) for uuids, error in results])
+        self.assertIsInstance(results[1][1], exception.OverQuota)
+        usage = db.quota_usage_get(self.ctxt, 'p1', 'resource0', 'u1')
+        self.assertEqual(3, usage['reserved'])
+        # Created by the first request, counted down by the last one only.
+        self.assertEqual(4, usage['until_refresh'])
+
+        self.assertRaises(exception.OverQuota, db.quota_reserve, self.ctxt,
+                          resources, limits, limits, {'resource0': 9},
+                          expire, 5, 0, project_id='p1', user_id='u1')
+        usage = db.quota_usage_get(self.ctxt, 'p1', 'resource0', 'u1')
+        self.assertEqual(4, usage['until_refresh'])
+
     def test_quota_create_exists(self):
         db.quota_create(self.ctxt, 'project1', 'resource1', 41)
         self.assertRaises(exception.QuotaExists, db.quota_create, self.ctxt,
@@ -5548,6 +5768,25 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
             new_stats = jsonutils.loads(node['stats'])
             self.assertEqual(self.stats, new_stats)
 
+    def test_compute_node_get_all_changed_since(self):
+        before = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, before)
+        self.assertEqual([self.item['id']], [n['id'] for n in nodes])
+        self.assertEqual(self.service['id'], nodes[0]['service_id'])
+        self.assertNotIn('service', nodes[0])
+
+        after = timeutils.utcnow() + datetime.timedelta(seconds=1)
+        self.assertEqual([],
+                db.compute_node_get_all_changed_since(self.ctxt, after))
+
+    def test_compute_node_get_all_changed_since_deleted(self):
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        before = timeutils.utcnow() - datetime.timedelta(seconds=1)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, before)
+        self.assertEqual(1, len(nodes))
+        self.assertTrue(nodes[0]['deleted'])
+        self.assertEqual([], db.compute_node_get_all(self.ctxt, False))
+
     def test_compute_node_get_all_deleted_compute_node(self):
         # Create a service and compute node and ensure we can find its stats;
         # delete the service and compute node when done and loop again
@@ -6210,6 +6449,64 @@ class BwUsageTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualObjects(bw_usage, expected_bw_usage,
                                  ignored_keys=self._ignored_keys)
 
+    def test_bw_usage_update_many(self):
+        now = timeutils.utcnow()
+        prev_period = now - datetime.timedelta(seconds=3600)
+        start_period = now - datetime.timedelta(seconds=10)
+
+        # Counters from the previous period are the starting point of
+        # fake_uuid1, fake_uuid2 has never been polled.
+        db.bw_usage_update(self.ctxt, 'fake_uuid1', 'fake_mac1',
+                           prev_period, 1000, 2000, 100, 200)
+
+        bw_counters = [{'uuid': 'fake_uuid1', 'mac_address': 'fake_mac1',
+                        'bw_in': 150, 'bw_out': 260},
+                       {'uuid': 'fake_uuid2', 'mac_address': 'fake_mac2',
+                        'bw_in': 50, 'bw_out': 60}]
+        updated = db.bw_usage_update_many(self.ctxt, start_period,
+                                          prev_period, bw_counters,
+                                          update_cells=False)
+        self.assertEqual([('fake_uuid1', 50, 60), ('fake_uuid2', 0, 0)],
+                         [(usage['uuid'], usage['bw_in'], usage['bw_out'])
+                          for usage in updated])
+
+        # fake_uuid1 keeps counting, fake_uuid2's counters rolled over.
+        bw_counters = [{'uuid': 'fake_uuid1', 'mac_address': 'fake_mac1',
+                        'bw_in': 170, 'bw_out': 300},
+                       {'uuid': 'fake_uuid2', 'mac_address': 'fake_mac2',
+                        'bw_in': 10, 'bw_out': 20}]
+        db.bw_usage_update_many(self.ctxt, start_period, prev_period,
+                                bw_counters, update_cells=False)
+
+        expected = {'fake_uuid1': {'bw_in': 70, 'bw_out': 100,
+                                   'last_ctr_in': 170,
+                                   'last_ctr_out': 300,
+                                   'last_refreshed': now},
+                    'fake_uuid2': {'bw_in': 10, 'bw_out': 20,
+                                   'last_ctr_in': 10,
+                                   'last_ctr_out': 20,
+                                   'last_refreshed': now}}
+        bw_usages = db.bw_usage_get_by_uuids(self.ctxt,
+                ['fake_uuid1', 'fake_uuid2'], start_period)
+        self.assertEqual(2, len(bw_usages))
+        for usage in bw_usages:
+            for key, value in expected[usage['uuid']].items():
+                self.assertEqual(value, usage[key], key)
+
+    def test_bw_usage_update_many_updates_cells(self):
+        now = timeutils.utcnow()
+        start_period = now - datetime.timedelta(seconds=10)
+        self.mox.StubOutWithMock(cells_rpcapi.CellsAPI,
+                                 'bw_usage_update_at_top')
+        cells_rpcapi.CellsAPI.bw_usage_update_at_top(self.ctxt,
+                'fake_uuid1', 'fake_mac1', start_period, 0, 0, 10, 20, now)
+        self.mox.ReplayAll()
+
+        db.bw_usage_update_many(self.ctxt, start_period, None,
+                                [{'uuid': 'fake_uuid1',
+                                  'mac_address': 'fake_mac1',
+                                  'bw_in': 10, 'bw_out': 20}])
+
 
 class Ec2TestCase(test.TestCase):
 
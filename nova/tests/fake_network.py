@@ -170,6 +170,23 @@ class FakeNetworkManager(network_manager.NetworkManager):
             return [ip for ip in self.fixed_ips
                     if ip['virtual_interface_id'] == vif_id]
 
+        def fixed_ip_get_by_ip_filter(self, context, fixed_address=None,
+                                      address=None, regexp=None):
+            # NOTE: regexps are left to the caller, like on backends
+            #       which can't evaluate them.
+            vifs = dict((vif['id'], vif) for vif in self.vifs)
+            floating = dict((ip['fixed_ip_id'], ip['address'])
+                            for ip in self.floating_ips)
+            fixed_ips = []
+            for ip in self.fixed_ips:
+                if regexp is None and address not in (ip['address'],
+                                                      floating.get(ip['id'])):
+                    if fixed_address != ip['address']:
+                        continue
+                vif = vifs[ip['virtual_interface_id']]
+                fixed_ips.append(dict(ip, instance_uuid=vif['instance_uuid']))
+            return fixed_ips
+
         def fixed_ip_disassociate(self, context, address):
             return True
 
@@ -16,6 +16,7 @@
 
 import datetime
 import filecmp
+import hashlib
 import os
 import random
 import tempfile
@@ -359,6 +360,101 @@ class TestGlanceImageService(test.NoDBTestCase):
         os.remove(client.s_tmpfname)
         os.remove(tmpfname)
 
+    def _create_data_image_service(self, chunks):
+        class MyGlanceStubClient(glance_stubs.StubGlanceClient):
+            """A client that returns some image data."""
+            def data(self, image_id):
+                return iter(chunks)
+
+        return self._create_image_service(MyGlanceStubClient())
+
+    def test_download_to_file_returns_checksum(self):
+        self.flags(glance_download_write_size=8)
+        chunks = ['abc', 'defghij', 'klmnopqrst', 'uvwxyz']
+        service = self._create_data_image_service(chunks)
+        (outfd, tmpfname) = tempfile.mkstemp(prefix='checksum')
+        os.close(outfd)
+        self.addCleanup(os.remove, tmpfname)
+
+        checksum = service.download(self.context, 1, dst_path=tmpfname)
+
+        with open(tmpfname) as f:
+            self.assertEqual(''.join(chunks), f.read())
+        self.assertEqual(hashlib.sha1(''.join(chunks)).hexdigest(),
+                         checksum)
+
+    def test_download_aligned_writes(self):
+        self.flags(glance_download_write_size=8)
+        service = self._create_data_image_service(['abc', 'defghij',
+                                                   'klmnopqrst', 'uvwxyz'])
+        writer = mock.Mock()
+
+        service.download(self.context, 1, data=writer)
+
+        self.assertEqual([mock.call('abcdefgh'), mock.call('ijklmnop'),
+                          mock.call('qrstuvwx'), mock.call('yz')],
+                         writer.write.call_args_list)
+
+    def test_download_write_error(self):
+        self.flags(glance_download_write_size=1)
+        service = self._create_data_image_service(['a', 'b', 'c'])
+        self.stubs.Set(glance.tpool, 'execute',
+                       mock.Mock(side_effect=IOError()))
+
+        self.assertRaises(IOError, service.download, self.context, 1,
+                          dst_path=os.devnull)
+
+    def test_download_slot(self):
+        self.stubs.Set(glance, '_download_semaphore', None)
+        self.flags(glance_max_concurrent_downloads=1)
+        with glance._download_slot():
+            self.assertTrue(glance._download_semaphore.locked())
+        self.assertFalse(glance._download_semaphore.locked())
+
+    def test_download_slot_unlimited(self):
+        self.stubs.Set(glance, '_download_semaphore', None)
+        self.flags(glance_max_concurrent_downloads=0)
+        with glance._download_slot():
+            self.assertIsNone(glance._download_semaphore)
+
+    def test_download_from_peers(self):
+        service = self._create_data_image_service(['abc'])
+        peer_mod = mock.Mock()
+        peer_mod.download.return_value = 'fake-sha1'
+        service._download_handlers['peer'] = peer_mod
+        self.stubs.Set(service, 'show',
+                       mock.Mock(return_value={'checksum': 'fake-md5',
+                                               'disk_format': 'qcow2'}))
+
+        checksum = service.download(self.context, 'fake-id',
+                                    dst_path=os.devnull)
+
+        self.assertEqual('fake-sha1', checksum)
+        url_parts = peer_mod.download.call_args[0][1]
+        self.assertEqual(('peer', 'fake-id'),
+                         (url_parts.scheme, url_parts.netloc))
+        self.assertEqual({'checksum': 'fake-md5', 'disk_format': 'qcow2'},
+                         peer_mod.download.call_args[0][3])
+
+    def test_download_from_peers_falls_back_to_glance(self):
+        service = self._create_data_image_service(['abc'])
+        peer_mod = mock.Mock()
+        peer_mod.download.side_effect = exception.ImageDownloadModuleError(
+            reason='no peer', module='peer')
+        service._download_handlers['peer'] = peer_mod
+        self.stubs.Set(service, 'show',
+                       mock.Mock(return_value={'checksum': 'fake-md5'}))
+        (outfd, tmpfname) = tempfile.mkstemp(prefix='peer')
+        os.close(outfd)
+        self.addCleanup(os.remove, tmpfname)
+
+        checksum = service.download(self.context, 'fake-id',
+                                    dst_path=tmpfname)
+
+        self.assertEqual(hashlib.sha1('abc').hexdigest(), checksum)
+        with open(tmpfname) as f:
+            self.assertEqual('abc', f.read())
+
     def test_download_module_filesystem_match(self):
 
         mountpoint = '/'
@@ -0,0 +1,181 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import hashlib
+import os
+import tempfile
+
+import eventlet
+from eventlet import wsgi
+import six.moves.urllib.parse as urlparse
+
+from nova import exception
+from nova.image.download import peer
+from nova import test
+import nova.virt.libvirt.imagecache as lv_imagecache
+
+
+class NullLogger(object):
+    def write(self, *args):
+        pass
+
+
+class FakePeer(object):
+    """Serve files of an image cache over HTTP on a local port."""
+
+    def __init__(self, files):
+        self.files = files
+        self.requests = []
+        self.socket = eventlet.listen(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.thread = eventlet.spawn(wsgi.server, self.socket, self.app,
+                                     log=NullLogger())
+
+    def app(self, environ, start_response):
+        path = environ['PATH_INFO']
+        self.requests.append(path)
+        fname = path.rsplit('/', 1)[-1]
+        if fname not in self.files:
+            start_response('404 Not Found', [])
+            return ['']
+        start_response('200 OK',
+                       [('Content-Type', 'application/octet-stream')])
+        return [self.files[fname]]
+
+    def stop(self):
+        self.thread.kill()
+        self.socket.close()
+
+
+class PeerTransferTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(PeerTransferTestCase, self).setUp()
+        self.image_id = 'fake-image'
+        self.data = 'image data ' * 1024
+        self.fname = lv_imagecache.get_cache_fname(
+            {'image_id': self.image_id}, 'image_id')
+        self.flags(host='compute1')
+        self.flags(chunk_size=1000, group='image_peer')
+        self.xfer = peer.PeerTransfer()
+        (outfd, self.dst_path) = tempfile.mkstemp(prefix='peer')
+        os.close(outfd)
+        self.addCleanup(self._remove_dst)
+
+    def _remove_dst(self):
+        if os.path.exists(self.dst_path):
+            os.unlink(self.dst_path)
+
+    def _start_peer(self, files):
+        fake_peer = FakePeer(files)
+        self.addCleanup(fake_peer.stop)
+        self.flags(port=fake_peer.port, group='image_peer')
+        return fake_peer
+
+    def _stub_hosts(self, hosts):
+        self.stubs.Set(self.xfer.servicegroup_api, 'get_all',
+                       lambda topic: hosts)
+
+    def _download(self, checksum=None, disk_format='raw'):
+        if checksum is None:
+            checksum = hashlib.md5(self.data).hexdigest()
+        url_parts = urlparse.urlparse('peer://%s' % self.image_id)
+        return self.xfer.download(None, url_parts, self.dst_path,
+                                  {'checksum': checksum,
+                                   'disk_format': disk_format})
+
+    def test_get_peers(self):
+        self.flags(max_peers=2, group='image_peer')
+        self._stub_hosts(['compute1', 'compute2', 'compute3', 'compute4'])
+        peers = self.xfer._get_peers()
+        self.assertEqual(2, len(peers))
+        self.assertNotIn('compute1', peers)
+
+    def test_get_url(self):
+        self.flags(port=8080, path='/base', group='image_peer')
+        self.assertEqual('http://compute2:8080/base/%s' % self.fname,
+                         self.xfer._get_url('compute2', self.image_id))
+
+    def test_download(self):
+        fake_peer = self._start_peer({self.fname: self.data})
+        self._stub_hosts(['compute1', '127.0.0.1'])
+
+        sha1 = self._download()
+
+        self.assertEqual(hashlib.sha1(self.data).hexdigest(), sha1)
+        self.assertEqual(['/%s' % self.fname], fake_peer.requests)
+        with open(self.dst_path) as f:
+            self.assertEqual(self.data, f.read())
+
+    def test_download_converted_image(self):
+        fake_peer = self._start_peer({self.fname: self.data})
+        self._stub_hosts(['127.0.0.1'])
+
+        self.assertRaises(exception.ImageDownloadModuleError,
+                          self._download, disk_format='qcow2')
+        self.assertEqual([], fake_peer.requests)
+
+    def test_download_qcow2_not_converted(self):
+        self.flags(force_raw_images=False)
+        self._start_peer({self.fname: self.data})
+        self._stub_hosts(['127.0.0.1'])
+
+        sha1 = self._download(disk_format='qcow2')
+
+        self.assertEqual(hashlib.sha1(self.data).hexdigest(), sha1)
+
+    def test_download_checksum_mismatch(self):
+        self._start_peer({self.fname: 'corrupted'})
+        self._stub_hosts(['127.0.0.1'])
+
+        self.assertRaises(exception.ImageDownloadModuleError,
+                          self._download)
+        self.assertFalse(os.path.exists(self.dst_path))
+
+    def test_download_tries_next_peer(self):
+        self._start_peer({})
+        self._stub_hosts(['127.0.0.1', 'localhost'])
+        self.stubs.Set(peer.random, 'shuffle', lambda hosts: None)
+        urls = []
+        orig_fetch = self.xfer._fetch
+
+        def fake_fetch(url, dst_path, checksum):
+            urls.append(url)
+            if 'localhost' in url:
+                with open(dst_path, 'wb') as f:
+                    f.write(self.data)
+                return 'fake-sha1'
+            return orig_fetch(url, dst_path, checksum)
+
+        self.stubs.Set(self.xfer, '_fetch', fake_fetch)
+
+        self.assertEqual('fake-sha1', self._download())
+        self.assertEqual(2, len(urls))
+
+    def test_download_unreachable_peer(self):
+        self.flags(port=1, timeout=1, group='image_peer')
+        self._stub_hosts(['127.0.0.1'])
+
+        self.assertRaises(exception.ImageDownloadModuleError,
+                          self._download)
+
+    def test_download_no_peers(self):
+        self._stub_hosts([])
+        self.assertRaises(exception.ImageDownloadModuleError,
+                          self._download)
+
+    def test_download_no_checksum(self):
+        self._stub_hosts(['127.0.0.1'])
+        self.assertRaises(exception.ImageDownloadModuleMetaDataError,
+                          self._download, checksum='')
@@ -1831,10 +1831,10 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertTrue(manager.create_networks(*args))
 
     @mock.patch('nova.db.network_get')
-    @mock.patch('nova.db.fixed_ips_by_virtual_interface')
+    @mock.patch('nova.db.fixed_ip_get_by_ip_filter')
     def test_get_instance_uuids_by_ip_regex(self, fixed_get, network_get):
         manager = fake_network.FakeNetworkManager(self.stubs)
-        fixed_get.side_effect = manager.db.fixed_ips_by_virtual_interface
+        fixed_get.side_effect = manager.db.fixed_ip_get_by_ip_filter
         _vifs = manager.db.virtual_interface_get_all(None)
         fake_context = context.RequestContext('user', 'project')
         network_get.return_value = dict(test_network.fake_network,
@@ -1934,10 +1934,10 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertEqual(res[1]['instance_uuid'], _vifs[2]['instance_uuid'])
 
     @mock.patch('nova.db.network_get')
-    @mock.patch('nova.db.fixed_ips_by_virtual_interface')
+    @mock.patch('nova.db.fixed_ip_get_by_ip_filter')
     def test_get_instance_uuids_by_ip(self, fixed_get, network_get):
         manager = fake_network.FakeNetworkManager(self.stubs)
-        fixed_get.side_effect = manager.db.fixed_ips_by_virtual_interface
+        fixed_get.side_effect = manager.db.fixed_ip_get_by_ip_filter
         _vifs = manager.db.virtual_interface_get_all(None)
         fake_context = context.RequestContext('user', 'project')
         network_get.return_value = dict(test_network.fake_network,
@@ -1970,6 +1970,29 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertEqual(len(res), 1)
         self.assertEqual(res[0]['instance_uuid'], _vifs[2]['instance_uuid'])
 
+    @mock.patch('nova.db.fixed_ip_get_by_ip_filter')
+    def test_get_instance_uuids_by_exact_ip_regex(self, fixed_get):
+        manager = fake_network.FakeNetworkManager(self.stubs)
+        fixed_get.side_effect = manager.db.fixed_ip_get_by_ip_filter
+        _vifs = manager.db.virtual_interface_get_all(None)
+        fake_context = context.RequestContext('user', 'project')
+
+        # The pattern built by the compute API for a fixed_ip search is
+        # looked up by address.
+        res = manager.get_instance_uuids_by_ip_filter(
+            fake_context, {'ip': '^172\\.16\\.0\\.2$'})
+        fixed_get.assert_called_once_with(fake_context, fixed_address=None,
+                                          address='172.16.0.2', regexp=None)
+        self.assertEqual([{'instance_uuid': _vifs[1]['instance_uuid'],
+                           'ip': netaddr.IPAddress('172.16.0.2')}], res)
+
+        fixed_get.reset_mock()
+        manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                {'ip': '^172\\.16\\.0\\.2'})
+        fixed_get.assert_called_once_with(fake_context, fixed_address=None,
+                                          address=None,
+                                          regexp='^172\\.16\\.0\\.2')
+
     @mock.patch('nova.db.network_get_by_uuid')
     def test_get_network(self, get):
         manager = fake_network.FakeNetworkManager()
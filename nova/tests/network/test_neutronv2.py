@@ -26,6 +26,7 @@ from nova.compute import flavors
 from nova.conductor import api as conductor_api
 from nova import context
 from nova import exception
+from nova.network import base_api
 from nova.network import model
 from nova.network import neutronv2
 from nova.network.neutronv2 import api as neutronapi
@@ -2064,6 +2065,113 @@ class TestNeutronv2(TestNeutronv2Base):
         self.assertEqual(nw_infos[1]['id'], 'port1')
         self.assertEqual(nw_infos[2]['id'], 'port2')
 
+    def test_get_instances_nw_info(self):
+        api = neutronapi.API()
+        fake_insts = [{'project_id': 'fake', 'uuid': 'uuid1'},
+                      {'project_id': 'fake', 'uuid': 'uuid2'},
+                      {'project_id': 'fake', 'uuid': 'uuid3'}]
+        fake_ports = [{'id': 'port1', 'device_id': 'uuid1',
+                       'tenant_id': 'fake'},
+                      {'id': 'port2', 'device_id': 'uuid2',
+                       'tenant_id': 'fake'},
+                      {'id': 'port3', 'device_id': 'uuid2',
+                       'tenant_id': 'other'}]
+        fake_nw_info = model.NetworkInfo()
+        neutronv2.get_client(mox.IgnoreArg(), admin=True).MultipleTimes(
+            ).AndReturn(self.moxed_client)
+        self.moxed_client.list_ports(
+            device_id=['uuid1', 'uuid2', 'uuid3']).AndReturn(
+                {'ports': fake_ports})
+        self.mox.StubOutWithMock(api, '_get_port_resources')
+        self.mox.StubOutWithMock(api, '_build_network_info_model')
+        self.mox.StubOutWithMock(base_api,
+                                 'update_instance_cache_with_nw_info')
+        api._get_port_resources(
+            self.context, self.moxed_client,
+            [fake_ports[0], fake_ports[1]]).AndReturn('fake-resources')
+        api._build_network_info_model(
+            self.context, fake_insts[0], neutron_ports=[fake_ports[0]],
+            resources='fake-resources').AndReturn(fake_nw_info)
+        base_api.update_instance_cache_with_nw_info(
+            api, self.context, fake_insts[0], nw_info=fake_nw_info)
+        api._build_network_info_model(
+            self.context, fake_insts[1], neutron_ports=[fake_ports[1]],
+            resources='fake-resources').AndRaise(exception.NovaException())
+        api._build_network_info_model(
+            self.context, fake_insts[2], neutron_ports=[],
+            resources='fake-resources').AndReturn(fake_nw_info)
+        base_api.update_instance_cache_with_nw_info(
+            api, self.context, fake_insts[2], nw_info=fake_nw_info)
+        self.mox.ReplayAll()
+        neutronv2.get_client('fake')
+
+        result = api.get_instances_nw_info(self.context, fake_insts)
+
+        self.assertEqual(['uuid1', 'uuid3'], sorted(result))
+
+    def test_get_instances_nw_info_lists_resources_once(self):
+        api = neutronapi.API()
+        fake_insts = []
+        fake_ports = []
+        for x in (1, 2):
+            fake_insts.append(
+                {'project_id': 'fake', 'uuid': 'uuid%d' % x,
+                 'info_cache': {'network_info': [
+                     {'id': 'port%d' % x, 'network': {'id': 'net-id'}}]}})
+            fake_ports.append(
+                {'id': 'port%d' % x, 'device_id': 'uuid%d' % x,
+                 'tenant_id': 'fake', 'network_id': 'net-id',
+                 'admin_state_up': True, 'status': 'ACTIVE',
+                 'mac_address': 'de:ad:be:ef:00:0%d' % x,
+                 'fixed_ips': [{'ip_address': '10.0.1.%d' % x,
+                                'subnet_id': 'subnet-id'}],
+                 'binding:vif_type': model.VIF_TYPE_OVS})
+        neutronv2.get_client(mox.IgnoreArg(), admin=True).MultipleTimes(
+            ).AndReturn(self.moxed_client)
+        self.moxed_client.list_ports(
+            device_id=['uuid1', 'uuid2']).AndReturn({'ports': fake_ports})
+        self.moxed_client.list_networks(id=['net-id']).AndReturn(
+            {'networks': [{'id': 'net-id', 'name': 'foo',
+                           'tenant_id': 'fake'}]})
+        self.moxed_client.list_subnets(id=['subnet-id']).AndReturn(
+            {'subnets': [{'id': 'subnet-id', 'network_id': 'net-id',
+                          'cidr': '10.0.1.0/24', 'gateway_ip': '10.0.1.1',
+                          'dns_nameservers': ['8.8.8.8']}]})
+        self.moxed_client.list_ports(
+            network_id=['net-id'], device_owner='network:dhcp').AndReturn(
+                {'ports': [{'network_id': 'net-id',
+                            'fixed_ips': [{'subnet_id': 'subnet-id',
+                                           'ip_address': '10.0.1.254'}]}]})
+        self.moxed_client.list_floatingips(
+            port_id=['port1', 'port2']).AndReturn(
+                {'floatingips': [{'port_id': 'port2',
+                                  'fixed_ip_address': '10.0.1.2',
+                                  'floating_ip_address': '172.24.4.3'}]})
+        self.mox.StubOutWithMock(base_api,
+                                 'update_instance_cache_with_nw_info')
+        for fake_inst in fake_insts:
+            base_api.update_instance_cache_with_nw_info(
+                api, self.context, fake_inst,
+                nw_info=mox.IsA(model.NetworkInfo))
+        self.mox.ReplayAll()
+        neutronv2.get_client('fake')
+
+        result = api.get_instances_nw_info(self.context, fake_insts)
+
+        for x in (1, 2):
+            vif = result['uuid%d' % x][0]
+            self.assertEqual('port%d' % x, vif['id'])
+            self.assertEqual('foo', vif['network']['label'])
+            subnet = vif['network']['subnets'][0]
+            self.assertEqual('10.0.1.0/24', subnet['cidr'])
+            self.assertEqual('10.0.1.254', subnet['meta']['dhcp_server'])
+            self.assertEqual(['8.8.8.8'],
+                             [dns['address'] for dns in subnet['dns']])
+        self.assertEqual([], result['uuid1'][0].floating_ips())
+        self.assertEqual(['172.24.4.3'],
+                         [ip['address']
+                          for ip in result['uuid2'][0].floating_ips()])
+
     def test_get_all_empty_list_networks(self):
         api = neutronapi.API()
         self.moxed_client.list_networks().AndReturn({'networks': []})
@@ -291,3 +291,18 @@ class TestIPV6Network(TestField):
                                     for x in good]
         self.from_primitive_values = [(x, netaddr.IPNetwork(x))
                                       for x in good]
+
+
+class TestNativeTypes(test.NoDBTestCase):
+    def test_native_values_are_returned_by_coerce(self):
+        for field, value in [(fields.StringField(), u'foo'),
+                             (fields.UUIDField(), 'fake-uuid'),
+                             (fields.IntegerField(), 1),
+                             (fields.FloatField(), 1.5),
+                             (fields.BooleanField(), True)]:
+            self.assertIn(value.__class__, field.native_types)
+            self.assertIs(value, field.coerce('obj', 'attr', value))
+
+    def test_no_native_types(self):
+        self.assertEqual((), fields.DateTimeField().native_types)
+        self.assertEqual((), fields.Field(FakeFieldType()).native_types)
@@ -249,6 +249,16 @@ class _TestFixedIPObject(object):
         get.assert_called_once_with(self.context, 123)
         self._compare(fixedips[0], fake_fixed_ip)
 
+    @mock.patch('nova.db.fixed_ip_get_by_ip_filter')
+    def test_get_by_ip_filter(self, get):
+        get.return_value = [fake_fixed_ip]
+        fixedips = fixed_ip.FixedIPList.get_by_ip_filter(
+            self.context, regexp='192.168.1.')
+        self.assertEqual(1, len(fixedips))
+        get.assert_called_once_with(self.context, fixed_address=None,
+                                    address=None, regexp='192.168.1.')
+        self._compare(fixedips[0], fake_fixed_ip)
+
     @mock.patch('nova.db.fixed_ip_bulk_create')
     def test_bulk_create(self, bulk):
         fixed_ips = [fixed_ip.FixedIP(address='192.168.1.1'),
@@ -847,6 +847,57 @@ class TestRemoteInstanceObject(test_objects._RemoteTest,
     pass
 
 
+class TestDeltaRemoteInstanceObject(test_objects._RemoteTest):
+    fake_instance = _TestInstanceObject.fake_instance
+
+    def setUp(self):
+        super(TestDeltaRemoteInstanceObject, self).setUp()
+        self.flags(delta_object_actions=True)
+
+    def test_save(self):
+        old_ref = dict(self.fake_instance, host='oldhost', vm_state='old')
+        new_ref = dict(old_ref, host='newhost', vm_state='meow')
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        self.mox.StubOutWithMock(db, 'instance_update_and_get_original')
+        self.mox.StubOutWithMock(notifications, 'send_update')
+        db.instance_get_by_uuid(self.context, old_ref['uuid'],
+                                columns_to_join=['info_cache',
+                                                 'security_groups'],
+                                use_slave=False
+                                ).AndReturn(old_ref)
+        # Only the joined fields which were sent are refreshed
+        db.instance_update_and_get_original(
+                self.context, old_ref['uuid'], {'vm_state': 'meow'},
+                update_cells=False, columns_to_join=['system_metadata']
+                ).AndReturn((old_ref, new_ref))
+        notifications.send_update(self.context, mox.IgnoreArg(),
+                                  mox.IgnoreArg())
+        self.mox.ReplayAll()
+
+        sent = []
+        manager = self.conductor_service.manager
+        orig_object_dispatch = manager._object_dispatch
+
+        def fake_object_dispatch(target, method, context, args, kwargs):
+            if method == 'save':
+                sent.append(set(name for name in target.fields
+                                if target.obj_attr_is_set(name)))
+            return orig_object_dispatch(target, method, context, args,
+                                        kwargs)
+        self.stubs.Set(manager, '_object_dispatch', fake_object_dispatch)
+
+        inst = instance.Instance.get_by_uuid(self.context, old_ref['uuid'])
+        info_cache = inst.info_cache
+        inst.vm_state = 'meow'
+        inst.save()
+        self.assertEqual('newhost', inst.host)
+        self.assertEqual('meow', inst.vm_state)
+        self.assertEqual(set(), inst.obj_what_changed())
+        self.assertIs(info_cache, inst.info_cache)
+        self.assertEqual(set(['id', 'uuid', 'cell_name', 'vm_state']),
+                         sent[-1])
+
+
 class _TestInstanceListObject(object):
     def fake_instance(self, id, updates=None):
         fake_instance = fakes.stub_instance(id=2,
@@ -141,6 +141,24 @@ class TestMetaclass(test.TestCase):
         self.assertEqual(expected, Test1._obj_classes)
         self.assertEqual(expected, Test2._obj_classes)
 
+    def test_compact_storage(self):
+        class CompactObj(base.NovaObject):
+            fields = {'foo': fields.IntegerField(),
+                      'bar': fields.StringField()}
+            obj_compact_storage = True
+
+            def obj_load_attr(self, attrname):
+                setattr(self, attrname, 'loaded!')
+
+        self.assertEqual(('_bar', '_changed_fields', '_context', '_foo'),
+                         CompactObj.__slots__)
+        obj = CompactObj(foo=1)
+        self.assertFalse(obj.obj_attr_is_set('bar'))
+        self.assertEqual('loaded!', obj.bar)
+        self.assertEqual(set(['foo', 'bar']), obj.obj_what_changed())
+        self.assertEqual(obj.obj_to_primitive(),
+                         obj.obj_clone().obj_to_primitive())
+
 
 class TestUtils(test.TestCase):
     def test_datetime_or_none(self):
@@ -726,7 +744,27 @@ class _TestObject(object):
 
 
 class TestObject(_LocalTest, _TestObject):
-    pass
+    def test_native_values_are_not_coerced(self):
+        bar = u'bar'
+        obj = MyObj(foo=1, bar=bar)
+        self.assertIs(bar, obj.bar)
+        obj.bar = 'str'
+        self.assertIsInstance(obj.bar, unicode)
+        self.assertEqual(set(['foo', 'bar']), obj.obj_what_changed())
+
+    def test_obj_to_delta_primitive(self):
+        obj = MyObj(foo=1, bar='bar', missing='missing')
+        obj.obj_reset_changes()
+        obj.foo = 2
+        self.stubs.Set(obj, 'obj_delta_keys', ['bar'])
+        primitive, digests = obj.obj_to_delta_primitive()
+        self.assertEqual({'foo': 2, 'bar': 'bar'},
+                         primitive['nova_object.data'])
+        self.assertEqual(['foo'], primitive['nova_object.changes'])
+        self.assertEqual({'missing': base.primitive_digest('missing')},
+                         digests)
+        obj2 = MyObj.obj_from_primitive(primitive)
+        self.assertEqual(set(['foo']), obj2.obj_what_changed())
 
 
 class TestRemoteObject(_RemoteTest, _TestObject):
@@ -752,6 +790,12 @@ class TestRemoteObject(_RemoteTest, _TestObject):
         self.assertEqual('oldbar', obj.bar)
 
 
+class TestCompactRemoteObject(TestRemoteObject):
+    def _testable_conductor(self):
+        self.flags(compact_object_payloads=True)
+        super(TestCompactRemoteObject, self)._testable_conductor()
+
+
 class TestObjectListBase(test.TestCase):
     def test_list_like_operations(self):
         class MyElement(base.NovaObject):
@@ -881,3 +925,74 @@ class TestObjectSerializer(_BaseTestCase):
             self.assertEqual(1, len(thing2))
             for item in thing2:
                 self.assertIsInstance(item, MyObj)
+
+    def test_compact_object_serialization(self):
+        ser = base.NovaObjectSerializer(compact=True)
+        objs = [MyObj(foo=i, bar='bar%i' % i) for i in range(10)]
+        objs[0].obj_reset_changes()
+        primitive = ser.serialize_entity(self.context, objs)
+        self.assertEqual(base.COMPACT_PAYLOAD_VERSION,
+                         primitive['nova_object.compact'])
+        self.assertEqual(1, len(primitive['nova_object.schemas']))
+        plain = base.NovaObjectSerializer().serialize_entity(self.context,
+                                                             objs)
+        self.assertTrue(len(jsonutils.dumps(primitive)) <
+                        len(jsonutils.dumps(plain)))
+
+        # Compact entities are understood whatever the serializer sends
+        objs2 = base.NovaObjectSerializer().deserialize_entity(
+            self.context, jsonutils.loads(jsonutils.dumps(primitive)))
+        self.assertEqual(10, len(objs2))
+        for i, obj in enumerate(objs2):
+            self.assertIsInstance(obj, MyObj)
+            self.assertEqual(i, obj.foo)
+            self.assertEqual('bar%i' % i, obj.bar)
+            self.assertFalse(obj.obj_attr_is_set('missing'))
+        self.assertEqual(set(), objs2[0].obj_what_changed())
+        self.assertEqual(set(['foo', 'bar']), objs2[1].obj_what_changed())
+
+    def test_compact_primitive_nested(self):
+        obj = MyObj(foo=1, bar='bar')
+        obj.obj_reset_changes()
+        obj.missing = 'here'
+        primitive = {'objs': [obj.obj_to_primitive(),
+                              MyObj(foo=2).obj_to_primitive()],
+                     'other': {'obj': MyObj(bar='foo').obj_to_primitive(),
+                               'value': [1, 'two']}}
+        for objprim in (primitive['objs'] + [primitive['other']['obj']]):
+            objprim.get('nova_object.changes', []).sort()
+        compact = base.compact_primitive(primitive)
+        self.assertEqual(primitive, base.expand_primitive(compact))
+
+    def test_compact_schema_grows(self):
+        obj = MyObj(foo=1)
+        base.compact_primitive(obj.obj_to_primitive())
+        fields, indexes = base._compact_schemas[('MyObj', '1.5')]
+        foo_index = indexes['foo']
+        obj = MyObj(foo=1, bar='bar', missing='missing')
+        compact = base.compact_primitive(obj.obj_to_primitive())
+        self.assertEqual(foo_index, indexes['foo'])
+        self.assertIn('missing', compact['nova_object.schemas'][0][2])
+        primitive = base.expand_primitive(compact)
+        self.assertEqual(obj.obj_to_primitive()['nova_object.data'],
+                         primitive['nova_object.data'])
+        self.assertEqual(set(['foo', 'bar', 'missing']),
+                         set(primitive['nova_object.changes']))
+
+    def test_compact_payload_version_mismatch(self):
+        compact = base.compact_primitive(MyObj(foo=1).obj_to_primitive())
+        compact['nova_object.compact'] = base.COMPACT_PAYLOAD_VERSION + 1
+        self.assertRaises(exception.UnsupportedObjectError,
+                          base.NovaObjectSerializer().deserialize_entity,
+                          self.context, compact)
+
+    def test_compact_reply_to_compact_request(self):
+        ser = base.NovaObjectSerializer()
+        obj = MyObj(foo=1)
+        other_context = context.get_admin_context()
+        compact = base.compact_primitive(obj.obj_to_primitive())
+        ser.deserialize_entity(self.context, compact)
+        self.assertIn('nova_object.compact',
+                      ser.serialize_entity(self.context, obj))
+        self.assertNotIn('nova_object.compact',
+                         ser.serialize_entity(other_context, obj))
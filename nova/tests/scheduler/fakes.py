@@ -256,6 +256,20 @@ class FakeComputeAPI(object):
         pass
 
 
+def stub_out_aggregates(stubs, aggregates=None):
+    """Serve the HostManager's aggregate index from a fixed list."""
+
+    def fake_aggregate_get_all(context):
+        return list(aggregates or [])
+
+    def fake_aggregate_get_all_changed_since(context, changed_since):
+        return []
+
+    stubs.Set(db, 'aggregate_get_all', fake_aggregate_get_all)
+    stubs.Set(db, 'aggregate_get_all_changed_since',
+              fake_aggregate_get_all_changed_since)
+
+
 def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'compute_node_get_all')
 
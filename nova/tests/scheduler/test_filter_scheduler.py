@@ -29,6 +29,7 @@ from nova import context
 from nova import db
 from nova import exception
 from nova.objects import instance_group as instance_group_obj
+from nova.openstack.common import timeutils
 from nova.pci import pci_request
 from nova.scheduler import driver
 from nova.scheduler import filter_scheduler
@@ -40,11 +41,13 @@ from nova.tests.scheduler import fakes
 from nova.tests.scheduler import test_scheduler
 
 
-def fake_get_filtered_hosts(hosts, filter_properties, index):
+def fake_get_filtered_hosts(hosts, filter_properties, index,
+                            filter_cache=None, trace=None):
     return list(hosts)
 
 
-def fake_get_group_filtered_hosts(hosts, filter_properties, index):
+def fake_get_group_filtered_hosts(hosts, filter_properties, index,
+                                  filter_cache=None, trace=None):
     group_hosts = filter_properties.get('group_hosts') or []
     if group_hosts:
         hosts = list(hosts)
@@ -68,6 +71,10 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
     driver_cls = filter_scheduler.FilterScheduler
 
+    def setUp(self):
+        super(FilterSchedulerTestCase, self).setUp()
+        fakes.stub_out_aggregates(self.stubs)
+
     def test_run_instance_no_hosts(self):
 
         def _fake_empty_call_zone_method(*args, **kwargs):
@@ -182,7 +189,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, trace=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -213,6 +221,125 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         for weighed_host in weighed_hosts:
             self.assertIsNotNone(weighed_host.obj)
 
+    def _partitioned_schedule(self, local_hosts, fits):
+        self.flags(scheduler_host_partitioning=True)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        all_hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x, {})
+                     for x in xrange(1, 5)]
+
+        def _fake_get_filtered_hosts(hosts, filter_properties, index,
+                                     filter_cache=None, trace=None):
+            return [host for host in hosts if host.host in fits]
+
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, trace=None):
+            return [weights.WeighedHost(host, 1.0) for host in hosts]
+
+        self.stubs.Set(sched, '_get_all_host_states',
+                       lambda context: iter(all_hosts))
+        self.stubs.Set(sched, '_get_local_hosts',
+                       lambda context, hosts: [hosts[x] for x in local_hosts])
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                       _fake_get_filtered_hosts)
+        self.stubs.Set(weights.HostWeightHandler,
+                       'get_weighed_objects', _fake_weigh_objects)
+        self.stubs.Set(host_manager.HostState, 'consume_from_instance',
+                       lambda *args: None)
+
+        request_spec = {'num_instances': 1,
+                        'instance_type': {'memory_mb': 512},
+                        'instance_properties': {'project_id': 1,
+                                                'os_type': 'Linux'}}
+        weighed_hosts = sched._schedule(fake_context, request_spec, {})
+        return [weighed_host.obj.host for weighed_host in weighed_hosts]
+
+    def test_schedule_partitioned_prefers_local_hosts(self):
+        chosen = self._partitioned_schedule(local_hosts=[2],
+                                            fits=['host1', 'host3'])
+        self.assertEqual(['host3'], chosen)
+
+    def test_schedule_partitioned_falls_back_to_all_hosts(self):
+        chosen = self._partitioned_schedule(local_hosts=[2], fits=['host1'])
+        self.assertEqual(['host1'], chosen)
+
+    def test_schedule_partitioned_fallback_runs_all_filters(self):
+        # host1 is local and fits one instance, host2 fails a filter run
+        # once per request, so it must not get the second instance.
+        self.flags(scheduler_host_partitioning=True,
+                   ram_allocation_ratio=1.0,
+                   scheduler_default_filters=['RamFilter',
+                                              'ComputeCapabilitiesFilter'])
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        all_hosts = [
+            fakes.FakeHostState('host1', 'node1',
+                                {'free_ram_mb': 512,
+                                 'total_usable_ram_mb': 512,
+                                 'stats': {'fast': 'yes'}}),
+            fakes.FakeHostState('host2', 'node2',
+                                {'free_ram_mb': 4096,
+                                 'total_usable_ram_mb': 4096,
+                                 'stats': {}}),
+        ]
+        self.stubs.Set(sched, '_get_all_host_states',
+                       lambda context: iter(all_hosts))
+        self.stubs.Set(sched, '_get_local_hosts',
+                       lambda context, hosts: [hosts[0]])
+
+        request_spec = {'num_instances': 2,
+                        'instance_type': {'memory_mb': 512,
+                                          'extra_specs':
+                                              {'capabilities:fast': 'yes'}},
+                        'instance_properties': {'project_id': 1,
+                                                'memory_mb': 512,
+                                                'root_gb': 0,
+                                                'ephemeral_gb': 0,
+                                                'vcpus': 1,
+                                                'os_type': 'Linux'}}
+        weighed_hosts = sched._schedule(fake_context, request_spec, {})
+        self.assertEqual(['host1'],
+                         [weighed_host.obj.host
+                          for weighed_host in weighed_hosts])
+
+    def test_get_local_hosts_splits_hosts_between_schedulers(self):
+        hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x, {})
+                 for x in xrange(1, 50)]
+        local_hosts = {}
+        for scheduler in ('sched1', 'sched2'):
+            self.flags(host=scheduler)
+            sched = fakes.FakeFilterScheduler()
+            self.stubs.Set(sched, 'hosts_up',
+                           lambda context, topic: ['sched1', 'sched2'])
+            local_hosts[scheduler] = set(sched._get_local_hosts('ctxt',
+                                                                hosts))
+        self.assertTrue(local_hosts['sched1'])
+        self.assertTrue(local_hosts['sched2'])
+        self.assertFalse(local_hosts['sched1'] & local_hosts['sched2'])
+        self.assertEqual(set(hosts),
+                         local_hosts['sched1'] | local_hosts['sched2'])
+
+    def test_get_scheduler_ring_refresh(self):
+        self.flags(host='sched1', scheduler_partition_refresh_interval=60)
+        sched = fakes.FakeFilterScheduler()
+        self.mox.StubOutWithMock(sched, 'hosts_up')
+        sched.hosts_up('ctxt', 'scheduler').AndReturn([])
+        sched.hosts_up('ctxt', 'scheduler').AndReturn(['sched1', 'sched2'])
+        self.mox.ReplayAll()
+
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.assertEqual(frozenset(['sched1']),
+                         sched._get_scheduler_ring('ctxt').nodes)
+        timeutils.advance_time_seconds(30)
+        self.assertEqual(frozenset(['sched1']),
+                         sched._get_scheduler_ring('ctxt').nodes)
+        timeutils.advance_time_seconds(31)
+        self.assertEqual(frozenset(['sched1', 'sched2']),
+                         sched._get_scheduler_ring('ctxt').nodes)
+
     def test_max_attempts(self):
         self.flags(scheduler_max_attempts=4)
 
@@ -484,7 +611,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 50
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, trace=None):
             this_weight = self.next_weight
             self.next_weight = 0
             host_state = hosts[0]
@@ -525,7 +653,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         selected_hosts = []
         selected_nodes = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, trace=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
@@ -0,0 +1,54 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the scheduler hash ring.
+"""
+
+from nova.scheduler import hash_ring
+from nova import test
+
+
+class HashRingTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(HashRingTestCase, self).setUp()
+        self.keys = ['host%s:node%s' % (x, x) for x in xrange(1000)]
+
+    def _owners(self, ring):
+        return dict((key, ring.get_node(key)) for key in self.keys)
+
+    def test_empty_ring(self):
+        self.assertIsNone(hash_ring.HashRing([]).get_node('host1'))
+
+    def test_keys_are_spread_over_nodes(self):
+        ring = hash_ring.HashRing(['a', 'b', 'c'])
+        owners = self._owners(ring).values()
+        for node in ('a', 'b', 'c'):
+            self.assertTrue(200 < owners.count(node) < 450)
+
+    def test_same_nodes_same_owners(self):
+        self.assertEqual(self._owners(hash_ring.HashRing(['a', 'b'])),
+                         self._owners(hash_ring.HashRing(['b', 'a'])))
+
+    def test_adding_node_only_moves_keys_to_it(self):
+        before = self._owners(hash_ring.HashRing(['a', 'b', 'c']))
+        after = self._owners(hash_ring.HashRing(['a', 'b', 'c', 'd']))
+        moved = [key for key in self.keys if before[key] != after[key]]
+        self.assertTrue(moved)
+        for key in moved:
+            self.assertEqual('d', after[key])
+
+    def test_unicode_keys(self):
+        ring = hash_ring.HashRing([u'a', 'b'])
+        self.assertEqual(ring.get_node('host1'), ring.get_node(u'host1'))
@@ -19,6 +19,7 @@ import httplib
 
 from oslo.config import cfg
 import stubout
+import testtools
 
 from nova import context
 from nova import db
@@ -26,9 +27,14 @@ from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova.pci import pci_stats
 from nova.scheduler import filters
+from nova.scheduler.filters import core_filter
+from nova.scheduler.filters import disk_filter
 from nova.scheduler.filters import extra_specs_ops
+from nova.scheduler.filters import io_ops_filter
+from nova.scheduler.filters import num_instances_filter
 from nova.scheduler.filters import ram_filter
 from nova.scheduler.filters import trusted_filter
+from nova.scheduler import host_columns
 from nova import servicegroup
 from nova import test
 from nova.tests.scheduler import fakes
@@ -1831,3 +1837,161 @@ class HostFiltersTestCase(test.NoDBTestCase):
                                    attribute_dict={'metrics': metrics})
         filt_cls = self.class_map['MetricsFilter']()
         self.assertFalse(filt_cls.host_passes(host, None))
+
+
+class HostFilterResultCacheTestCase(test.NoDBTestCase):
+    """Test case for remembering filter results within a request."""
+
+    def setUp(self):
+        super(HostFilterResultCacheTestCase, self).setUp()
+        self.filter_handler = filters.HostFilterHandler()
+        self.filter_cache = filters.HostFilterResultCache()
+        self.hosts = [fakes.FakeHostState('host%s' % x, 'node',
+                                          {'free_ram_mb': 1024,
+                                           'total_usable_ram_mb': 1024})
+                      for x in xrange(3)]
+        self.calls = []
+        test_case = self
+
+        class FakeRamFilter(filters.BaseHostFilter):
+            cache_fields = ('free_ram_mb',)
+
+            def host_passes(self, host_state, filter_properties):
+                test_case.calls.append(host_state.host)
+                return host_state.free_ram_mb >= 512
+
+        class FakeServiceFilter(FakeRamFilter):
+            cache_fields = ('service',)
+
+        class FakeUncachedFilter(FakeRamFilter):
+            cache_fields = None
+
+        self.ram_filter = FakeRamFilter
+        self.service_filter = FakeServiceFilter
+        self.uncached_filter = FakeUncachedFilter
+
+    def _filter(self, filter_cls, index):
+        return self.filter_handler.get_filtered_objects([filter_cls],
+                self.hosts, {}, index, filter_cache=self.filter_cache)
+
+    def test_consumed_host_is_filtered_again(self):
+        self.assertEqual(self.hosts, self._filter(self.ram_filter, 0))
+        self.assertEqual(['host0', 'host1', 'host2'], self.calls)
+
+        self.hosts[1].consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                                 memory_mb=768, vcpus=1))
+        self.calls = []
+        self.assertEqual([self.hosts[0], self.hosts[2]],
+                         self._filter(self.ram_filter, 1))
+        self.assertEqual(['host1'], self.calls)
+
+        self.calls = []
+        self._filter(self.ram_filter, 2)
+        self.assertEqual([], self.calls)
+
+    def test_unrelated_consumption_is_ignored(self):
+        self._filter(self.service_filter, 0)
+        self.hosts[1].consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                                 memory_mb=768, vcpus=1))
+        self.calls = []
+        self.assertEqual(self.hosts, self._filter(self.service_filter, 1))
+        self.assertEqual([], self.calls)
+
+    def test_uncached_filter(self):
+        self._filter(self.uncached_filter, 0)
+        self.calls = []
+        self._filter(self.uncached_filter, 1)
+        self.assertEqual(['host0', 'host1', 'host2'], self.calls)
+
+    def test_filter_all_override_is_not_cached(self):
+        class FakeFilterAll(self.ram_filter):
+            def filter_all(self, filter_obj_list, filter_properties):
+                return filter_obj_list[:1]
+
+        self.assertEqual(self.hosts[:1], self._filter(FakeFilterAll, 0))
+        self.assertEqual(self.hosts[:1], self._filter(FakeFilterAll, 1))
+
+
+@testtools.skipIf(not host_columns.is_available(), "NumPy not available")
+class VectorizedHostFiltersTestCase(test.NoDBTestCase):
+    """Test case for the vectorized evaluation of host filters."""
+
+    def setUp(self):
+        super(VectorizedHostFiltersTestCase, self).setUp()
+        self.flags(scheduler_use_vectorized_filters=True)
+        self.stubs.Set(ram_filter.RamFilter, 'ram_allocation_ratio', 1.5)
+        self.filter_handler = filters.HostFilterHandler()
+        self.filter_properties = {'instance_type': {'memory_mb': 1024,
+                                                    'vcpus': 2,
+                                                    'root_gb': 10,
+                                                    'ephemeral_gb': 0,
+                                                    'swap': 0}}
+        self.filter_classes = [ram_filter.RamFilter,
+                               core_filter.CoreFilter,
+                               disk_filter.DiskFilter,
+                               num_instances_filter.NumInstancesFilter,
+                               io_ops_filter.IoOpsFilter]
+
+    def _make_hosts(self):
+        hosts = []
+        for x, free_ram_mb in enumerate([-512, 0, 512, 1024, 4096]):
+            for y, vcpus_used in enumerate([0, 31, 32]):
+                attributes = {'free_ram_mb': free_ram_mb,
+                              'total_usable_ram_mb': 2048,
+                              'vcpus_total': 2 if x else 0,
+                              'vcpus_used': vcpus_used,
+                              'free_disk_mb': 10 * 1024 * y,
+                              'total_usable_disk_gb': 20,
+                              'num_instances': 48 + x,
+                              'num_io_ops': 6 + y}
+                hosts.append(fakes.FakeHostState('host%s-%s' % (x, y),
+                                                 'node', attributes))
+        return hosts
+
+    def test_same_hosts_as_per_host_filters(self):
+        for filter_cls in self.filter_classes:
+            hosts = self._make_hosts()
+            filter = filter_cls()
+            expected = [host.host for host in hosts
+                        if filter.host_passes(host, self.filter_properties)]
+            expected_limits = [host.limits for host in hosts
+                               if host.host in expected]
+
+            hosts = self._make_hosts()
+            result = self.filter_handler.get_filtered_objects([filter_cls],
+                    hosts, self.filter_properties)
+            self.assertEqual(expected, [host.host for host in result])
+            self.assertEqual(expected_limits,
+                             [host.limits for host in result])
+
+    def test_remaining_filters_see_passing_hosts(self):
+        seen = []
+
+        class FakeFilter(filters.BaseHostFilter):
+            def host_passes(self, host_state, filter_properties):
+                seen.append(host_state.host)
+                return host_state.host != 'host4-0'
+
+        result = self.filter_handler.get_filtered_objects(
+                [FakeFilter, num_instances_filter.NumInstancesFilter],
+                self._make_hosts(), self.filter_properties)
+        self.assertEqual(['host0-0', 'host0-1', 'host0-2',
+                          'host1-0', 'host1-1', 'host1-2'], seen)
+        self.assertEqual(seen, [host.host for host in result])
+
+    def test_fallback_to_host_passes(self):
+        self.filter_properties['instance_type'] = None
+        result = self.filter_handler.get_filtered_objects(
+                [core_filter.CoreFilter], self._make_hosts(),
+                self.filter_properties)
+        self.assertEqual(15, len(result))
+
+    def test_disabled(self):
+        self.flags(scheduler_use_vectorized_filters=False)
+        self.mox.StubOutWithMock(num_instances_filter.NumInstancesFilter,
+                                 'hosts_pass_vectorized')
+        self.mox.ReplayAll()
+        result = self.filter_handler.get_filtered_objects(
+                [num_instances_filter.NumInstancesFilter], self._make_hosts(),
+                self.filter_properties)
+        self.assertEqual(6, len(result))
@@ -15,6 +15,10 @@
 """
 Tests For HostManager
 """
+import datetime
+
+import mox
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -23,6 +27,7 @@ from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova.scheduler import filters
 from nova.scheduler import host_manager
+from nova.scheduler import utils as scheduler_utils
 from nova import test
 from nova.tests.scheduler import fakes
 from nova import utils
@@ -43,6 +48,7 @@ class HostManagerTestCase(test.NoDBTestCase):
 
     def setUp(self):
         super(HostManagerTestCase, self).setUp()
+        fakes.stub_out_aggregates(self.stubs)
         self.host_manager = host_manager.HostManager()
         self.fake_hosts = [host_manager.HostState('fake_host%s' % x,
                 'fake-node') for x in xrange(1, 5)]
@@ -320,6 +326,7 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
 
     def setUp(self):
         super(HostManagerChangedNodesTestCase, self).setUp()
+        fakes.stub_out_aggregates(self.stubs)
         self.host_manager = host_manager.HostManager()
         self.fake_hosts = [
               host_manager.HostState('host1', 'node1'),
@@ -373,6 +380,236 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerIncrementalTestCase(test.NoDBTestCase):
+    """Test case for the incremental host state refresh."""
+
+    def setUp(self):
+        super(HostManagerIncrementalTestCase, self).setUp()
+        self.flags(scheduler_incremental_host_states=True)
+        fakes.stub_out_aggregates(self.stubs)
+        self.host_manager = host_manager.HostManager()
+        self.start = datetime.datetime(2014, 1, 1, 12, 0, 0)
+        timeutils.set_time_override(self.start)
+        self.addCleanup(timeutils.clear_time_override)
+        self.services = [dict(id=x, host='host%s' % x, disabled=False)
+                         for x in xrange(1, 4)]
+        self.nodes = [self._fake_node(x) for x in xrange(1, 4)]
+
+    def _fake_node(self, x, free_ram_mb=1024, updated_at=None, deleted=0):
+        return dict(id=x, local_gb=1024, memory_mb=2048, vcpus=2,
+                    disk_available_least=None, free_ram_mb=free_ram_mb,
+                    vcpus_used=0, free_disk_gb=1024, local_gb_used=0,
+                    created_at=self.start, updated_at=updated_at,
+                    deleted_at=None, deleted=deleted,
+                    service=self.services[x - 1], service_id=x,
+                    hypervisor_hostname='node%s' % x, host_ip='127.0.0.1',
+                    hypervisor_version=0)
+
+    def test_first_call_does_full_sync(self):
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        db.compute_node_get_all('ctxt').AndReturn(self.nodes)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states('ctxt')
+        self.assertEqual(3, len(self.host_manager.host_state_map))
+
+    def test_only_changed_nodes_are_updated(self):
+        updated_at = self.start + datetime.timedelta(seconds=30)
+        changed = self._fake_node(2, free_ram_mb=256, updated_at=updated_at)
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all('ctxt').AndReturn(self.nodes)
+        db.compute_node_get_all_changed_since('ctxt',
+                self.start - host_manager._CHANGED_SINCE_MARGIN).AndReturn(
+                        [changed])
+        db.service_get_all('ctxt').AndReturn(self.services)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states('ctxt')
+        # Resources consumed locally survive an incremental refresh for
+        # compute nodes that did not report new data.
+        host1 = self.host_manager.host_state_map[('host1', 'node1')]
+        host1.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                         memory_mb=512, vcpus=1))
+        timeutils.advance_time_seconds(60)
+        self.host_manager.get_all_host_states('ctxt')
+
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(3, len(host_states_map))
+        self.assertEqual(512, host_states_map[('host1', 'node1')].free_ram_mb)
+        self.assertEqual(256, host_states_map[('host2', 'node2')].free_ram_mb)
+        self.assertEqual(1024,
+                         host_states_map[('host3', 'node3')].free_ram_mb)
+        self.assertEqual(updated_at, self.host_manager._last_changed_at)
+
+    def test_deleted_nodes_and_services_are_removed(self):
+        deleted = self._fake_node(2, deleted=2)
+        deleted['deleted_at'] = self.start + datetime.timedelta(seconds=30)
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all('ctxt').AndReturn(self.nodes)
+        db.compute_node_get_all_changed_since('ctxt',
+                mox.IgnoreArg()).AndReturn([deleted])
+        # The service of host3 went away as well
+        db.service_get_all('ctxt').AndReturn(self.services[:2])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states('ctxt')
+        self.host_manager.get_all_host_states('ctxt')
+        self.assertEqual([('host1', 'node1')],
+                         self.host_manager.host_state_map.keys())
+
+    def test_unchanged_services_not_refreshed(self):
+        for service in self.services:
+            service['updated_at'] = self.start
+        heartbeat = dict(
+            self.services[1],
+            updated_at=self.start + datetime.timedelta(seconds=10))
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all('ctxt').AndReturn(self.nodes)
+        db.service_get_all('ctxt').AndReturn(
+            [self.services[0], heartbeat, self.services[2]])
+        db.compute_node_get_all_changed_since('ctxt',
+                mox.IgnoreArg()).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states('ctxt')
+        refreshed = []
+
+        def fake_update_capabilities(host_state, capabilities=None,
+                                     service=None):
+            refreshed.append(service)
+
+        self.stubs.Set(host_manager.HostState, 'update_capabilities',
+                       fake_update_capabilities)
+        self.host_manager.get_all_host_states('ctxt')
+        self.assertEqual([heartbeat], refreshed)
+
+    def test_row_older_than_consumption_applied(self):
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all('ctxt').AndReturn(self.nodes)
+        self.mox.ReplayAll()
+        self.host_manager.get_all_host_states('ctxt')
+
+        # The compute node reports new data written before the scheduler
+        # consumed from it, the row still replaces the local view.
+        host1 = self.host_manager.host_state_map[('host1', 'node1')]
+        written_at = timeutils.utcnow() + datetime.timedelta(seconds=5)
+        timeutils.advance_time_seconds(10)
+        host1.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                         memory_mb=512, vcpus=1))
+        host1.update_from_compute_node(
+            self._fake_node(1, free_ram_mb=768, updated_at=written_at))
+        self.assertEqual(768, host1.free_ram_mb)
+
+        # The same row again does not undo later consumption.
+        host1.consume_from_instance(dict(root_gb=0, ephemeral_gb=0,
+                                         memory_mb=256, vcpus=1))
+        host1.update_from_compute_node(
+            self._fake_node(1, free_ram_mb=768, updated_at=written_at))
+        self.assertEqual(512, host1.free_ram_mb)
+
+    def test_full_sync_after_interval(self):
+        self.flags(scheduler_host_states_full_sync_interval=60)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        db.compute_node_get_all('ctxt').AndReturn(self.nodes)
+        db.compute_node_get_all('ctxt').AndReturn(self.nodes[:1])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states('ctxt')
+        timeutils.advance_time_seconds(61)
+        self.host_manager.get_all_host_states('ctxt')
+        self.assertEqual(1, len(self.host_manager.host_state_map))
+
+
+class HostManagerAggregatesTestCase(test.NoDBTestCase):
+    """Test case for the HostManager's in-memory aggregate index."""
+
+    def setUp(self):
+        super(HostManagerAggregatesTestCase, self).setUp()
+        self.host_manager = host_manager.HostManager()
+        self.start = datetime.datetime(2014, 1, 1, 12, 0, 0)
+        timeutils.set_time_override(self.start)
+        self.addCleanup(timeutils.clear_time_override)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_get_all_changed_since')
+
+    def _fake_aggregate(self, id, hosts, metadetails, deleted=0):
+        return dict(id=id, name='agg%s' % id, hosts=hosts,
+                    metadetails=metadetails, deleted=deleted)
+
+    def _host_metadata(self, host, node, key=None):
+        host_state = self.host_manager.host_state_map[(host, node)]
+        return scheduler_utils.aggregate_metadata_get_by_host(
+                {}, host_state, key=key)
+
+    def test_host_states_get_their_aggregates(self):
+        db.aggregate_get_all('ctxt').AndReturn([
+                self._fake_aggregate(1, ['host1', 'host2'], {'k1': 'v1'}),
+                self._fake_aggregate(2, ['host1'], {'k1': 'v2',
+                                                    'k2': 'v3'})])
+        db.compute_node_get_all('ctxt').AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states('ctxt')
+        self.assertEqual({'k1': set(['v1', 'v2']), 'k2': set(['v3'])},
+                         self._host_metadata('host1', 'node1'))
+        self.assertEqual({'k1': set(['v1', 'v2'])},
+                         self._host_metadata('host1', 'node1', key='k1'))
+        self.assertEqual({'k1': set(['v1'])},
+                         self._host_metadata('host2', 'node2'))
+        self.assertEqual({}, self._host_metadata('host3', 'node3'))
+
+    def test_changed_aggregates_are_reindexed(self):
+        db.aggregate_get_all('ctxt').AndReturn([
+                self._fake_aggregate(1, ['host1'], {'k1': 'v1'}),
+                self._fake_aggregate(2, ['host2'], {'k2': 'v2'})])
+        db.compute_node_get_all('ctxt').AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all_changed_since('ctxt',
+                self.start - host_manager._CHANGED_SINCE_MARGIN).AndReturn([
+                    self._fake_aggregate(1, ['host3'], {'k1': 'v4'}),
+                    self._fake_aggregate(2, [], {}, deleted=2)])
+        db.compute_node_get_all('ctxt').AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states('ctxt')
+        timeutils.advance_time_seconds(30)
+        self.host_manager.get_all_host_states('ctxt')
+
+        self.assertEqual({}, self._host_metadata('host1', 'node1'))
+        self.assertEqual({}, self._host_metadata('host2', 'node2'))
+        self.assertEqual({'k1': set(['v4'])},
+                         self._host_metadata('host3', 'node3'))
+        self.assertEqual([1], self.host_manager.aggs_by_id.keys())
+
+    def test_full_reload_after_interval(self):
+        self.flags(scheduler_host_states_full_sync_interval=60)
+        db.aggregate_get_all('ctxt').AndReturn([
+                self._fake_aggregate(1, ['host1'], {'k1': 'v1'})])
+        db.compute_node_get_all('ctxt').AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_get_all('ctxt').AndReturn([])
+        db.compute_node_get_all('ctxt').AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states('ctxt')
+        timeutils.advance_time_seconds(61)
+        self.host_manager.get_all_host_states('ctxt')
+        self.assertEqual({}, self._host_metadata('host1', 'node1'))
+        self.assertEqual({}, self.host_manager.aggs_by_id)
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
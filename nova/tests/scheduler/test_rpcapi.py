@@ -38,6 +38,7 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
         expected_version = kwargs.pop('version', None)
         expected_fanout = kwargs.pop('fanout', None)
         expected_kwargs = kwargs.copy()
+        expected_server = expected_kwargs.pop('host', None)
 
         self.mox.StubOutWithMock(rpcapi, 'client')
 
@@ -49,6 +50,8 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
             prepare_kwargs['fanout'] = True
         if expected_version:
             prepare_kwargs['version'] = expected_version
+        if expected_server:
+            prepare_kwargs['server'] = expected_server
         rpcapi.client.prepare(**prepare_kwargs).AndReturn(rpcapi.client)
 
         rpc_method = getattr(rpcapi.client, rpc_method)
@@ -82,3 +85,35 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
         self._test_scheduler_api('select_destinations', rpc_method='call',
                 request_spec='fake_request_spec',
                 filter_properties='fake_prop')
+
+    def test_get_scheduling_traces(self):
+        self._test_scheduler_api('get_scheduling_traces', rpc_method='call',
+                host='fake_host', limit=10, no_valid_host=True,
+                version='3.1')
+
+    def test_get_scheduling_stats(self):
+        self._test_scheduler_api('get_scheduling_stats', rpc_method='call',
+                host='fake_host', version='3.1')
+
+    def test_select_destinations_compact(self):
+        self.flags(compact_object_payloads=True)
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        rpcapi = scheduler_rpcapi.SchedulerAPI()
+        self.mox.StubOutWithMock(rpcapi, '_compact_client')
+        cctxt = rpcapi._compact_client
+        cctxt.prepare(version='3.2').AndReturn(cctxt)
+        cctxt.call(ctxt, 'select_destinations',
+                   request_spec='fake_request_spec',
+                   filter_properties='fake_prop').AndReturn('foo')
+        self.mox.ReplayAll()
+        self.assertEqual('foo', rpcapi.select_destinations(
+            ctxt, request_spec='fake_request_spec',
+            filter_properties='fake_prop'))
+
+    def test_select_destinations_compact_not_supported(self):
+        self.flags(compact_object_payloads=True)
+        self.flags(scheduler='3.1', group='upgrade_levels')
+        rpcapi = scheduler_rpcapi.SchedulerAPI()
+        self.mox.StubOutWithMock(rpcapi, '_compact_client')
+        self.mox.ReplayAll()
+        self.assertEqual('3.0', rpcapi._prepare().target.version)
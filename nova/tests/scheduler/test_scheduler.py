@@ -72,6 +72,20 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
         manager = self.manager
         self.assertIsInstance(manager.driver, self.driver_cls)
 
+    def test_get_scheduling_traces(self):
+        self.mox.StubOutWithMock(self.manager.driver.tracer, 'get_traces')
+        self.manager.driver.tracer.get_traces(limit=5,
+                no_valid_host=True).AndReturn(['fake_trace'])
+        self.mox.ReplayAll()
+        self.assertEqual(['fake_trace'],
+                self.manager.get_scheduling_traces(self.context, limit=5,
+                                                   no_valid_host=True))
+
+    def test_get_scheduling_stats(self):
+        stats = self.manager.get_scheduling_stats(self.context)
+        self.assertEqual(0, stats['requests'])
+        self.assertEqual({}, stats['filters'])
+
     def test_show_host_resources(self):
         host = 'fake_host'
 
@@ -582,3 +596,15 @@ class SchedulerV3PassthroughTestCase(test.TestCase):
                 ) as prep_resize:
             self.proxy.prep_resize(None, None, None, None, None, None, None)
             prep_resize.assert_called_once()
+
+    def test_get_scheduling_traces(self):
+        with mock.patch.object(self.manager, 'get_scheduling_traces'
+                ) as get_scheduling_traces:
+            self.proxy.get_scheduling_traces(None, None, None)
+            get_scheduling_traces.assert_called_once()
+
+    def test_get_scheduling_stats(self):
+        with mock.patch.object(self.manager, 'get_scheduling_stats'
+                ) as get_scheduling_stats:
+            self.proxy.get_scheduling_stats(None)
+            get_scheduling_stats.assert_called_once()
@@ -218,3 +218,27 @@ class SchedulerUtilsTestCase(test.NoDBTestCase):
                                   '=',
                                   float,
                                   [('bar', -2.1)])
+
+    def test_aggregate_metadata_get_by_host_not_indexed(self):
+        host_state = mock.Mock(host='host1', aggregates=None)
+        context = mock.Mock()
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        db.aggregate_metadata_get_by_host(context.elevated.return_value,
+                'host1', key='k1').AndReturn({'k1': set(['v1'])})
+        self.mox.ReplayAll()
+        self.assertEqual({'k1': set(['v1'])},
+                scheduler_utils.aggregate_metadata_get_by_host(
+                    {'context': context}, host_state, key='k1'))
+
+    def test_aggregate_metadata_get_by_host_indexed(self):
+        host_state = mock.Mock(host='host1', aggregates=[
+                {'metadetails': {'k1': 'v1', 'k2': 'v2'}},
+                {'metadetails': {'k1': 'v3'}}])
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.ReplayAll()
+        self.assertEqual({'k1': set(['v1', 'v3']), 'k2': set(['v2'])},
+                scheduler_utils.aggregate_metadata_get_by_host(
+                    {}, host_state))
+        self.assertEqual({'k2': set(['v2'])},
+                scheduler_utils.aggregate_metadata_get_by_host(
+                    {}, host_state, key='k2'))
@@ -0,0 +1,141 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For scheduler request tracing.
+"""
+
+from nova import context
+from nova.scheduler import filters
+from nova.scheduler.filters import ram_filter
+from nova.scheduler import host_columns
+from nova.scheduler import tracing
+from nova.scheduler import weights
+from nova import test
+from nova.tests.scheduler import fakes
+
+
+class SchedulerTracerTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(SchedulerTracerTestCase, self).setUp()
+        self.context = context.RequestContext('fake_user', 'fake_project')
+
+    def _trace(self, tracer, hosts, num_instances=1):
+        trace = tracer.start_trace(self.context, num_instances=num_instances)
+        trace.add_step('filter', 'RamFilter', 0.5, 4, len(hosts))
+        trace.add_step('weigher', 'RAMWeigher', 0.25, len(hosts), len(hosts))
+        tracer.finish_trace(trace, hosts)
+        return trace
+
+    def test_tracing_disabled(self):
+        self.flags(scheduler_tracing=False)
+        self.assertIsNone(tracing.SchedulerTracer().start_trace(self.context))
+
+    def test_get_traces(self):
+        tracer = tracing.SchedulerTracer()
+        self._trace(tracer, ['host1'])
+        self._trace(tracer, ['host2'])
+        traces = tracer.get_traces()
+        self.assertEqual([['host2'], ['host1']],
+                         [trace['hosts'] for trace in traces])
+        self.assertEqual(self.context.request_id, traces[0]['request_id'])
+        self.assertEqual({'kind': 'filter', 'name': 'RamFilter',
+                          'elapsed': 0.5, 'hosts_in': 4, 'hosts_out': 1,
+                          'cache_hits': 0}, traces[0]['steps'][0])
+        self.assertEqual(1, len(tracer.get_traces(limit=1)))
+
+    def test_buffer_size(self):
+        self.flags(scheduler_trace_buffer_size=2)
+        tracer = tracing.SchedulerTracer()
+        for x in xrange(3):
+            self._trace(tracer, ['host%s' % x])
+        self.assertEqual([['host2'], ['host1']],
+                         [trace['hosts'] for trace in tracer.get_traces()])
+
+    def test_no_valid_host(self):
+        tracer = tracing.SchedulerTracer()
+        self._trace(tracer, ['host1'])
+        self._trace(tracer, [])
+        self._trace(tracer, ['host1'], num_instances=2)
+        traces = tracer.get_traces(no_valid_host=True)
+        self.assertEqual(2, len(traces))
+        self.assertEqual(None, traces[0]['stopped_by'])
+        self.assertEqual('RamFilter', traces[1]['stopped_by'])
+        self.assertEqual(2, tracer.get_stats()['no_valid_host'])
+
+    def test_get_stats(self):
+        tracer = tracing.SchedulerTracer()
+        self._trace(tracer, ['host1'])
+        self._trace(tracer, ['host1', 'host2'])
+        stats = tracer.get_stats()
+        self.assertEqual(2, stats['requests'])
+        self.assertEqual({'calls': 2, 'elapsed': 1.0, 'hosts_in': 8,
+                          'hosts_out': 3, 'cache_hits': 0},
+                         stats['filters']['RamFilter'])
+        self.assertEqual({'calls': 2, 'elapsed': 0.5, 'hosts_in': 3,
+                          'hosts_out': 3, 'cache_hits': 0},
+                         stats['weighers']['RAMWeigher'])
+
+
+class HandlerTracingTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(HandlerTracingTestCase, self).setUp()
+        self.stubs.Set(ram_filter.RamFilter, 'ram_allocation_ratio', 1.0)
+        self.hosts = [fakes.FakeHostState('host%s' % x, 'node%s' % x,
+                                          {'free_ram_mb': 1024 * x,
+                                           'total_usable_ram_mb': 4096})
+                      for x in xrange(1, 5)]
+        self.trace = tracing.RequestTrace('req-id', None, 1)
+        self.filter_properties = {'instance_type': {'memory_mb': 2048}}
+
+    def _filter(self, filter_cache=None):
+        handler = filters.HostFilterHandler()
+        filter_classes = handler.get_matching_classes(
+                ['nova.scheduler.filters.all_hosts_filter.AllHostsFilter',
+                 'nova.scheduler.filters.ram_filter.RamFilter'])
+        return handler.get_filtered_objects(filter_classes, self.hosts,
+                self.filter_properties, filter_cache=filter_cache,
+                trace=self.trace)
+
+    def test_filters_are_traced(self):
+        self.assertEqual(3, len(self._filter()))
+        self.assertEqual([('filter', 'AllHostsFilter', 4, 4, 0),
+                          ('filter', 'RamFilter', 4, 3, 0)],
+                         [(kind, name, hosts_in, hosts_out, hits)
+                          for kind, name, elapsed, hosts_in, hosts_out, hits
+                          in self.trace.steps])
+
+    def test_filter_cache_hits_are_traced(self):
+        filter_cache = filters.HostFilterResultCache()
+        self._filter(filter_cache)
+        self._filter(filter_cache)
+        self.assertEqual(4, self.trace.steps[-1][5])
+
+    def test_vectorized_filters_are_traced(self):
+        if not host_columns.is_available():
+            self.skipTest('NumPy is not available')
+        self.flags(scheduler_use_vectorized_filters=True)
+        self._filter()
+        self.assertEqual(('filter', 'RamFilter', 4, 3),
+                         (self.trace.steps[0][0], self.trace.steps[0][1],
+                          self.trace.steps[0][3], self.trace.steps[0][4]))
+
+    def test_weighers_are_traced(self):
+        handler = weights.HostWeightHandler()
+        weigher_classes = handler.get_matching_classes(
+                ['nova.scheduler.weights.ram.RAMWeigher'])
+        handler.get_weighed_objects(weigher_classes, self.hosts, {},
+                                    trace=self.trace)
+        self.assertEqual(1, len(self.trace.steps))
+        self.assertEqual(('weigher', 'RAMWeigher'), self.trace.steps[0][:2])
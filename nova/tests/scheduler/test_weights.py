@@ -16,9 +16,12 @@
 Tests For Scheduler weights.
 """
 
+import testtools
+
 from nova import context
 from nova import exception
 from nova.openstack.common.fixture import mockpatch
+from nova.scheduler import host_columns
 from nova.scheduler import weights
 from nova import test
 from nova.tests import matchers
@@ -44,6 +47,7 @@ class TestWeighedHost(test.NoDBTestCase):
 class RamWeigherTestCase(test.NoDBTestCase):
     def setUp(self):
         super(RamWeigherTestCase, self).setUp()
+        fakes.stub_out_aggregates(self.stubs)
         self.useFixture(mockpatch.Patch(
             'nova.db.compute_node_get_all',
              return_value=fakes.COMPUTE_NODES))
@@ -102,6 +106,13 @@ class RamWeigherTestCase(test.NoDBTestCase):
         self.assertEqual(weighed_host.weight, 1.0 * 2)
         self.assertEqual(weighed_host.obj.host, 'host4')
 
+    def test_limit(self):
+        hostinfo_list = self._get_all_hosts()
+        weighed_hosts = self.weight_handler.get_weighed_objects(
+                self.weight_classes, hostinfo_list, {}, limit=2)
+        self.assertEqual(['host4', 'host3'],
+                         [weighed.obj.host for weighed in weighed_hosts])
+
     def test_ram_filter_negative(self):
         self.flags(ram_weight_multiplier=1.0)
         hostinfo_list = self._get_all_hosts()
@@ -132,6 +143,7 @@ class RamWeigherTestCase(test.NoDBTestCase):
 class MetricsWeigherTestCase(test.NoDBTestCase):
     def setUp(self):
         super(MetricsWeigherTestCase, self).setUp()
+        fakes.stub_out_aggregates(self.stubs)
         self.useFixture(mockpatch.Patch(
             'nova.db.compute_node_get_all',
              return_value=fakes.COMPUTE_NODES_METRICS))
@@ -246,3 +258,29 @@ class MetricsWeigherTestCase(test.NoDBTestCase):
         self.flags(required=False, group='metrics')
         setting = ['foo=0.0001', 'zot=-1']
         self._do_test(setting, 1.0, 'host5')
+
+
+@testtools.skipIf(not host_columns.is_available(), "NumPy not available")
+class VectorizedRamWeigherTestCase(RamWeigherTestCase):
+    def setUp(self):
+        super(VectorizedRamWeigherTestCase, self).setUp()
+        self.flags(scheduler_use_vectorized_weighers=True)
+
+
+@testtools.skipIf(not host_columns.is_available(), "NumPy not available")
+class VectorizedMetricsWeigherTestCase(MetricsWeigherTestCase):
+    def setUp(self):
+        super(VectorizedMetricsWeigherTestCase, self).setUp()
+        self.flags(scheduler_use_vectorized_weighers=True)
+
+
+@testtools.skipIf(not host_columns.is_available(), "NumPy not available")
+class BestRowsTestCase(test.NoDBTestCase):
+    def test_best_rows(self):
+        values = host_columns.np.array([3.0, 1.0, 5.0, 3.0, 0.0, 4.0])
+        self.assertEqual([2, 5, 0, 3, 1, 4],
+                         list(host_columns.best_rows(values)))
+        self.assertEqual([2, 5, 0],
+                         list(host_columns.best_rows(values, limit=3)))
+        self.assertEqual([2, 5, 0, 3, 1, 4],
+                         list(host_columns.best_rows(values, limit=10)))
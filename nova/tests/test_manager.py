@@ -0,0 +1,153 @@
+# Copyright 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Unit Tests for the periodic task runner of nova.manager.Manager
+"""
+
+import datetime
+
+import eventlet
+import mock
+
+from nova import manager
+from nova.openstack.common import periodic_task
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class FakeManager(manager.Manager):
+    def __init__(self):
+        super(FakeManager, self).__init__(host='fake-host')
+        self.runs = []
+        self.slow_event = eventlet.event.Event()
+
+    @periodic_task.periodic_task
+    def _slow(self, context):
+        self.runs.append('slow')
+        self.slow_event.wait()
+
+    @periodic_task.periodic_task
+    def _fast(self, context):
+        self.runs.append('fast')
+
+    @periodic_task.periodic_task(spacing=60, run_immediately=True)
+    def _spaced(self, context):
+        self.runs.append('spaced')
+
+    @periodic_task.periodic_task
+    def _failing(self, context):
+        raise test.TestingException()
+
+
+class ManagerPeriodicTasksTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ManagerPeriodicTasksTestCase, self).setUp()
+        self.useFixture(test.TimeOverride())
+        self.manager = FakeManager()
+        # The last runs are kept by the class, start from a clean slate.
+        self.manager._periodic_last_run['_spaced'] = None
+        self.manager.slow_event.send()
+
+    def test_serial_runs_every_task(self):
+        idle_for = self.manager.periodic_tasks(None)
+        self.assertEqual(60, idle_for)
+        self.assertEqual(['fast', 'slow', 'spaced'],
+                         sorted(self.manager.runs))
+        stats = self.manager.get_periodic_task_stats()
+        self.assertEqual(1, stats['_fast']['runs'])
+        self.assertEqual(0, stats['_fast']['failures'])
+        self.assertEqual(1, stats['_failing']['failures'])
+
+    def test_spaced_task_not_due(self):
+        self.manager.periodic_tasks(None)
+        self.manager.runs = []
+        timeutils.advance_time_seconds(30)
+        idle_for = self.manager.periodic_tasks(None)
+        self.assertNotIn('spaced', self.manager.runs)
+        self.assertEqual(30, idle_for)
+
+    def test_raise_on_error(self):
+        self.assertRaises(test.TestingException,
+                          self.manager.periodic_tasks, None,
+                          raise_on_error=True)
+        self.assertEqual(1, self.manager.get_periodic_task_stats()
+                         ['_failing']['failures'])
+
+    def test_concurrent_skips_running_task(self):
+        self.flags(periodic_task_workers=4)
+        self.manager = FakeManager()
+        self.manager._periodic_last_run['_spaced'] = None
+
+        self.manager.periodic_tasks(None)
+        eventlet.sleep(0)
+        self.assertEqual(set(['slow', 'fast', 'spaced']),
+                         set(self.manager.runs))
+        self.assertEqual(set(['_slow']), self.manager._periodic_running)
+
+        # The slow task is still running, the others run again.
+        self.manager.runs = []
+        self.manager.periodic_tasks(None)
+        eventlet.sleep(0)
+        self.assertEqual(['fast'], self.manager.runs)
+
+        self.manager.slow_event.send()
+        self.manager._periodic_pool.waitall()
+        self.assertEqual(set(), self.manager._periodic_running)
+        self.assertEqual(1, self.manager.get_periodic_task_stats()
+                         ['_slow']['runs'])
+
+    def test_budget_overrun(self):
+        self.flags(periodic_task_budget=10)
+        with mock.patch.object(manager, 'time') as mock_time:
+            mock_time.time.side_effect = [100, 111]
+            self.manager._run_periodic_task(None, '_fast',
+                                            FakeManager._fast)
+        stats = self.manager.get_periodic_task_stats()['_fast']
+        self.assertEqual(1, stats['overruns'])
+        self.assertEqual(11, stats['last_time'])
+        self.assertEqual(11, stats['max_time'])
+
+    def test_jitter_delays_next_run(self):
+        self.flags(periodic_task_jitter=20)
+        now = timeutils.utcnow()
+        with mock.patch.object(manager.random, 'uniform',
+                               return_value=15) as mock_uniform:
+            self.manager.periodic_tasks(None)
+        mock_uniform.assert_called_with(0, 20)
+        self.assertEqual(now + datetime.timedelta(seconds=15),
+                         self.manager._periodic_last_run['_spaced'])
+
+    def test_stats_reported_each_interval(self):
+        self.flags(periodic_task_report_interval=600)
+        with mock.patch.object(self.manager,
+                               '_report_periodic_task_stats') as mock_report:
+            self.manager.periodic_tasks(None)
+            self.assertFalse(mock_report.called)
+            timeutils.advance_time_seconds(601)
+            self.manager.periodic_tasks(None)
+            self.assertEqual(1, mock_report.call_count)
+            timeutils.advance_time_seconds(60)
+            self.manager.periodic_tasks(None)
+            self.assertEqual(1, mock_report.call_count)
+
+    def test_report_logs_each_task(self):
+        self.manager.periodic_tasks(None)
+        with mock.patch.object(manager.LOG, 'info') as mock_info:
+            self.manager._report_periodic_task_stats()
+        self.assertEqual(4, mock_info.call_count)
+        logged = mock_info.call_args_list[0][0][1]
+        self.assertEqual('_failing', logged['task_name'])
+        self.assertEqual(1, logged['failures'])
@@ -16,6 +16,7 @@
 
 import datetime
 
+import eventlet
 from oslo.config import cfg
 
 from nova import compute
@@ -2038,6 +2039,169 @@ class DbQuotaDriverTestCase(test.TestCase):
                 ])
         self.assertEqual(result, ['resv-1', 'resv-2', 'resv-3'])
 
+    def _stub_get_limits(self):
+        def fake_get_limits(context, resources, keys, has_sync, project_id,
+                            user_id):
+            return dict(instances=5), dict(instances=5)
+        self.stubs.Set(self.driver, '_get_limits', fake_get_limits)
+
+    def _stub_quota_reserve_batch(self):
+        def fake_quota_reserve_batch(context, resources, requests,
+                                     until_refresh, max_age, project_id=None):
+            self.calls.append(('quota_reserve_batch', project_id,
+                               [request['deltas'] for request in requests]))
+            results = []
+            for i, request in enumerate(requests):
+                if request['deltas']['instances'] > 5:
+                    results.append((None, exception.OverQuota(
+                        overs=['instances'], quotas={}, usages={},
+                        headroom={})))
+                else:
+                    results.append((['resv-%d' % i], None))
+            return results
+        self.stubs.Set(db, 'quota_reserve_batch', fake_quota_reserve_batch)
+
+    def _reserve_concurrently(self, *instances):
+        ctxt = FakeContext('test_project', 'test_class')
+        threads = [eventlet.spawn(self.driver.reserve, ctxt,
+                                  quota.QUOTAS._resources,
+                                  dict(instances=count))
+                   for count in instances]
+        results = []
+        for thread in threads:
+            try:
+                results.append(thread.wait())
+            except exception.OverQuota as e:
+                results.append(e)
+        return results
+
+    def test_reserve_batched(self):
+        self.flags(quota_batch_reservations=True)
+        self._stub_get_limits()
+        self._stub_quota_reserve()
+        self._stub_quota_reserve_batch()
+        results = self._reserve_concurrently(1, 6, 2)
+
+        self.assertEqual(['resv-0'], results[0])
+        self.assertIsInstance(results[1], exception.OverQuota)
+        self.assertEqual(['resv-2'], results[2])
+        self.assertEqual(self.calls, [
+                ('quota_reserve_batch', 'test_project',
+                 [dict(instances=1), dict(instances=6), dict(instances=2)]),
+                ])
+        self.assertEqual({}, self.driver._pending_reservations)
+
+    def test_reserve_batched_hands_over(self):
+        self.flags(quota_batch_reservations=True)
+        self._stub_get_limits()
+        ctxt = FakeContext('test_project', 'test_class')
+        batches = []
+        late = []
+
+        def fake_quota_reserve_batch(context, resources, requests,
+                                     until_refresh, max_age, project_id=None):
+            batches.append((eventlet.getcurrent(),
+                            [req['deltas']['instances'] for req in requests]))
+            if not late:
+                # Requests made while the first batch is in progress.
+                late.extend(eventlet.spawn(self.driver.reserve, ctxt,
+                                           quota.QUOTAS._resources,
+                                           dict(instances=count))
+                            for count in (3, 4))
+                eventlet.sleep(0)
+            return [(['resv-%d' % req['deltas']['instances']], None)
+                    for req in requests]
+        self.stubs.Set(db, 'quota_reserve_batch', fake_quota_reserve_batch)
+
+        results = self._reserve_concurrently(1, 2)
+        results.extend(thread.wait() for thread in late)
+
+        self.assertEqual([['resv-1'], ['resv-2'], ['resv-3'], ['resv-4']],
+                         results)
+        self.assertEqual([[1, 2], [3, 4]], [b[1] for b in batches])
+        # The first queued request reserved the second batch.
+        self.assertIs(late[0], batches[1][0])
+        self.assertEqual({}, self.driver._pending_reservations)
+
+    def test_reserve_not_batched(self):
+        self.flags(quota_batch_reservations=False)
+        self._stub_get_limits()
+        self._stub_quota_reserve()
+        self._stub_quota_reserve_batch()
+        results = self._reserve_concurrently(1, 2)
+
+        self.assertEqual([['resv-1', 'resv-2', 'resv-3']] * 2, results)
+        self.assertEqual(['quota_reserve', 'quota_reserve'],
+                         [call[0] for call in self.calls])
+
+    def _stub_quota_get_all_by_project(self):
+        def fake_quota_get_all_by_project(context, project_id):
+            self.calls.append(('quota_get_all_by_project', project_id))
+            return dict(instances=5)
+
+        def fake_get_quotas(context, resources, keys, has_sync,
+                            project_id=None, user_id=None,
+                            project_quotas=None):
+            return project_quotas
+        self.stubs.Set(db, 'quota_get_all_by_project',
+                       fake_quota_get_all_by_project)
+        self.stubs.Set(self.driver, '_get_quotas', fake_get_quotas)
+
+    def test_get_limits_cached(self):
+        self.flags(quota_limit_cache_ttl=60)
+        self._stub_quota_get_all_by_project()
+        ctxt = FakeContext('test_project', 'test_class')
+
+        for i in range(2):
+            result = self.driver._get_limits(ctxt, quota.QUOTAS._resources,
+                                             ['instances'], True,
+                                             'test_project', 'fake_user')
+            self.assertEqual((dict(instances=5), dict(instances=5)), result)
+        self.assertEqual(1, len(self.calls))
+
+        self.driver._get_limits(ctxt, quota.QUOTAS._resources,
+                                ['instances'], True, 'other_project',
+                                'fake_user')
+        self.assertEqual(2, len(self.calls))
+
+        timeutils.advance_time_seconds(61)
+        self.driver._get_limits(ctxt, quota.QUOTAS._resources,
+                                ['instances'], True, 'test_project',
+                                'fake_user')
+        self.assertEqual(3, len(self.calls))
+
+    def test_get_limits_not_cached(self):
+        self._stub_quota_get_all_by_project()
+        ctxt = FakeContext('test_project', 'test_class')
+
+        for i in range(2):
+            self.driver._get_limits(ctxt, quota.QUOTAS._resources,
+                                    ['instances'], True, 'test_project',
+                                    'fake_user')
+        self.assertEqual(2, len(self.calls))
+
+    def test_invalidate_limits(self):
+        self.flags(quota_limit_cache_ttl=60)
+        self._stub_quota_get_all_by_project()
+        ctxt = FakeContext('test_project', 'test_class')
+
+        for project_id in ('test_project', 'other_project'):
+            self.driver._get_limits(ctxt, quota.QUOTAS._resources,
+                                    ['instances'], True, project_id,
+                                    'fake_user')
+        self.driver.invalidate_limits('test_project')
+        for project_id in ('test_project', 'other_project'):
+            self.driver._get_limits(ctxt, quota.QUOTAS._resources,
+                                    ['instances'], True, project_id,
+                                    'fake_user')
+        self.assertEqual([('quota_get_all_by_project', 'test_project'),
+                          ('quota_get_all_by_project', 'other_project'),
+                          ('quota_get_all_by_project', 'test_project')],
+                         self.calls)
+
+        self.driver.invalidate_limits()
+        self.assertEqual({}, self.driver._limit_cache)
+
     def test_usage_reset(self):
         calls = []
 
@@ -2070,7 +2234,10 @@ class DbQuotaDriverTestCase(test.TestCase):
 
 
 class FakeSession(object):
-    def begin(self):
+    def __init__(self):
+        self.rolled_back = []
+
+    def begin(self, subtransactions=False, nested=False):
         return self
 
     def add(self, instance):
@@ -2080,6 +2247,8 @@ class FakeSession(object):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is not None:
+            self.rolled_back.append(exc_type)
         return False
 
 
@@ -2158,8 +2327,10 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                      until_refresh=None),
                 ]
 
+        self.session = FakeSession()
+
         def fake_get_session():
-            return FakeSession()
+            return self.session
 
         def fake_get_project_quota_usages(context, session, project_id):
             return self.usages.copy()
@@ -2378,6 +2549,38 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.assertEqual(self.usages_created, {})
         self.compare_reservation(result, self._update_reservations_list())
 
+    def test_quota_reserve_max_age_not_reached(self):
+        context = self._init_usages(3, 3, 3, 3)
+        sqa_api.quota_reserve(context, self.resources, self.quotas,
+                              self.quotas, self.deltas, self.expire,
+                              0, 3600)
+
+        self.assertEqual(self.sync_called, set([]))
+
+    def test_quota_reserve_batch(self):
+        context = self._init_usages(3, 3, 3, 3)
+        request = dict(context=context, project_quotas=self.quotas,
+                       user_quotas=self.quotas, deltas=self.deltas,
+                       expire=self.expire, user_id='fake_user')
+        too_big = dict(request, deltas=dict(self.deltas, instances=4))
+        results = sqa_api.quota_reserve_batch(context, self.resources,
+                                              [too_big, request], 0, 0)
+
+        self.assertEqual(2, len(results))
+        self.assertIsNone(results[0][0])
+        self.assertIsInstance(results[0][1], exception.OverQuota)
+        self.assertEqual(['instances'], results[0][1].kwargs['overs'])
+        self.compare_reservation(results[1][0],
+                                 self._update_reservations_list())
+        self.assertIsNone(results[1][1])
+        # The batch was rolled back and made again without too_big.
+        self.assertEqual([exception.OverQuota], self.session.rolled_back)
+        self.usages_list[0]["in_use"] = 3
+        self.usages_list[1]["in_use"] = 3
+        self.usages_list[2]["in_use"] = 3
+        self.usages_list[3]["in_use"] = 3
+        self.compare_usage(self.usages, self.usages_list)
+
     def test_quota_reserve_no_refresh(self):
         context = self._init_usages(3, 3, 3, 3)
         result = sqa_api.quota_reserve(context, self.resources, self.quotas,
@@ -2448,6 +2651,7 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.compare_usage(self.usages, self.usages_list)
         self.assertEqual(self.usages_created, {})
         self.assertEqual(self.reservations_created, {})
+        self.assertEqual([exception.OverQuota], self.session.rolled_back)
 
     def test_quota_reserve_cores_unlimited(self):
         # Requesting 8 cores, quota_cores set to unlimited:
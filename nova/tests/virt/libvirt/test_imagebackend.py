@@ -17,6 +17,8 @@ import os
 import shutil
 import tempfile
 
+import eventlet
+from eventlet import greenthread
 import fixtures
 from oslo.config import cfg
 
@@ -146,6 +148,7 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(False)
         os.path.exists(self.PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
         imagebackend.fileutils.ensure_tree(self.TEMPLATE_DIR)
@@ -171,6 +174,69 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
 
         self.mox.VerifyAll()
 
+    def test_cache_base_fetched_while_waiting(self):
+        self.mox.StubOutWithMock(os.path, 'exists')
+        if self.OLD_STYLE_INSTANCE_PATH:
+            os.path.exists(self.OLD_STYLE_INSTANCE_PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
+        os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(True)
+        fn = self.mox.CreateMockAnything()
+        self.mox.ReplayAll()
+
+        image = self.image_class(self.INSTANCE, self.NAME)
+        self.mock_create_image(image)
+        image.cache(fn, self.TEMPLATE)
+
+        self.mox.VerifyAll()
+
+    def test_cache_concurrent_sizes(self):
+        fetches = []
+        verified = []
+
+        def fake_fetch(target, *args, **kwargs):
+            fetches.append(kwargs)
+            # Let the other caller ask for the same base image.
+            greenthread.sleep(0)
+
+        def fake_verify_base_size(base, size, base_size=0):
+            verified.append(size)
+
+        def create_image(fn, base, size, *args, **kwargs):
+            fn(target=base, max_size=size, *args, **kwargs)
+
+        self.stubs.Set(imagebackend.Image, 'verify_base_size',
+                       staticmethod(fake_verify_base_size))
+        threads = []
+        for size in (self.SIZE * 2, self.SIZE):
+            image = self.image_class(self.INSTANCE, self.NAME)
+            image.create_image = create_image
+            threads.append(eventlet.spawn(image.cache, fake_fetch,
+                                          self.TEMPLATE, size,
+                                          image_id='fake-image'))
+        for thread in threads:
+            thread.wait()
+
+        self.assertEqual([{'image_id': 'fake-image'}], fetches)
+        self.assertEqual([self.SIZE * 2, self.SIZE], verified)
+
+    def test_cache_stores_fetched_checksum(self):
+        self.flags(checksum_base_images=True, group='libvirt')
+        fn = self.mox.CreateMockAnything()
+        fn(target=self.TEMPLATE_PATH).AndReturn('fake-sha1')
+        self.mox.StubOutWithMock(imagebackend.imagecache,
+                                 'write_stored_info')
+        imagebackend.imagecache.write_stored_info(self.TEMPLATE_PATH,
+                                                  field='sha1',
+                                                  value='fake-sha1')
+        self.mox.ReplayAll()
+
+        image = self.image_class(self.INSTANCE, self.NAME)
+        self.mock_create_image(image)
+        image.cache(fn, self.TEMPLATE)
+
+        self.mox.VerifyAll()
+
     def test_cache_base_dir_exists(self):
         self.mox.StubOutWithMock(os.path, 'exists')
         if self.OLD_STYLE_INSTANCE_PATH:
@@ -178,6 +244,7 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
         self.mox.ReplayAll()
@@ -195,6 +262,7 @@ class RawTestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
 
@@ -299,6 +367,7 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.INSTANCES_PATH).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
 
@@ -333,6 +402,7 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
 
@@ -351,6 +421,7 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
 
@@ -393,6 +464,30 @@ class Qcow2TestCase(_ImageTestCase, test.NoDBTestCase):
 
         self.mox.VerifyAll()
 
+    def test_create_image_records_backing_file(self):
+        fn = self.prepare_mocks()
+        fn(max_size=None, target=self.TEMPLATE_PATH)
+        self.mox.StubOutWithMock(os.path, 'exists')
+        self.mox.StubOutWithMock(imagebackend.imagecache, 'get_index')
+        if self.OLD_STYLE_INSTANCE_PATH:
+            os.path.exists(self.OLD_STYLE_INSTANCE_PATH).AndReturn(False)
+        os.path.exists(self.DISK_INFO_PATH).AndReturn(False)
+        os.path.exists(self.INSTANCES_PATH).AndReturn(True)
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
+        os.path.exists(self.PATH).AndReturn(False)
+        os.path.exists(self.PATH).AndReturn(False)
+        imagebackend.libvirt_utils.create_cow_image(self.TEMPLATE_PATH,
+                                                    self.PATH)
+        index = self.mox.CreateMockAnything()
+        imagebackend.imagecache.get_index().AndReturn(index)
+        index.add_backing_file(self.PATH, self.TEMPLATE_PATH)
+        self.mox.ReplayAll()
+
+        image = self.image_class(self.INSTANCE, self.NAME)
+        image.create_image(fn, self.TEMPLATE_PATH, None)
+
+        self.mox.VerifyAll()
+
     def test_create_image_too_small(self):
         fn = self.prepare_mocks()
         self.mox.StubOutWithMock(os.path, 'exists')
@@ -594,6 +689,7 @@ class LvmTestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.PATH).AndReturn(False)
 
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
         imagebackend.fileutils.ensure_tree(self.TEMPLATE_DIR)
@@ -626,6 +722,7 @@ class LvmTestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         os.path.exists(self.PATH).AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
         self.mox.ReplayAll()
@@ -746,6 +843,7 @@ class RbdTestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(False)
         image.check_image_exists().AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
         imagebackend.fileutils.ensure_tree(self.TEMPLATE_DIR)
@@ -764,6 +862,7 @@ class RbdTestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         image.check_image_exists().AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.StubOutWithMock(imagebackend.fileutils, 'ensure_tree')
         self.mox.ReplayAll()
@@ -795,6 +894,7 @@ class RbdTestCase(_ImageTestCase, test.NoDBTestCase):
         os.path.exists(self.TEMPLATE_DIR).AndReturn(True)
         image.check_image_exists().AndReturn(False)
         fn = self.mox.CreateMockAnything()
+        os.path.exists(self.TEMPLATE_PATH).AndReturn(False)
         fn(target=self.TEMPLATE_PATH)
         self.mox.ReplayAll()
 
@@ -915,3 +1015,40 @@ class BackendTestCase(test.NoDBTestCase):
 
     def test_image_default(self):
         self._test_image('default', imagebackend.Raw, imagebackend.Qcow2)
+
+
+class FetchOnceTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(FetchOnceTestCase, self).setUp()
+        self.calls = []
+
+    def _fetch(self, target, result=None, error=None):
+        self.calls.append(target)
+        # Give the other callers a chance to ask for the same target.
+        greenthread.sleep(0)
+        if error:
+            raise error
+        return result
+
+    def test_concurrent_fetches_share_one_call(self):
+        threads = [eventlet.spawn(imagebackend._fetch_once, 'target',
+                                  self._fetch, result='fake-sha1')
+                   for i in xrange(3)]
+        self.assertEqual(['fake-sha1'] * 3,
+                         [thread.wait() for thread in threads])
+        self.assertEqual(['target'], self.calls)
+        self.assertEqual({}, imagebackend._fetches_in_flight)
+
+    def test_concurrent_fetches_share_error(self):
+        threads = [eventlet.spawn(imagebackend._fetch_once, 'target',
+                                  self._fetch, error=test.TestingException())
+                   for i in xrange(3)]
+        for thread in threads:
+            self.assertRaises(test.TestingException, thread.wait)
+        self.assertEqual(['target'], self.calls)
+        self.assertEqual({}, imagebackend._fetches_in_flight)
+
+    def test_sequential_fetches(self):
+        imagebackend._fetch_once('target', self._fetch)
+        imagebackend._fetch_once('target', self._fetch)
+        self.assertEqual(['target', 'target'], self.calls)
@@ -21,6 +21,7 @@ import json
 import os
 import time
 
+import fixtures
 from oslo.config import cfg
 
 from nova import conductor
@@ -880,3 +881,156 @@ class VerifyChecksumTestCase(test.NoDBTestCase):
             # Checksum requests for a file with no checksum now have the
             # side effect of creating the checksum
             self.assertTrue(os.path.exists(info_fname))
+
+
+class ImageCacheIndexTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(ImageCacheIndexTestCase, self).setUp()
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.flags(instances_path=self.tmpdir,
+                   image_cache_subdirectory_name='_base',
+                   remove_unused_base_images=False)
+        self.flags(image_cache_index=True,
+                   image_cache_index_path=os.path.join(self.tmpdir,
+                                                       'index.sqlite'),
+                   group='libvirt')
+        self.index = imagecache.get_index()
+        self.base_dir = os.path.join(self.tmpdir, '_base')
+        os.mkdir(self.base_dir)
+
+    def _base_path(self, image_id):
+        path = os.path.join(self.base_dir, hashlib.sha1(image_id).hexdigest())
+        with open(path, 'w') as f:
+            f.write(image_id)
+        return path
+
+    def _instance_disk(self, name):
+        os.mkdir(os.path.join(self.tmpdir, name))
+        path = os.path.join(self.tmpdir, name, 'disk')
+        with open(path, 'w') as f:
+            f.write('disk')
+        return path
+
+    def test_get_index_disabled(self):
+        self.flags(image_cache_index=False, group='libvirt')
+        self.assertIsNone(imagecache.get_index())
+
+    def test_get_index_persistent(self):
+        self.index.add_base_image('/base/a')
+        reopened = imagecache.ImageCacheIndex(self.index.path)
+        self.assertEqual(['/base/a'], reopened.get_base_images())
+
+    def test_backing_files(self):
+        self.index.add_backing_file('/inst/instance-1/disk', '/base/a')
+        self.index.add_backing_file('/inst/instance-2/disk', '/base/a')
+        self.index.remove_instance('/inst/instance-1')
+        self.assertEqual([('instance-2', '/inst/instance-2/disk', '/base/a')],
+                         self.index.get_backing_files())
+
+    def test_rebuild_keeps_checksums(self):
+        self.index.set_checksum('/base/a', 'sha1-a', 1.0)
+        self.index.set_checksum('/base/b', 'sha1-b', 1.0)
+        self.index.add_backing_file('/inst/instance-1/disk', '/base/b')
+
+        self.index.rebuild({'/base/a': 2.0, '/base/c': 3.0},
+                           {'/inst/instance-2/disk': '/base/c'})
+
+        self.assertEqual(['/base/a', '/base/c'],
+                         sorted(self.index.get_base_images()))
+        self.assertEqual(('sha1-a', 1.0), self.index.get_checksum('/base/a'))
+        self.assertEqual((None, None), self.index.get_checksum('/base/b'))
+        self.assertEqual([('instance-2', '/inst/instance-2/disk', '/base/c')],
+                         self.index.get_backing_files())
+
+    def test_write_stored_info_updates_index(self):
+        self.flags(image_info_filename_pattern=('$instances_path/'
+                                                '%(image)s.info'),
+                   group='libvirt')
+        base_path = self._base_path('1')
+        imagecache.write_stored_info(base_path, field='sha1', value='fake')
+        self.assertEqual('fake', self.index.get_checksum(base_path)[0])
+
+    def test_verify_checksum_from_index(self):
+        self.flags(checksum_base_images=True, group='libvirt')
+        base_path = self._base_path('1')
+        self.index.set_checksum(base_path, 'fake', time.time())
+        self.stubs.Set(imagecache, 'read_stored_checksum',
+                       lambda *args, **kwargs: self.fail('info file read'))
+
+        image_cache_manager = imagecache.ImageCacheManager()
+        image_cache_manager.index = self.index
+        self.assertTrue(image_cache_manager._verify_checksum('1', base_path))
+
+    def test_update_uses_index_between_full_scans(self):
+        used_base = self._base_path('1')
+        backing_base = self._base_path('2')
+        disk_path = self._instance_disk('instance-00000001')
+        all_instances = [{'name': 'instance-00000001', 'uuid': '123',
+                          'host': CONF.host, 'image_ref': '1',
+                          'vm_state': '', 'task_state': ''}]
+        self.stubs.Set(virtutils, 'chown', lambda path, uid: None)
+        backing_calls = []
+
+        def fake_get_disk_backing_file(path):
+            backing_calls.append(path)
+            return os.path.basename(backing_base)
+
+        self.stubs.Set(virtutils, 'get_disk_backing_file',
+                       fake_get_disk_backing_file)
+
+        image_cache_manager = imagecache.ImageCacheManager()
+        image_cache_manager.update(None, all_instances)
+
+        self.assertEqual([disk_path], backing_calls)
+        self.assertIsNone(image_cache_manager.index)
+        self.assertEqual(sorted([used_base, backing_base]),
+                         sorted(self.index.get_base_images()))
+        self.assertEqual([('instance-00000001', disk_path, backing_base)],
+                         self.index.get_backing_files())
+
+        image_cache_manager.update(None, all_instances)
+
+        self.assertEqual([disk_path], backing_calls)
+        self.assertEqual(self.index, image_cache_manager.index)
+        self.assertEqual(sorted([used_base, backing_base]),
+                         sorted(image_cache_manager.active_base_files))
+        self.assertEqual([], image_cache_manager.removable_base_files)
+
+    def test_update_full_scan_interval(self):
+        self.flags(image_cache_index_full_scan_interval=0, group='libvirt')
+        image_cache_manager = imagecache.ImageCacheManager()
+        image_cache_manager.update(None, [])
+        image_cache_manager.update(None, [])
+        self.assertIsNone(image_cache_manager.index)
+
+    def test_removal_deferred_to_full_scan(self):
+        self.flags(remove_unused_base_images=True,
+                   remove_unused_original_minimum_age_seconds=0)
+        base_path = self._base_path('1')
+        self.index.add_base_image(base_path)
+
+        image_cache_manager = imagecache.ImageCacheManager()
+        image_cache_manager.last_full_scan = time.time()
+        image_cache_manager.update(None, [])
+        self.assertEqual(self.index, image_cache_manager.index)
+        self.assertEqual([base_path],
+                         image_cache_manager.removable_base_files)
+        self.assertTrue(os.path.exists(base_path))
+
+        self.flags(image_cache_index_full_scan_interval=0, group='libvirt')
+        image_cache_manager.update(None, [])
+        self.assertIsNone(image_cache_manager.index)
+        self.assertFalse(os.path.exists(base_path))
+        self.assertEqual([], self.index.get_base_images())
+
+    def test_remove_base_file_updates_index(self):
+        self.flags(remove_unused_resized_minimum_age_seconds=0,
+                   group='libvirt')
+        base_path = self._base_path('1')
+        self.index.add_base_image(base_path)
+
+        image_cache_manager = imagecache.ImageCacheManager()
+        image_cache_manager._remove_base_file(base_path)
+
+        self.assertEqual([], self.index.get_base_images())
@@ -24,6 +24,7 @@ import os
 import re
 import shutil
 import tempfile
+import time
 
 from eventlet import greenthread
 from lxml import etree
@@ -2392,6 +2393,126 @@ class LibvirtConnTestCase(test.TestCase):
         # Only one should be listed, since domain with ID 0 must be skipped
         self.assertEqual(len(instances), 1)
 
+    def _fake_snapshot_domains(self):
+        running = mock.Mock()
+        running.UUIDString.return_value = 'running-uuid'
+        running.info.return_value = [libvirt_driver.VIR_DOMAIN_RUNNING,
+                                     2097152, 1048576, 2, 1000]
+        running.ID.return_value = 5
+        shutoff = mock.Mock()
+        shutoff.UUIDString.return_value = 'shutoff-uuid'
+        shutoff.info.return_value = [libvirt_driver.VIR_DOMAIN_SHUTOFF,
+                                     1048576, 0, 1, 0]
+        shutoff.ID.return_value = -1
+        broken = mock.Mock()
+        broken.UUIDString.return_value = 'broken-uuid'
+        broken.info.side_effect = libvirt.libvirtError('gone')
+        return [running, shutoff, broken]
+
+    def test_get_power_states(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instances = [{'uuid': 'running-uuid'}, {'uuid': 'broken-uuid'},
+                     {'uuid': 'missing-uuid'}]
+        with mock.patch.object(conn, '_list_domains',
+                               return_value=self._fake_snapshot_domains()):
+            states = conn.get_power_states(instances)
+        self.assertEqual({'running-uuid': power_state.RUNNING,
+                          'missing-uuid': power_state.NOSTATE}, states)
+
+    def test_get_instances_info(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instances = [{'uuid': 'running-uuid'}, {'uuid': 'shutoff-uuid'},
+                     {'uuid': 'broken-uuid'}, {'uuid': 'missing-uuid'}]
+        with mock.patch.object(conn, '_list_domains',
+                               return_value=self._fake_snapshot_domains()):
+            infos = conn.get_instances_info(instances)
+        self.assertEqual({'running-uuid': {'state': power_state.RUNNING,
+                                           'max_mem': 2097152,
+                                           'mem': 1048576,
+                                           'num_cpu': 2,
+                                           'cpu_time': 1000,
+                                           'id': 5},
+                          'shutoff-uuid': {'state': power_state.SHUTDOWN,
+                                           'max_mem': 1048576,
+                                           'mem': 0,
+                                           'num_cpu': 1,
+                                           'cpu_time': 0,
+                                           'id': -1}}, infos)
+
+    def test_get_per_instance_usage(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with mock.patch.object(conn, '_list_domains',
+                               return_value=self._fake_snapshot_domains()):
+            usage = conn.get_per_instance_usage()
+        self.assertEqual({'running-uuid': {'memory_mb': 2048,
+                                           'uuid': 'running-uuid'}}, usage)
+
+    def test_domain_snapshot_is_reused(self):
+        self.flags(instance_info_snapshot_ttl=60, group='libvirt')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instances = [{'uuid': 'running-uuid'}]
+        with mock.patch.object(conn, '_list_domains',
+                return_value=self._fake_snapshot_domains()) as mock_list:
+            conn.get_power_states(instances)
+            conn.get_instances_info(instances)
+            conn.get_per_instance_usage()
+            self.assertEqual(1, mock_list.call_count)
+
+            conn._invalidate_domain_snapshot()
+            conn.get_power_states(instances)
+            self.assertEqual(2, mock_list.call_count)
+
+    def test_domain_snapshot_expires(self):
+        self.flags(instance_info_snapshot_ttl=5, group='libvirt')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        with contextlib.nested(
+            mock.patch.object(conn, '_list_domains',
+                              return_value=self._fake_snapshot_domains()),
+            mock.patch.object(time, 'time', side_effect=[100, 104, 106]),
+        ) as (mock_list, mock_time):
+            for _i in xrange(3):
+                conn.get_per_instance_usage()
+        self.assertEqual(2, mock_list.call_count)
+
+    def test_destroy_invalidates_domain_snapshot(self):
+        self.flags(instance_info_snapshot_ttl=60, group='libvirt')
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        conn._domain_snapshot = {'fake-uuid': None}
+        conn._domain_snapshot_time = time.time()
+        with mock.patch.object(conn, '_lookup_by_name',
+                side_effect=exception.InstanceNotFound(instance_id='fake')):
+            conn._destroy({'name': 'fake', 'uuid': 'fake-uuid'})
+        self.assertIsNone(conn._domain_snapshot)
+
+    def test_destroy_invalidates_domain_snapshot_after_destroy(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        calls = []
+        virt_dom = mock.Mock()
+        virt_dom.destroy.side_effect = lambda: calls.append('destroy')
+        with contextlib.nested(
+            mock.patch.object(conn, '_lookup_by_name', return_value=virt_dom),
+            mock.patch.object(conn, '_invalidate_domain_snapshot',
+                side_effect=lambda: calls.append('invalidate')),
+            mock.patch.object(conn, 'get_info',
+                side_effect=exception.InstanceNotFound(instance_id='fake')),
+        ):
+            conn._destroy({'name': 'fake', 'uuid': 'fake-uuid'})
+        self.assertEqual(['invalidate', 'destroy', 'invalidate'], calls)
+
+    def test_create_domain_invalidates_domain_snapshot_after_create(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        calls = []
+        domain = mock.Mock()
+        domain.createWithFlags.side_effect = (
+            lambda flags: calls.append('create'))
+        with contextlib.nested(
+            mock.patch.object(conn, '_invalidate_domain_snapshot',
+                side_effect=lambda: calls.append('invalidate')),
+            mock.patch.object(utils, 'is_neutron', return_value=True),
+        ):
+            conn._create_domain(domain=domain)
+        self.assertEqual(['invalidate', 'create', 'invalidate'], calls)
+
     def test_list_defined_instances(self):
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByID = self.fake_lookup
@@ -7913,11 +8034,12 @@ disk size: 4.4M''', ''))
         user_id = 'fake'
         project_id = 'fake'
         images.fetch_to_raw(context, image_id, target, user_id, project_id,
-                            max_size=0)
+                            max_size=0).AndReturn('fake-sha1')
 
         self.mox.ReplayAll()
-        libvirt_utils.fetch_image(context, target, image_id,
-                                  user_id, project_id)
+        self.assertEqual('fake-sha1',
+                         libvirt_utils.fetch_image(context, target, image_id,
+                                                   user_id, project_id))
 
     def test_fetch_raw_image(self):
 
@@ -7963,7 +8085,7 @@ disk size: 4.4M''', ''))
         self.stubs.Set(utils, 'execute', fake_execute)
         self.stubs.Set(os, 'rename', fake_rename)
         self.stubs.Set(os, 'unlink', fake_unlink)
-        self.stubs.Set(images, 'fetch', lambda *_, **__: None)
+        self.stubs.Set(images, 'fetch', lambda *_, **__: 'fake-sha1')
         self.stubs.Set(images, 'qemu_img_info', fake_qemu_img_info)
         self.stubs.Set(fileutils, 'delete_if_exists', fake_rm_on_error)
 
@@ -7985,14 +8107,18 @@ disk size: 4.4M''', ''))
                               't.qcow2.part', 't.qcow2.converted'),
                              ('rm', 't.qcow2.part'),
                              ('mv', 't.qcow2.converted', 't.qcow2')]
-        images.fetch_to_raw(context, image_id, target, user_id, project_id,
-                            max_size=1)
+        # The checksum of the download isn't the one of the converted file.
+        self.assertIsNone(images.fetch_to_raw(context, image_id, target,
+                                              user_id, project_id,
+                                              max_size=1))
         self.assertEqual(self.executes, expected_commands)
 
         target = 't.raw'
         self.executes = []
         expected_commands = [('mv', 't.raw.part', 't.raw')]
-        images.fetch_to_raw(context, image_id, target, user_id, project_id)
+        self.assertEqual('fake-sha1',
+                         images.fetch_to_raw(context, image_id, target,
+                                             user_id, project_id))
         self.assertEqual(self.executes, expected_commands)
 
         target = 'backing.qcow2'
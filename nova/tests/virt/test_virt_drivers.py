@@ -22,6 +22,7 @@ import netaddr
 import six
 
 from nova.compute import manager
+from nova.compute import power_state
 from nova import exception
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
@@ -482,6 +483,25 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
                           self.connection.get_info,
                           {'name': 'I just made this name up'})
 
+    @catch_notimplementederror
+    def test_get_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        unknown = {'uuid': 'fake-uuid', 'name': 'I just made this name up'}
+        states = self.connection.get_power_states([instance_ref, unknown])
+        self.assertEqual({instance_ref['uuid']: power_state.RUNNING,
+                          'fake-uuid': power_state.NOSTATE}, states)
+
+    @catch_notimplementederror
+    def test_get_instances_info(self):
+        instance_ref, network_info = self._get_running_instance()
+        unknown = {'uuid': 'fake-uuid', 'name': 'I just made this name up'}
+        infos = self.connection.get_instances_info([instance_ref, unknown])
+        self.assertEqual([instance_ref['uuid']], infos.keys())
+        info = infos[instance_ref['uuid']]
+        self.assertEqual(power_state.RUNNING, info['state'])
+        self.assertIn('max_mem', info)
+        self.assertIn('num_cpu', info)
+
     @catch_notimplementederror
     def test_get_diagnostics(self):
         instance_ref, network_info = self._get_running_instance(obj=True)
@@ -24,6 +24,8 @@ import sys
 
 from oslo.config import cfg
 
+from nova.compute import power_state
+from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -171,6 +173,62 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self, instances):
+        """Get the power state of several instances at once.
+
+        :param instances: nova.objects.instance.Instance objects
+
+        Returns a dict mapping the uuid of each instance to its power_state
+        code, power_state.NOSTATE if the hypervisor doesn't know about it.
+        Instances whose state couldn't be read are left out.
+
+        .. note::
+
+            This implementation works for all drivers, but it calls
+            get_info() once per instance. Maintainers of the virt drivers
+            are encouraged to override this method with something more
+            efficient.
+        """
+        states = {}
+        for instance in instances:
+            try:
+                states[instance['uuid']] = self.get_info(instance)['state']
+            except exception.InstanceNotFound:
+                states[instance['uuid']] = power_state.NOSTATE
+            except Exception:
+                LOG.exception(_("Unable to get the power state of the "
+                                "instance."), instance=instance)
+        return states
+
+    def get_instances_info(self, instances):
+        """Get the status of several instances at once.
+
+        :param instances: nova.objects.instance.Instance objects
+
+        Returns a dict mapping the uuid of each instance to the dict
+        get_info() returns for it. Instances the hypervisor doesn't know
+        about, or whose status couldn't be read, are left out.
+
+        .. note::
+
+            This implementation works for all drivers, but it calls
+            get_info() once per instance. Maintainers of the virt drivers
+            are encouraged to override this method with something more
+            efficient.
+        """
+        infos = {}
+        for instance in instances:
+            try:
+                infos[instance['uuid']] = self.get_info(instance)
+            except exception.InstanceNotFound:
+                pass
+            except NotImplementedError:
+                raise
+            except Exception:
+                LOG.exception(_("Unable to get the status of the "
+                                "instance."), instance=instance)
+        return infos
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
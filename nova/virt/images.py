@@ -62,6 +62,11 @@ def convert_image(source, dest, out_format, run_as_root=False):
 
 
 def fetch(context, image_href, path, _user_id, _project_id, max_size=0):
+    """Download an image to path.
+
+    Returns the SHA1 hex digest of the image data if the image service
+    computed it while downloading, None otherwise.
+    """
     # TODO(vish): Improve context handling and add owner and auth data
     #             when it is added to glance.  Right now there is no
     #             auth checking in glance, so we assume that access was
@@ -69,13 +74,18 @@ def fetch(context, image_href, path, _user_id, _project_id, max_size=0):
     (image_service, image_id) = glance.get_remote_image_service(context,
                                                                 image_href)
     with fileutils.remove_path_on_error(path):
-        image_service.download(context, image_id, dst_path=path)
+        return image_service.download(context, image_id, dst_path=path)
 
 
 def fetch_to_raw(context, image_href, path, user_id, project_id, max_size=0):
+    """Download an image to path, converting it to raw if needed.
+
+    Returns the SHA1 hex digest of path if it is known without reading
+    the file again, that is if the image was stored as downloaded.
+    """
     path_tmp = "%s.part" % path
-    fetch(context, image_href, path_tmp, user_id, project_id,
-          max_size=max_size)
+    checksum = fetch(context, image_href, path_tmp, user_id, project_id,
+                     max_size=max_size)
 
     with fileutils.remove_path_on_error(path_tmp):
         data = qemu_img_info(path_tmp)
@@ -125,3 +135,4 @@ def fetch_to_raw(context, image_href, path, user_id, project_id, max_size=0):
                 os.rename(staged, path)
         else:
             os.rename(path_tmp, path)
+            return checksum
@@ -255,6 +255,12 @@ libvirt_opts = [
                 help='A path to a device that will be used as source of '
                      'entropy on the host. Permitted options are: '
                      '/dev/random or /dev/hwrng'),
+    cfg.IntOpt('instance_info_snapshot_ttl',
+               default=5,
+               help='Number of seconds the state, memory and vCPUs read '
+                    'from all the domains at once are reused for, so that '
+                    'the periodic tasks run together share one listing of '
+                    'the domains. 0 reads them on every call'),
     ]
 
 CONF = cfg.CONF
@@ -369,6 +375,8 @@ class LibvirtDriver(driver.ComputeDriver):
         self._wrapped_conn_lock = threading.Lock()
         self._caps = None
         self._vcpu_total = 0
+        self._domain_snapshot = None
+        self._domain_snapshot_time = 0
         self.read_only = read_only
         self.firewall_driver = firewall.load_driver(
             DEFAULT_FIREWALL_DRIVER,
@@ -562,6 +570,7 @@ class LibvirtDriver(driver.ComputeDriver):
             try:
                 event = self._event_queue.get(block=False)
                 if isinstance(event, virtevent.LifecycleEvent):
+                    self._invalidate_domain_snapshot()
                     self.emit_event(event)
                 elif 'conn' in event and 'reason' in event:
                     last_close_event = event
@@ -830,14 +839,14 @@ class LibvirtDriver(driver.ComputeDriver):
 
         return names
 
-    def list_instance_uuids(self):
-        uuids = set()
+    def _list_domains(self):
+        """Return every domain known to libvirt, running or not."""
+        domains = []
         for domain_id in self.list_instance_ids():
             try:
                 # We skip domains with ID 0 (hypervisors).
                 if domain_id != 0:
-                    domain = self._lookup_by_id(domain_id)
-                    uuids.add(domain.UUIDString())
+                    domains.append(self._lookup_by_id(domain_id))
             except exception.InstanceNotFound:
                 # Ignore deleted instance while listing
                 continue
@@ -845,12 +854,84 @@ class LibvirtDriver(driver.ComputeDriver):
         # extend instance list to contain also defined domains
         for domain_name in self._conn.listDefinedDomains():
             try:
-                uuids.add(self._lookup_by_name(domain_name).UUIDString())
+                domains.append(self._lookup_by_name(domain_name))
             except exception.InstanceNotFound:
                 # Ignore deleted instance while listing
                 continue
 
-        return list(uuids)
+        return domains
+
+    def _invalidate_domain_snapshot(self):
+        self._domain_snapshot = None
+
+    def _get_domain_snapshot(self):
+        """Return the info of every domain known to libvirt by uuid.
+
+        The info of a domain which couldn't be read is None. The result is
+        reused for CONF.libvirt.instance_info_snapshot_ttl seconds, or until
+        this driver creates or destroys a domain or gets a lifecycle event.
+        """
+        now = time.time()
+        if (self._domain_snapshot is not None and
+                now - self._domain_snapshot_time <
+                CONF.libvirt.instance_info_snapshot_ttl):
+            return self._domain_snapshot
+
+        snapshot = {}
+        for domain in self._list_domains():
+            dom_uuid = domain.UUIDString()
+            try:
+                dom_info = domain.info()
+            except libvirt.libvirtError as ex:
+                # The domain may have been undefined since it was listed,
+                # it will be read again with the next snapshot.
+                LOG.debug(_("Unable to get the info of domain %(uuid)s: "
+                            "%(ex)s"), {'uuid': dom_uuid, 'ex': ex})
+                snapshot[dom_uuid] = None
+                continue
+            snapshot[dom_uuid] = {'state': LIBVIRT_POWER_STATE[dom_info[0]],
+                                  'max_mem': dom_info[1],
+                                  'mem': dom_info[2],
+                                  'num_cpu': dom_info[3],
+                                  'cpu_time': dom_info[4],
+                                  'id': domain.ID()}
+        self._domain_snapshot = snapshot
+        self._domain_snapshot_time = now
+        return snapshot
+
+    def list_instance_uuids(self):
+        return list(set(domain.UUIDString()
+                        for domain in self._list_domains()))
+
+    def get_instances_info(self, instances):
+        """Efficient override of base get_instances_info method."""
+        snapshot = self._get_domain_snapshot()
+        return dict((instance['uuid'], dict(snapshot[instance['uuid']]))
+                    for instance in instances
+                    if snapshot.get(instance['uuid']) is not None)
+
+    def get_power_states(self, instances):
+        """Efficient override of base get_power_states method."""
+        snapshot = self._get_domain_snapshot()
+        states = {}
+        for instance in instances:
+            instance_uuid = instance['uuid']
+            if instance_uuid not in snapshot:
+                states[instance_uuid] = power_state.NOSTATE
+            elif snapshot[instance_uuid] is not None:
+                states[instance_uuid] = snapshot[instance_uuid]['state']
+        return states
+
+    def get_per_instance_usage(self):
+        """Get the memory of each running or paused domain."""
+        usage = {}
+        for dom_uuid, dom_info in self._get_domain_snapshot().iteritems():
+            if dom_info is not None and dom_info['state'] in (
+                    power_state.RUNNING, power_state.PAUSED):
+                usage[dom_uuid] = {'memory_mb':
+                                       dom_info['max_mem'] / units.Ki,
+                                   'uuid': dom_uuid}
+        return usage
 
     def plug_vifs(self, instance, network_info):
         """Plug VIFs into networks."""
@@ -869,6 +950,7 @@ class LibvirtDriver(driver.ComputeDriver):
         disk.teardown_container(container_dir, container_root_device)
 
     def _destroy(self, instance):
+        self._invalidate_domain_snapshot()
         try:
             virt_dom = self._lookup_by_name(instance['name'])
         except exception.InstanceNotFound:
@@ -908,6 +990,10 @@ class LibvirtDriver(driver.ComputeDriver):
                                     'Code=%(errcode)s Error=%(e)s'),
                                   {'errcode': errcode, 'e': e},
                                   instance=instance)
+            finally:
+                # A snapshot taken while the domain was being destroyed
+                # may still show it running.
+                self._invalidate_domain_snapshot()
 
         def _wait_for_destroy(expected_domid):
             """Called at an interval until the VM is gone."""
@@ -3528,22 +3614,28 @@ class LibvirtDriver(driver.ComputeDriver):
                     nova_context.get_admin_context(), instance['uuid'],
                     {'root_device_name': container_root_device})
 
-        if xml:
-            try:
-                domain = self._conn.defineXML(xml)
-            except Exception as e:
-                LOG.error(_("An error occurred while trying to define a domain"
-                            " with xml: %s") % xml)
-                raise e
+        self._invalidate_domain_snapshot()
+        try:
+            if xml:
+                try:
+                    domain = self._conn.defineXML(xml)
+                except Exception as e:
+                    LOG.error(_("An error occurred while trying to define a "
+                                "domain with xml: %s") % xml)
+                    raise e
 
-        if power_on:
-            try:
-                domain.createWithFlags(launch_flags)
-            except Exception as e:
-                with excutils.save_and_reraise_exception():
-                    LOG.error(_("An error occurred while trying to launch a "
-                                "defined domain with xml: %s") %
-                              domain.XMLDesc(0))
+            if power_on:
+                try:
+                    domain.createWithFlags(launch_flags)
+                except Exception as e:
+                    with excutils.save_and_reraise_exception():
+                        LOG.error(_("An error occurred while trying to launch "
+                                    "a defined domain with xml: %s") %
+                                  domain.XMLDesc(0))
+        finally:
+            # A snapshot taken while the domain was being created may miss
+            # it or show it stopped.
+            self._invalidate_domain_snapshot()
 
         if not utils.is_neutron():
             try:
@@ -5166,6 +5258,10 @@ class LibvirtDriver(driver.ComputeDriver):
             LOG.info(_('Deletion of %s failed'), target, instance=instance)
             return False
 
+        index = imagecache.get_index()
+        if index:
+            index.remove_instance(target)
+
         LOG.info(_('Deletion of %s complete'), target, instance=instance)
         return True
 
@@ -16,7 +16,9 @@
 import abc
 import contextlib
 import os
+import sys
 
+from eventlet import event
 import six
 
 from oslo.config import cfg
@@ -32,6 +34,7 @@ from nova import utils
 from nova.virt.disk import api as disk
 from nova.virt import images
 from nova.virt.libvirt import config as vconfig
+from nova.virt.libvirt import imagecache
 from nova.virt.libvirt import utils as libvirt_utils
 
 
@@ -43,6 +46,35 @@ except ImportError:
     rbd = None
 
 
+# Fetches under way in this process, by target path.
+_fetches_in_flight = {}
+
+
+def _fetch_once(target, fetch_func, *args, **kwargs):
+    """Call fetch_func for target unless another call is already under way.
+
+    Concurrent callers for the same target wait for the call under way and
+    get its result, or its exception, instead of fetching the image again.
+    """
+    done = _fetches_in_flight.get(target)
+    if done is not None:
+        LOG.debug(_("Waiting for the fetch of %s under way"), target)
+        return done.wait()
+
+    done = event.Event()
+    _fetches_in_flight[target] = done
+    try:
+        result = fetch_func(target=target, *args, **kwargs)
+    except Exception:
+        with excutils.save_and_reraise_exception():
+            done.send_exception(*sys.exc_info())
+    else:
+        done.send(result)
+        return result
+    finally:
+        del _fetches_in_flight[target]
+
+
 __imagebackend_opts = [
     cfg.StrOpt('images_type',
                default='default',
@@ -173,22 +205,44 @@ class Image(object):
         Synchronizes on template fetching.
 
         :fetch_func: Function that creates the base image
-                     Should accept `target` argument.
+                     Should accept `target` argument. If it returns
+                     the SHA1 hex digest of the base image, that is
+                     stored for the image cache manager.
         :filename: Name of the file in the image directory
         :size: Size of created image in bytes (optional)
         """
-        @utils.synchronized(filename, external=True, lock_path=self.lock_path)
-        def fetch_func_sync(target, *args, **kwargs):
-            fetch_func(target=target, *args, **kwargs)
-
         base_dir = os.path.join(CONF.instances_path,
                                 CONF.image_cache_subdirectory_name)
         if not os.path.exists(base_dir):
             fileutils.ensure_tree(base_dir)
         base = os.path.join(base_dir, filename)
 
+        @utils.synchronized(filename, external=True, lock_path=self.lock_path)
+        def fetch_func_sync(target, *args, **kwargs):
+            # The base image may have been fetched by another process
+            # sharing the image cache while we waited for the lock.
+            if target == base and os.path.exists(base):
+                return
+            checksum = fetch_func(target=target, *args, **kwargs)
+            index = imagecache.get_index()
+            if index and target == base:
+                index.add_base_image(base)
+            if checksum and CONF.libvirt.checksum_base_images:
+                imagecache.write_stored_info(target, field='sha1',
+                                             value=checksum)
+
+        def fetch_func_once(target, *args, **kwargs):
+            # Images generated in place aren't shared between callers.
+            if target != base:
+                return fetch_func_sync(target=target, *args, **kwargs)
+            # Callers sharing the download may boot flavors of different
+            # sizes, so each one checks its own size once it is done.
+            max_size = kwargs.pop('max_size', None)
+            _fetch_once(target, fetch_func_sync, *args, **kwargs)
+            self.verify_base_size(base, max_size)
+
         if not self.check_image_exists() or not os.path.exists(base):
-            self.create_image(fetch_func_sync, base, size,
+            self.create_image(fetch_func_once, base, size,
                               *args, **kwargs)
 
         if (size and self.preallocate and self._can_fallocate() and
@@ -411,6 +465,9 @@ class Qcow2(Image):
         if not os.path.exists(self.path):
             with fileutils.remove_path_on_error(self.path):
                 copy_qcow2_image(base, self.path, size)
+            index = imagecache.get_index()
+            if index:
+                index.add_backing_file(self.path, base)
 
     def snapshot_extract(self, target, out_format):
         libvirt_utils.extract_snapshot(self.path, 'qcow2',
@@ -24,6 +24,7 @@ import hashlib
 import json
 import os
 import re
+import sqlite3
 import time
 
 from oslo.config import cfg
@@ -33,6 +34,7 @@ from nova.openstack.common.gettextutils import _
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import processutils
+from nova import paths
 from nova import utils
 from nova.virt import imagecache
 from nova.virt.libvirt import utils as virtutils
@@ -66,6 +68,21 @@ imagecache_opts = [
                default=3600,
                help='How frequently to checksum base images',
                deprecated_group='DEFAULT'),
+    cfg.BoolOpt('image_cache_index',
+                default=False,
+                help='Keep track of base images, the disks backed by them '
+                     'and their checksums in an index instead of scanning '
+                     'the image cache and every instance disk on each pass '
+                     'of the image cache manager'),
+    cfg.StrOpt('image_cache_index_path',
+               default=paths.state_path_def('image_cache_index.sqlite'),
+               help='Where the image cache index of this host is stored'),
+    cfg.IntOpt('image_cache_index_full_scan_interval',
+               default=24 * 3600,
+               help='Number of seconds between the passes of the image cache '
+                    'manager which rebuild the index from a full scan. The '
+                    'first pass after startup always does one. Unused base '
+                    'images are only removed by these passes'),
     ]
 
 CONF = cfg.CONF
@@ -211,7 +228,13 @@ def write_stored_info(target, field=None, value=None):
         with open(info_file, 'w') as f:
             f.write(json.dumps(d))
 
-    write_file(info_file, field, value)
+        return d['%s-timestamp' % field]
+
+    timestamp = write_file(info_file, field, value)
+
+    index = get_index()
+    if index and field == 'sha1':
+        index.set_checksum(target, value, timestamp)
 
 
 def _hash_file(filename):
@@ -236,10 +259,131 @@ def write_stored_checksum(target):
     write_stored_info(target, field='sha1', value=_hash_file(target))
 
 
+class ImageCacheIndex(object):
+    """Persistent record of the image cache of this host.
+
+    Lists the base images, the instance disks backed by them, their
+    checksums and when they were last used, so the image cache manager
+    does not need to scan _base and run qemu-img on every instance disk.
+    The index is kept up to date as base images and disks are created and
+    deleted, and rebuilt from a full scan from time to time.
+    """
+
+    _schema = '''
+        CREATE TABLE IF NOT EXISTS base_images (
+            path TEXT PRIMARY KEY,
+            sha1 TEXT,
+            sha1_timestamp REAL,
+            last_used REAL);
+        CREATE TABLE IF NOT EXISTS backing_files (
+            disk_path TEXT PRIMARY KEY,
+            instance TEXT NOT NULL,
+            base_path TEXT NOT NULL);
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        fileutils.ensure_tree(os.path.dirname(path))
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(self._schema)
+
+    def _add_base_image(self, base_path, last_used):
+        self._conn.execute('INSERT OR IGNORE INTO base_images (path) '
+                           'VALUES (?)', (base_path,))
+        self._conn.execute('UPDATE base_images SET last_used = ? '
+                           'WHERE path = ?', (last_used, base_path))
+
+    def _add_backing_file(self, disk_path, base_path):
+        instance = os.path.basename(os.path.dirname(disk_path))
+        self._conn.execute('INSERT OR REPLACE INTO backing_files '
+                           '(disk_path, instance, base_path) '
+                           'VALUES (?, ?, ?)',
+                           (disk_path, instance, base_path))
+
+    def add_base_image(self, base_path):
+        """Record a base image, used now."""
+        with self._conn:
+            self._add_base_image(base_path, time.time())
+
+    def remove_base_image(self, base_path):
+        with self._conn:
+            self._conn.execute('DELETE FROM base_images WHERE path = ?',
+                               (base_path,))
+
+    def get_base_images(self):
+        return [row[0] for row in
+                self._conn.execute('SELECT path FROM base_images')]
+
+    def set_checksum(self, base_path, checksum, timestamp):
+        with self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO base_images (path) '
+                               'VALUES (?)', (base_path,))
+            self._conn.execute('UPDATE base_images SET sha1 = ?, '
+                               'sha1_timestamp = ? WHERE path = ?',
+                               (checksum, timestamp, base_path))
+
+    def get_checksum(self, base_path):
+        """Return the checksum of a base image and when it was computed."""
+        row = self._conn.execute('SELECT sha1, sha1_timestamp '
+                                 'FROM base_images WHERE path = ?',
+                                 (base_path,)).fetchone()
+        return tuple(row) if row else (None, None)
+
+    def add_backing_file(self, disk_path, base_path):
+        """Record that an instance disk is backed by a base image."""
+        with self._conn:
+            self._add_backing_file(disk_path, base_path)
+
+    def remove_instance(self, instance_path):
+        """Forget the disks of a deleted instance directory."""
+        with self._conn:
+            self._conn.execute('DELETE FROM backing_files '
+                               'WHERE instance = ?',
+                               (os.path.basename(instance_path),))
+
+    def get_backing_files(self):
+        """Return (instance, disk_path, base_path) for every disk."""
+        return [tuple(row) for row in
+                self._conn.execute('SELECT instance, disk_path, base_path '
+                                   'FROM backing_files')]
+
+    def rebuild(self, base_images, backing_files):
+        """Replace the content of the index with the result of a scan.
+
+        :param base_images: dict of base image path to last use time
+        :param backing_files: dict of instance disk path to base image path
+
+        Checksums of the base images which are still present are kept.
+        """
+        with self._conn:
+            for base_path in set(self.get_base_images()) - set(base_images):
+                self._conn.execute('DELETE FROM base_images WHERE path = ?',
+                                   (base_path,))
+            for base_path, last_used in base_images.iteritems():
+                self._add_base_image(base_path, last_used)
+            self._conn.execute('DELETE FROM backing_files')
+            for disk_path, base_path in backing_files.iteritems():
+                self._add_backing_file(disk_path, base_path)
+
+
+_index = None
+
+
+def get_index():
+    """Return the image cache index of this host, or None if disabled."""
+    global _index
+    if not CONF.libvirt.image_cache_index:
+        return None
+    if _index is None or _index.path != CONF.libvirt.image_cache_index_path:
+        _index = ImageCacheIndex(CONF.libvirt.image_cache_index_path)
+    return _index
+
+
 class ImageCacheManager(imagecache.ImageCacheManager):
     def __init__(self):
         super(ImageCacheManager, self).__init__()
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        self.last_full_scan = None
         self._reset_state()
 
     def _reset_state(self):
@@ -255,6 +399,11 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         self.removable_base_files = []
         self.unexplained_images = []
 
+        # Set when the pass reads the image cache index instead of
+        # scanning, otherwise the scan results are kept to rebuild it.
+        self.index = None
+        self.backing_files = {}
+
     def _store_image(self, base_dir, ent, original=False):
         """Store a base image for later examination."""
         entpath = os.path.join(base_dir, ent)
@@ -271,21 +420,37 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         to be disk images.
         """
 
-        digest_size = hashlib.sha1().digestsize * 2
         for ent in os.listdir(base_dir):
-            if len(ent) == digest_size:
-                self._store_image(base_dir, ent, original=True)
+            self._store_base_image(base_dir, ent)
+
+        return {'unexplained_images': self.unexplained_images,
+                'originals': self.originals}
+
+    def _store_base_image(self, base_dir, ent):
+        """Store ent if its name is the one of an image from _base."""
+        digest_size = hashlib.sha1().digestsize * 2
+        if len(ent) == digest_size:
+            self._store_image(base_dir, ent, original=True)
 
-            elif (len(ent) > digest_size + 2 and
-                  ent[digest_size] == '_' and
-                  not is_valid_info_file(os.path.join(base_dir, ent))):
-                self._store_image(base_dir, ent, original=False)
+        elif (len(ent) > digest_size + 2 and
+              ent[digest_size] == '_' and
+              not is_valid_info_file(os.path.join(base_dir, ent))):
+            self._store_image(base_dir, ent, original=False)
+
+    def _list_indexed_base_images(self, base_dir):
+        """Return a list of the images of _base recorded in the index."""
+        for base_path in self.index.get_base_images():
+            if os.path.dirname(base_path) == base_dir:
+                self._store_base_image(base_dir, os.path.basename(base_path))
 
         return {'unexplained_images': self.unexplained_images,
                 'originals': self.originals}
 
     def _list_backing_images(self):
         """List the backing images currently in use."""
+        if self.index is not None:
+            return self._list_indexed_backing_images()
+
         inuse_images = []
         for ent in os.listdir(CONF.instances_path):
             if ent in self.instance_names:
@@ -314,19 +479,34 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                             CONF.instances_path,
                             CONF.image_cache_subdirectory_name,
                             backing_file)
-                        if backing_path not in inuse_images:
-                            inuse_images.append(backing_path)
-
-                        if backing_path in self.unexplained_images:
-                            LOG.warning(_('Instance %(instance)s is using a '
-                                          'backing file %(backing)s which '
-                                          'does not appear in the image '
-                                          'service'),
-                                        {'instance': ent,
-                                         'backing': backing_file})
-                            self.unexplained_images.remove(backing_path)
+                        self.backing_files[disk_path] = backing_path
+                        self._mark_backing_image(ent, backing_path,
+                                                 inuse_images)
+        return inuse_images
+
+    def _list_indexed_backing_images(self):
+        """List the backing images in use according to the index."""
+        inuse_images = []
+        for instance, disk_path, backing_path in (
+                self.index.get_backing_files()):
+            if instance in self.instance_names:
+                self._mark_backing_image(instance, backing_path,
+                                         inuse_images)
         return inuse_images
 
+    def _mark_backing_image(self, instance, backing_path, inuse_images):
+        if backing_path not in inuse_images:
+            inuse_images.append(backing_path)
+
+        if backing_path in self.unexplained_images:
+            LOG.warning(_('Instance %(instance)s is using a '
+                          'backing file %(backing)s which '
+                          'does not appear in the image '
+                          'service'),
+                        {'instance': instance,
+                         'backing': os.path.basename(backing_path)})
+            self.unexplained_images.remove(backing_path)
+
     def _find_base_file(self, base_dir, fingerprint):
         """Find the base file matching this fingerprint.
 
@@ -369,6 +549,16 @@ class ImageCacheManager(imagecache.ImageCacheManager):
 
         # Protect against other nova-computes performing checksums at the same
         # time if we are using shared storage
+        # NOTE: The index holds the last checksum written by this host,
+        # a recent one spares reading the info file under its lock.
+        if self.index is not None:
+            (stored_checksum, stored_timestamp) = self.index.get_checksum(
+                base_file)
+            if (stored_checksum and stored_timestamp and
+                time.time() - stored_timestamp <
+                    CONF.libvirt.checksum_interval_seconds):
+                return True
+
         @utils.synchronized(lock_name, external=True, lock_path=self.lock_path)
         def inner_verify_checksum():
             (stored_checksum, stored_timestamp) = read_stored_checksum(
@@ -407,8 +597,9 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                           'base_file': base_file})
 
                 # NOTE(mikal): If the checksum file is missing, then we should
-                # create one. We don't create checksums when we download images
-                # from glance because that would delay VM startup.
+                # create one. Images stored as downloaded from glance get
+                # theirs when fetched, this covers the others as re-reading
+                # them would delay VM startup.
                 if CONF.libvirt.checksum_base_images and create_if_missing:
                     LOG.info(_('%(id)s (%(base_file)s): generating checksum'),
                              {'id': img_id,
@@ -443,6 +634,9 @@ class ImageCacheManager(imagecache.ImageCacheManager):
             LOG.info(_('Removing base file: %s'), base_file)
             try:
                 os.remove(base_file)
+                index = get_index()
+                if index:
+                    index.remove_base_image(base_file)
                 signature = get_info_filename(base_file)
                 if os.path.exists(signature):
                     os.remove(signature)
@@ -520,6 +714,8 @@ class ImageCacheManager(imagecache.ImageCacheManager):
                 if os.path.exists(base_file):
                     virtutils.chown(base_file, os.getuid())
                     os.utime(base_file, None)
+                    if self.index is not None:
+                        self.index.add_base_image(base_file)
 
     def _age_and_verify_cached_images(self, context, all_instances, base_dir):
         LOG.debug(_('Verify base images'))
@@ -559,7 +755,14 @@ class ImageCacheManager(imagecache.ImageCacheManager):
             LOG.info(_('Removable base files: %s'),
                      ' '.join(self.removable_base_files))
 
-            if self.remove_unused_base_images:
+            if self.remove_unused_base_images and self.index is not None:
+                # NOTE: The index only knows the disks created by this host.
+                # Other hosts sharing _base may have backed disks by these
+                # images since the last full scan, so only passes which
+                # read the backing file of every disk remove base images.
+                LOG.info(_('Removal of base files deferred to the next '
+                           'full scan of the image cache'))
+            elif self.remove_unused_base_images:
                 for base_file in self.removable_base_files:
                     self._remove_base_file(base_file)
 
@@ -586,14 +789,39 @@ class ImageCacheManager(imagecache.ImageCacheManager):
             return
         return base_dir
 
+    def _full_scan_due(self):
+        if self.last_full_scan is None:
+            return True
+        return (time.time() - self.last_full_scan >=
+                CONF.libvirt.image_cache_index_full_scan_interval)
+
+    def _rebuild_index(self, index, base_images):
+        """Replace the content of the index with what this pass found."""
+        last_used = {}
+        for base_path in base_images:
+            try:
+                last_used[base_path] = os.path.getmtime(base_path)
+            except OSError:
+                # Removed during this pass
+                pass
+        index.rebuild(last_used, self.backing_files)
+        self.last_full_scan = time.time()
+
     def update(self, context, all_instances):
         base_dir = self._get_base()
         if not base_dir:
             return
         # reset the local statistics
         self._reset_state()
+        index = get_index()
+        full_scan = index is None or self._full_scan_due()
         # read the cached images
-        self._list_base_images(base_dir)
+        if full_scan:
+            self._list_base_images(base_dir)
+            base_images = list(self.unexplained_images)
+        else:
+            self.index = index
+            self._list_indexed_base_images(base_dir)
         # read running instances data
         running = self._list_running_instances(context, all_instances)
         self.used_images = running['used_images']
@@ -601,3 +829,5 @@ class ImageCacheManager(imagecache.ImageCacheManager):
         self.instance_names = running['instance_names']
         # perform the aging and image verification
         self._age_and_verify_cached_images(context, all_instances, base_dir)
+        if index and full_scan:
+            self._rebuild_index(index, base_images)
@@ -648,9 +648,13 @@ def get_fs_info(path):
 
 
 def fetch_image(context, target, image_id, user_id, project_id, max_size=0):
-    """Grab image."""
-    images.fetch_to_raw(context, image_id, target, user_id, project_id,
-                        max_size=max_size)
+    """Grab image.
+
+    Returns the SHA1 hex digest of target when it was computed while
+    downloading, None otherwise.
+    """
+    return images.fetch_to_raw(context, image_id, target, user_id,
+                               project_id, max_size=max_size)
 
 
 def get_instance_path(instance, forceold=False, relative=False):
@@ -18,6 +18,8 @@ Pluggable Weighing support
 """
 
 import abc
+import heapq
+import time
 
 import six
 
@@ -122,14 +124,24 @@ class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
     def get_weighed_objects(self, weigher_classes, obj_list,
-            weighing_properties):
-        """Return a sorted (descending), normalized list of WeighedObjects."""
+            weighing_properties, limit=None, trace=None):
+        """Return a sorted (descending), normalized list of WeighedObjects.
+
+        If limit is set, only the best limit WeighedObjects are returned.
+        They are picked with a partial selection rather than by sorting the
+        whole list.
+
+        trace is an optional object whose add_step() method is called
+        with the wall time and object count of every weigher run.
+        """
 
         if not obj_list:
             return []
 
         weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
         for weigher_cls in weigher_classes:
+            if trace is not None:
+                start = time.time()
             weigher = weigher_cls()
             weights = weigher.weigh_objects(weighed_objs, weighing_properties)
 
@@ -142,4 +154,11 @@ class BaseWeightHandler(loadables.BaseLoader):
                 obj = weighed_objs[i]
                 obj.weight += weigher.weight_multiplier() * weight
 
+            if trace is not None:
+                trace.add_step('weigher', weigher_cls.__name__,
+                               time.time() - start, len(weighed_objs),
+                               len(weighed_objs))
+
+        if limit is not None:
+            return heapq.nlargest(limit, weighed_objs, key=lambda x: x.weight)
         return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# Copyright 2014 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Microbenchmarks of the NovaObject implementation.
+
+For a few object types, this times building objects from database rows,
+serializing them to primitives and back, and reading every field, and
+reports the time per object of each step.
+
+Run like:
+
+    ./tools/object_benchmark.py --count 1000 --repeat 5
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+os.environ.setdefault('EVENTLET_NO_GREENDNS', 'yes')
+
+from nova.objects import instance
+from nova.objects import instance_info_cache
+from nova.objects import security_group
+from nova.tests import fake_instance
+from nova.tests.objects import test_instance_info_cache
+from nova.tests.objects import test_security_group
+
+
+def _instance(db_obj):
+    return instance.Instance._from_db_object(
+        None, instance.Instance(), db_obj,
+        expected_attrs=['info_cache', 'security_groups'])
+
+
+def _info_cache(db_obj):
+    return instance_info_cache.InstanceInfoCache._from_db_object(
+        None, instance_info_cache.InstanceInfoCache(), db_obj)
+
+
+def _security_group(db_obj):
+    return security_group.SecurityGroup._from_db_object(
+        None, security_group.SecurityGroup(), db_obj)
+
+
+def _instance_row(i):
+    db_obj = fake_instance.fake_db_instance(
+        id=i, security_groups=['default'],
+        info_cache=dict(test_instance_info_cache.fake_info_cache))
+    db_obj['info_cache']['instance_uuid'] = db_obj['uuid']
+    return db_obj
+
+
+def _info_cache_row(i):
+    return dict(test_instance_info_cache.fake_info_cache,
+                instance_uuid='fake-uuid-%i' % i)
+
+
+def _security_group_row(i):
+    return dict(test_security_group.fake_secgroup, id=i, deleted=False)
+
+
+# (object type, function making a database row, function making the object)
+BENCHMARKS = [
+    ('Instance', _instance_row, _instance),
+    ('InstanceInfoCache', _info_cache_row, _info_cache),
+    ('SecurityGroup', _security_group_row, _security_group),
+]
+
+
+def _read_fields(objs):
+    for obj in objs:
+        for name in obj.fields:
+            if obj.obj_attr_is_set(name):
+                getattr(obj, name)
+
+
+def run_benchmark(name, make_row, make_obj, count, repeat):
+    rows = [make_row(i) for i in range(count)]
+    objs = [make_obj(row) for row in rows]
+    primitives = [obj.obj_to_primitive() for obj in objs]
+    cls = objs[0].__class__
+
+    steps = [
+        ('construct', lambda: [make_obj(row) for row in rows]),
+        ('serialize', lambda: [obj.obj_to_primitive() for obj in objs]),
+        ('deserialize', lambda: [cls.obj_from_primitive(primitive)
+                                 for primitive in primitives]),
+        ('access', lambda: _read_fields(objs)),
+    ]
+    results = []
+    for step, fn in steps:
+        best = min(timeit.repeat(fn, number=1, repeat=repeat))
+        results.append((step, best / count * 10 ** 6))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time NovaObject operations per object type')
+    parser.add_argument('--count', type=int, default=1000,
+                        help='Number of objects handled in each run')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of runs, the fastest one is reported')
+    parser.add_argument('types', nargs='*',
+                        help='Object types to time, all if none is given')
+    args = parser.parse_args()
+
+    print('%-20s %-12s %12s' % ('type', 'step', 'usec/object'))
+    for name, make_row, make_obj in BENCHMARKS:
+        if args.types and name not in args.types:
+            continue
+        for step, usec in run_benchmark(name, make_row, make_obj,
+                                        args.count, args.repeat):
+            print('%-20s %-12s %12.2f' % (name, step, usec))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())